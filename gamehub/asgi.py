@@ -13,4 +13,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gamehub.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Імпорт після get_asgi_application(), коли застосунки вже завантажені
+from games.websocket import chat_websocket  # noqa: E402
+
+
+# HTTP-запити теж ідуть через ASGI: async view (stripe_checkout) не тримають
+# воркер, поки чекають на зовнішні сервіси. Запуск:
+#   gunicorn gamehub.asgi:application -k uvicorn_worker.UvicornWorker
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        await chat_websocket(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
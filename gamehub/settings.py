@@ -45,11 +45,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    # WhiteNoise з async-гілкою - див. games.static
+    "games.static.WhiteNoiseMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'games.presence.PresenceMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -67,6 +69,8 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'games.context_processors.cart_counter',
+                'games.context_processors.unread_messages',
+                'games.context_processors.owned_games',
             ],
         },
     },
@@ -138,14 +142,68 @@ STORAGES = {
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+# Хто передає медіафайли: '' - сам Django (games.media.serve_media),
+# 'x-accel-redirect' - nginx (internal location GAMES_MEDIA_ACCEL_PREFIX -> MEDIA_ROOT),
+# 'x-sendfile' - Apache mod_xsendfile / lighttpd
+GAMES_MEDIA_SENDFILE = os.environ.get('GAMES_MEDIA_SENDFILE', '')
+GAMES_MEDIA_ACCEL_PREFIX = '/protected-media/'
 
 
 STRIPE_PUBLIC_KEY = 'pk_test_51Ss9ju2IjldB7av8VCgCNU78a7EudJhcEzGd27y29o1Bcq20aTxySkk8i6H5SLk77TcFmi6lwwjOscPqLZmBA1Co00Ufu5y2Ol'
 STRIPE_SECRET_KEY = 'sk_test_51Ss9ju2IjldB7av8KQPDdH4IaKKmUmUO6gscUv388Fby2bwapUXVoriqarFe3l25gsV3JISUIlqtcopGcDOHwWhy00lKXJ346q'
+# Секрет підпису вебхука (stripe listen / Dashboard -> Webhooks) для /stripe/webhook/
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', '')
 
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'game_list'
 
+# Пошук по каталогу: None - за типом БД (FTS5 для SQLite, для інших - games.search.DatabaseSearchBackend)
+GAMES_SEARCH_BACKEND = None
+
+# Доставка повідомлень чату через WebSocket. InProcessChatBroker - лише для одного процесу,
+# для кількох воркерів: 'games.realtime.RedisChatBroker' + GAMES_CHAT_BROKER_URL
+GAMES_CHAT_BROKER = 'games.realtime.InProcessChatBroker'
+GAMES_CHAT_BROKER_URL = os.environ.get('GAMES_CHAT_BROKER_URL', 'redis://localhost:6379/0')
+
+# Присутність: InMemoryPresenceStore - в межах процесу, для кількох воркерів -
+# 'games.presence.CachePresenceStore' поверх спільного кешу GAMES_PRESENCE_CACHE
+GAMES_PRESENCE_STORE = 'games.presence.InMemoryPresenceStore'
+GAMES_PRESENCE_CACHE = 'default'
+
+# Кеш. Без GAMES_REDIS_URL - LocMemCache (за замовчуванням Django): окремий у кожному процесі,
+# годиться лише для одного процесу (runserver, один воркер gunicorn). Кілька воркерів і run_tasks
+# потребують спільного кешу - інвалідації (куплені ігри, кошик, сторінка гри) мають доходити до всіх.
+# RedisCache потребує пакет redis
+GAMES_REDIS_URL = os.environ.get('GAMES_REDIS_URL', '')
+if GAMES_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': GAMES_REDIS_URL,
+        },
+    }
+
+# Спільний рівень кешу сторінки гри (локальний LRU - в кожному процесі окремо)
+GAMES_DETAIL_CACHE = 'default'
+
+# Сесії: читання з кешу (SESSION_CACHE_ALIAS), незмінені сесії не пишуться (games.sessions).
+# Для кількох процесів кеш має бути спільним
+SESSION_ENGINE = 'games.sessions'
+# Зміни сесій - лише в кеш, у django_session їх раз на стільки секунд пише run_tasks
+# (втрата при збої кешу - не більше 2x інтервалу). 0 - одразу в БД; потрібен спільний кеш
+GAMES_SESSION_WRITE_BEHIND = 30 if GAMES_REDIS_URL else 0
+
+# Фонові задачі (games.tasks) виконує окремий воркер: python manage.py run_tasks --processes 2 --threads 4.
+# Воркер скидає кеші веб-процесів, тож працює лише зі спільним кешем. Без нього (True) задачі
+# виконує пул потоків самого веб-процесу після коміту - запит на них не чекає
+GAMES_TASKS_EAGER = not GAMES_REDIS_URL
+# Виконувати задачі прямо в потоці запиту (on_commit) - лише для тестів
+GAMES_TASKS_EAGER_INLINE = False
+
+# Листи (квитанції про покупку); у розробці - в консоль
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = 'GameHub <noreply@gamehub.local>'
+
 
 
 
@@ -17,19 +17,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
-from django.views.static import serve
+from games.media import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('games.urls')),
+    # Хешовані URL, Range, умовні запити і X-Sendfile/X-Accel-Redirect - див. games.media
+    re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), serve_media, name='media'),
 ]
-if not settings.DEBUG:
-    urlpatterns += [
-            re_path(r'^media/(?P<path>.*)$', serve, {
-            'document_root': settings.MEDIA_ROOT
-        })
-    ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Game, GameScreenshot
+from .models import Game, GameScreenshot, Task
 # Register your models here.
 # admin.site.register(Game)
 
@@ -14,3 +14,10 @@ class GameAdmin(admin.ModelAdmin):
 
 
 admin.site.register(GameScreenshot)
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ["name", "status", "attempts", "run_at", "finished_at"]
+    list_filter = ["status", "name"]
+    search_fields = ["key"]
@@ -0,0 +1,224 @@
+"""
+Read-through кеш з двома рівнями:
+  1. локальний LRU у пам'яті процесу - без мережі, але живе лише LOCAL_TTL,
+     бо інвалідація з інших процесів до нього не доходить;
+  2. спільний кеш Django (GAMES_DETAIL_CACHE) - для всіх воркерів.
+
+На промаху значення рахує лише один потік процесу (локальний lock) і, наскільки
+можливо, один процес (lock-ключ через cache.add) - решта чекають готового значення.
+
+catalog_version() - штамп версії каталогу, змінюється при кожній зміні Game;
+від нього залежать ключі фрагментів списку ігор і ETag/Last-Modified. Зберігається
+в БД (CatalogVersion), а не в кеші, - зміни з інших процесів теж його змінюють.
+Game.save()/delete() змінюють версію сигналами, Game.objects.update()/bulk_create() -
+через GameQuerySet; raw SQL повз ORM має викликати bump_catalog_version() сам.
+"""
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+from .models import CatalogVersion, Game, Review
+
+LOCAL_SIZE = 256
+LOCAL_TTL = 5
+SHARED_TTL = 300
+# Як часто (с) процес перечитує версію каталогу з БД
+CATALOG_VERSION_POLL = 1
+# Скільки чекати, поки інший процес порахує значення, перш ніж рахувати самому
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 2
+LOCK_POLL_INTERVAL = 0.05
+# Відгуків на сторінці гри
+REVIEWS_PAGE_SIZE = 10
+
+
+class LocalLRU:
+
+    def __init__(self, maxsize=LOCAL_SIZE, ttl=LOCAL_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class ReadThroughCache:
+
+    def __init__(self, name, loader, local_size=LOCAL_SIZE, local_ttl=LOCAL_TTL, shared_ttl=SHARED_TTL):
+        self.name = name
+        self.loader = loader
+        self.shared_ttl = shared_ttl
+        self.local = LocalLRU(local_size, local_ttl)
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        # Лічильник інвалідацій на весь кеш (не на ключ - не росте з кількістю ключів)
+        self._generation = 0
+        self._stats_lock = threading.Lock()
+        self._stats = dict.fromkeys(('local_hits', 'shared_hits', 'misses', 'loads'), 0)
+
+    @property
+    def shared(self):
+        return _shared_cache()
+
+    def _shared_key(self, key):
+        return f"games:{self.name}:{key}"
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def _key_lock(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            self._count('local_hits')
+            return value
+
+        value = self.shared.get(self._shared_key(key))
+        if value is not None:
+            self._count('shared_hits')
+            self.local.set(key, value)
+            return value
+
+        self._count('misses')
+        with self._key_lock(key):
+            # Поки чекали на lock, значення міг порахувати інший потік
+            value = self.local.get(key)
+            if value is None:
+                value = self._load(key)
+        with self._locks_lock:
+            self._locks.pop(key, None)
+        return value
+
+    def _load(self, key):
+        shared_key = self._shared_key(key)
+        lock_key = f"{shared_key}:lock"
+        if not self.shared.add(lock_key, 1, LOCK_TIMEOUT):
+            # Значення вже рахує інший процес - чекаємо, але не довше LOCK_WAIT
+            deadline = time.monotonic() + LOCK_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(LOCK_POLL_INTERVAL)
+                value = self.shared.get(shared_key)
+                if value is not None:
+                    self.local.set(key, value)
+                    return value
+            lock_key = None
+
+        try:
+            generation = self._generation
+            self._count('loads')
+            value = self.loader(key)
+            # Якщо під час завантаження прийшла інвалідація - значення могло застаріти
+            # (будь-якого ключа: зайвий промах дешевший за застаріле значення на SHARED_TTL)
+            if value is not None and self._generation == generation:
+                self.shared.set(shared_key, value, self.shared_ttl)
+                self.local.set(key, value)
+            return value
+        finally:
+            if lock_key is not None:
+                self.shared.delete(lock_key)
+
+    def invalidate(self, key):
+        with self._stats_lock:
+            self._generation += 1
+        self.local.delete(key)
+        self.shared.delete(self._shared_key(key))
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = round((lookups - stats['misses']) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+def load_game_detail(game_id):
+    game = Game.objects.filter(id=game_id).first()
+    if game is None:
+        return None
+    # Кількість, середня і гістограма - в агрегатах Game; тут лише перша сторінка відгуків
+    return {
+        'game': game,
+        'screenshots': list(game.screenshots.all()),
+        'reviews': list(Review.objects.filter(game_id=game_id).order_by('-id')[:REVIEWS_PAGE_SIZE]),
+    }
+
+
+game_detail_cache = ReadThroughCache('game_detail', load_game_detail)
+
+
+def _shared_cache():
+    return caches[getattr(settings, 'GAMES_DETAIL_CACHE', 'default')]
+
+
+def is_shared_cache(alias='default'):
+    """Чи бачать записи в кеш інші процеси: LocMemCache живе в пам'яті одного процесу."""
+    return not isinstance(caches[alias], LocMemCache)
+
+
+# (момент, до якого значення свіже, версія) - щоб не читати БД кілька разів за запит
+_catalog_version = (0.0, None)
+
+
+def catalog_version():
+    """Штамп версії каталогу: час останньої зміни Game у наносекундах."""
+    global _catalog_version
+    expires, version = _catalog_version
+    if version is None or expires < time.monotonic():
+        version = CatalogVersion.current()
+        _catalog_version = (time.monotonic() + CATALOG_VERSION_POLL, version)
+    return version
+
+
+def _forget_catalog_version():
+    global _catalog_version
+    _catalog_version = (0.0, None)
+
+
+def bump_catalog_version():
+    CatalogVersion.bump()
+    _forget_catalog_version()
+    # І після коміту: інший потік міг прочитати версію, поки транзакція ще не закомічена
+    transaction.on_commit(_forget_catalog_version)
+
+
+def catalog_last_modified(version):
+    return datetime.datetime.fromtimestamp(version / 1e9, tz=datetime.timezone.utc)
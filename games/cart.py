@@ -0,0 +1,137 @@
+"""
+Кошик: для авторизованих - Cart/CartItem у БД, для анонімних - компактний список id у сесії.
+get_cart(request) повертає потрібну реалізацію з однаковим інтерфейсом.
+Після входу сесійний кошик переноситься в БД (merge_session_cart, сигнал user_logged_in).
+"""
+from django.core.cache import cache
+from django.db.models import Count, Sum
+
+from .models import Cart, CartItem, Game
+from .ownership import owned_game_ids
+from .sessions import SessionIds
+
+SESSION_KEY = 'cart'
+# Лічильник для навбару кешується, скидається при кожній зміні кошика
+CART_COUNT_TTL = 60 * 60
+
+
+def cart_count_key(user_id):
+    return f"games:cart_count:{user_id}"
+
+
+class BaseCart:
+
+    def game_ids(self):
+        raise NotImplementedError
+
+    def add(self, game_id):
+        raise NotImplementedError
+
+    def remove(self, game_id):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    def games(self):
+        raise NotImplementedError
+
+    def summary(self, exclude_ids=()):
+        """{'count': ..., 'total': ...} одним агрегатним запитом. exclude_ids - напр. вже куплені."""
+        summary = self.games().exclude(id__in=exclude_ids).order_by().aggregate(count=Count('id'), total=Sum('final_price'))
+        summary['total'] = summary['total'] or 0
+        return summary
+
+
+class SessionCart(BaseCart):
+
+    def __init__(self, session):
+        # Сесія змінюється (і пишеться) лише якщо змінився набір id
+        self.items = SessionIds(session, SESSION_KEY)
+
+    def game_ids(self):
+        return self.items.ids()
+
+    def add(self, game_id):
+        self.items.add(game_id)
+
+    def remove(self, game_id):
+        self.items.remove(game_id)
+
+    def clear(self):
+        self.items.clear()
+
+    def count(self):
+        return len(self.items)
+
+    def games(self):
+        return Game.objects.filter(id__in=self.game_ids())
+
+
+class DatabaseCart(BaseCart):
+
+    def __init__(self, user):
+        self.user = user
+
+    def _cart(self):
+        return Cart.objects.get_or_create(user=self.user)[0]
+
+    def _items(self):
+        return CartItem.objects.filter(cart__user=self.user)
+
+    def _changed(self):
+        cache.delete(cart_count_key(self.user.pk))
+
+    def game_ids(self):
+        return list(self._items().values_list('game_id', flat=True))
+
+    def add(self, game_id):
+        self.add_many([game_id])
+
+    def add_many(self, game_ids):
+        cart = self._cart()
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, game_id=game_id) for game_id in game_ids],
+            ignore_conflicts=True,
+        )
+        self._changed()
+
+    def remove(self, game_id):
+        self._items().filter(game_id=game_id).delete()
+        self._changed()
+
+    def clear(self):
+        self._items().delete()
+        self._changed()
+
+    def count(self):
+        key = cart_count_key(self.user.pk)
+        count = cache.get(key)
+        if count is None:
+            count = self._items().count()
+            cache.set(key, count, CART_COUNT_TTL)
+        return count
+
+    def games(self):
+        return Game.objects.filter(cartitem__cart__user=self.user)
+
+
+def get_cart(request):
+    if request.user.is_authenticated:
+        return DatabaseCart(request.user)
+    return SessionCart(request.session)
+
+
+def merge_session_cart(request, user):
+    """Переносить анонімний кошик із сесії в кошик користувача."""
+    session_cart = SessionCart(request.session)
+    game_ids = session_cart.game_ids()
+    if not game_ids:
+        return
+    owned = owned_game_ids(user.pk)
+    existing = Game.objects.filter(id__in=game_ids).values_list('id', flat=True)
+    DatabaseCart(user).add_many([game_id for game_id in existing if game_id not in owned])
+    session_cart.clear()
@@ -1,5 +1,28 @@
+from django.utils.functional import SimpleLazyObject
+
+from .cart import get_cart
+from .models import Conversation
+from .ownership import request_owned_game_ids
+
+
 def cart_counter(request):
-    cart = request.session.get("cart", {})
+    # Для авторизованих - з кешу лічильника, без читання кошика з сесії чи БД
     return {
-        'cart_counter': len(cart)
-    }
\ No newline at end of file
+        'cart_counter': get_cart(request).count()
+    }
+
+
+def unread_messages(request):
+    # Сума денормалізованих лічильників - один запит незалежно від кількості розмов
+    if not request.user.is_authenticated:
+        return {'unread_messages': 0}
+    return {
+        'unread_messages': Conversation.objects.unread_total(request.user)
+    }
+
+
+def owned_games(request):
+    # Ліниво: набір читається лише на сторінках, які перевіряють "вже куплено"
+    return {
+        'owned_game_ids': SimpleLazyObject(lambda: request_owned_game_ids(request))
+    }
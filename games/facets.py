@@ -0,0 +1,138 @@
+"""
+Фасети каталогу: кількість ігор за жанром, роком випуску і ціновим діапазоном.
+
+Кожен фасет рахується з усіма фільтрами запиту, крім власного (щоб у списку
+жанрів було видно, скільки ігор дасть інший жанр). Результат кешується з
+версією каталогу в ключі, тож будь-яка зміна Game чи Genre його скидає.
+"""
+import hashlib
+from decimal import Decimal, InvalidOperation
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .caching import catalog_version
+from .models import Game, Genre
+from .search import search_games
+
+FACETS_TTL = 300
+
+# (ключ, мінімальна ціна, максимальна ціна) по final_price, межі включно
+PRICE_BUCKETS = (
+    ('free', Decimal('0'), Decimal('0')),
+    ('under_200', Decimal('0.01'), Decimal('199.99')),
+    ('200_500', Decimal('200'), Decimal('499.99')),
+    ('500_1000', Decimal('500'), Decimal('999.99')),
+    ('over_1000', Decimal('1000'), None),
+)
+FACET_PARAMS = ('q', 'genre', 'year', 'min_price', 'max_price', 'on_sale')
+
+
+def parse_price(value):
+    try:
+        return Decimal(value) if value else None
+    except InvalidOperation:
+        return None
+
+
+def parse_year(value):
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def genre_ids():
+    """{назва жанру: id} - з кешу, один запит на версію каталогу."""
+    return cache.get_or_set(
+        f"games:genre_ids:{catalog_version()}",
+        lambda: dict(Genre.objects.values_list('name', 'id')),
+        FACETS_TTL,
+    )
+
+
+def apply_filters(games, params, exclude=()):
+    """Жанр, рік і ціна з параметрів запиту. exclude - групи фільтрів, які пропустити."""
+    if 'genre' not in exclude and params.get('genre'):
+        genre_id = genre_ids().get(params['genre'])
+        if genre_id is None:
+            return games.none()
+        games = games.filter(genre_ref_id=genre_id)
+
+    year = parse_year(params.get('year'))
+    if 'year' not in exclude and year is not None:
+        games = games.filter(release_year=year)
+
+    if 'price' not in exclude:
+        # Фільтри по ціні зі знижкою - повністю в SQL по Game.final_price
+        min_price = parse_price(params.get('min_price'))
+        max_price = parse_price(params.get('max_price'))
+        if min_price is not None:
+            games = games.filter(final_price__gte=min_price)
+        if max_price is not None:
+            games = games.filter(final_price__lte=max_price)
+        if params.get('on_sale'):
+            games = games.filter(discount__gt=0)
+    return games
+
+
+def _bucket_filter(low, high):
+    condition = Q(final_price__gte=low)
+    if high is not None:
+        condition &= Q(final_price__lte=high)
+    return condition
+
+
+def compute_facets(params):
+    games = Game.objects.all()
+    if params.get('q'):
+        games = search_games(params['q'], games)
+    games = games.order_by()
+
+    names = {genre_id: name for name, genre_id in genre_ids().items()}
+    genre_rows = (
+        apply_filters(games, params, exclude=('genre',))
+        .filter(genre_ref__isnull=False)
+        .values('genre_ref_id')
+        .annotate(count=Count('id'))
+    )
+    genres = sorted(
+        ({'id': row['genre_ref_id'], 'name': names.get(row['genre_ref_id'], ''), 'count': row['count']}
+         for row in genre_rows),
+        key=lambda item: item['name'],
+    )
+
+    years = [
+        {'year': row['release_year'], 'count': row['count']}
+        for row in apply_filters(games, params, exclude=('year',))
+        .values('release_year')
+        .annotate(count=Count('id'))
+        .order_by('-release_year')
+    ]
+
+    # Усі цінові діапазони - одним запитом через COUNT ... FILTER
+    bucket_counts = apply_filters(games, params, exclude=('price',)).aggregate(**{
+        key: Count('id', filter=_bucket_filter(low, high)) for key, low, high in PRICE_BUCKETS
+    })
+    prices = [
+        {
+            'key': key,
+            'min_price': str(low),
+            'max_price': str(high) if high is not None else None,
+            'count': bucket_counts[key],
+        }
+        for key, low, high in PRICE_BUCKETS
+    ]
+    return {'genres': genres, 'years': years, 'prices': prices}
+
+
+def catalog_facets(params):
+    """Фасети для параметрів запиту (QueryDict або dict) - з кешу, якщо є."""
+    normalized = urlencode(sorted((key, params.get(key)) for key in FACET_PARAMS if params.get(key)))
+    digest = hashlib.md5(normalized.encode()).hexdigest()
+    return cache.get_or_set(
+        f"games:facets:{catalog_version()}:{digest}",
+        lambda: compute_facets(params),
+        FACETS_TTL,
+    )
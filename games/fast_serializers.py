@@ -0,0 +1,90 @@
+"""
+Швидкі read-only серіалізатори для списків.
+
+Замість ModelSerializer (інтроспекція моделі + to_representation для кожного
+поля кожного об'єкта) будують dict прямо з рядків .values(). Вихід збігається
+з GameSerializer / MessageSerializer / ProfileSerializer - див. FastSerializerParityTest.
+"""
+from decimal import Decimal
+
+from rest_framework import serializers
+
+from .images import image_representation
+
+TWO_PLACES = Decimal("0.01")
+
+_datetime_field = serializers.DateTimeField()
+
+
+def _decimal(value):
+    # DecimalField з COERCE_DECIMAL_TO_STRING віддає рядок з 2 знаками
+    return str(value.quantize(TWO_PLACES))
+
+
+def _sell_price(row):
+    # Та сама формула, що й у Game.sell_price
+    if row["discount"] > 0:
+        return (row["price"] * (100 - row["discount"])) / 100
+    return row["price"]
+
+
+class FastSerializer:
+    # ім'я поля -> (колонки для .values(), функція row -> значення)
+    field_map = {}
+
+    def __init__(self, fields=None):
+        names = [f for f in self.field_map if fields is None or f in fields]
+        self.getters = [(name, self.field_map[name][1]) for name in names]
+        columns = []
+        for name in names:
+            for column in self.field_map[name][0]:
+                if column not in columns:
+                    columns.append(column)
+        self.columns = columns
+
+    def values(self, queryset, extra=()):
+        return queryset.values(*self.columns, *[c for c in extra if c not in self.columns])
+
+    def to_representation(self, row):
+        return {name: getter(row) for name, getter in self.getters}
+
+    def serialize(self, queryset):
+        return [self.to_representation(row) for row in self.values(queryset)]
+
+
+class FastGameSerializer(FastSerializer):
+    field_map = {
+        "id": (["id"], lambda row: row["id"]),
+        "title": (["title"], lambda row: row["title"]),
+        "description": (["description"], lambda row: row["description"]),
+        "genre": (["genre"], lambda row: row["genre"]),
+        "release_year": (["release_year"], lambda row: row["release_year"]),
+        "rating": (["rating"], lambda row: row["rating"]),
+        "price": (["price"], lambda row: _decimal(row["price"])),
+        "discount": (["discount"], lambda row: row["discount"]),
+        "sell_price": (["price", "discount"], _sell_price),
+        "review_count": (["review_count"], lambda row: row["review_count"]),
+        "review_average": (["review_average"], lambda row: row["review_average"]),
+        "image": (["image", "image_variants"], lambda row: image_representation(row["image"], row["image_variants"])),
+    }
+
+
+class FastMessageSerializer(FastSerializer):
+    # sender__username через JOIN замість ледачого завантаження FK на кожен рядок
+    field_map = {
+        "id": (["id"], lambda row: row["id"]),
+        "sender": (["sender__username"], lambda row: row["sender__username"]),
+        "receiver": (["receiver__username"], lambda row: row["receiver__username"]),
+        "text": (["text"], lambda row: row["text"]),
+        "timestamp": (["timestamp"], lambda row: _datetime_field.to_representation(row["timestamp"])),
+    }
+
+
+class FastProfileSerializer(FastSerializer):
+    field_map = {
+        "username": (["user__username"], lambda row: row["user__username"]),
+        "nickname": (["nickname"], lambda row: row["nickname"]),
+        "bio": (["bio"], lambda row: row["bio"]),
+        "status": (["status"], lambda row: row["status"]),
+        "avatar": (["avatar", "avatar_variants"], lambda row: image_representation(row["avatar"], row["avatar_variants"])),
+    }
@@ -0,0 +1,155 @@
+"""
+Список бажаного: для авторизованих - Favorite у БД, для анонімних - SessionIds у сесії.
+get_favorites(request) повертає потрібну реалізацію з однаковим інтерфейсом, як get_cart.
+Після входу список із сесії переноситься в БД (merge_session_favorites, сигнал user_logged_in).
+
+Game.favorite_count оновлюється разом зі зміною Favorite - одним UPDATE на пачку ігор,
+тож рейтинг "найбажаніших" - це ORDER BY по індексу, без GROUP BY по всіх користувачах.
+Зміни одного користувача серіалізуються блокуванням його рядка, щоб паралельні
+запити не порахували ту саму гру двічі; розбіжності виправляє recompute_favorite_counts.
+"""
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .models import Favorite, Game
+from .sessions import SessionIds
+
+SESSION_KEY = 'favorites'
+FAVORITES_TTL = 60 * 60
+# Ігор за один запит пакетної зміни
+MAX_BATCH = 500
+MOST_WISHLISTED_TTL = 60
+
+
+def favorites_key(user_id):
+    return f"games:favorites:{user_id}"
+
+
+def favorite_ids(user_id):
+    return cache.get_or_set(
+        favorites_key(user_id),
+        lambda: frozenset(Favorite.objects.filter(user_id=user_id).values_list('game_id', flat=True)),
+        FAVORITES_TTL,
+    )
+
+
+def invalidate_favorites(user_id):
+    cache.delete(favorites_key(user_id))
+    # Повторно після коміту: паралельний запит міг закешувати старий набір
+    transaction.on_commit(lambda: cache.delete(favorites_key(user_id)))
+
+
+def _lock_user(user_id):
+    User.objects.select_for_update().filter(pk=user_id).values_list('pk', flat=True).first()
+
+
+def add_favorites(user_id, game_ids):
+    """Додає ігри до списку. Повертає множину справді доданих id."""
+    with transaction.atomic():
+        _lock_user(user_id)
+        existing = set(Favorite.objects.filter(user_id=user_id, game_id__in=game_ids).values_list('game_id', flat=True))
+        added = set(Game.objects.filter(id__in=set(game_ids) - existing).values_list('id', flat=True))
+        if added:
+            Favorite.objects.bulk_create([Favorite(user_id=user_id, game_id=game_id) for game_id in added])
+            Game.objects.filter(id__in=added).update(favorite_count=F('favorite_count') + 1)
+            invalidate_favorites(user_id)
+    return added
+
+
+def remove_favorites(user_id, game_ids):
+    """Прибирає ігри зі списку. Повертає множину справді прибраних id."""
+    with transaction.atomic():
+        _lock_user(user_id)
+        favorites = Favorite.objects.filter(user_id=user_id, game_id__in=game_ids)
+        removed = set(favorites.values_list('game_id', flat=True))
+        if removed:
+            favorites.delete()
+            Game.objects.filter(id__in=removed).update(favorite_count=F('favorite_count') - 1)
+            invalidate_favorites(user_id)
+    return removed
+
+
+def toggle_favorites(user_id, game_ids):
+    """Наявні в списку ігри прибирає, решту додає. Повертає (додані, прибрані)."""
+    game_ids = set(game_ids)
+    with transaction.atomic():
+        _lock_user(user_id)
+        present = set(Favorite.objects.filter(user_id=user_id, game_id__in=game_ids).values_list('game_id', flat=True))
+        removed = remove_favorites(user_id, present)
+        added = add_favorites(user_id, game_ids - present)
+    return added, removed
+
+
+def most_wishlisted(limit=10):
+    return cache.get_or_set(
+        f"games:most_wishlisted:{limit}",
+        lambda: list(
+            Game.objects.filter(favorite_count__gt=0)
+            .order_by('-favorite_count', 'id')
+            .values('id', 'title', 'favorite_count')[:limit]
+        ),
+        MOST_WISHLISTED_TTL,
+    )
+
+
+class SessionFavorites:
+
+    def __init__(self, session):
+        self.items = SessionIds(session, SESSION_KEY)
+
+    def game_ids(self):
+        return set(self.items.ids())
+
+    def add(self, game_id):
+        self.items.add(game_id)
+
+    def remove(self, game_id):
+        self.items.remove(game_id)
+
+    def clear(self):
+        self.items.clear()
+
+    def count(self):
+        return len(self.items)
+
+    def games(self):
+        return Game.objects.filter(id__in=self.items.ids())
+
+
+class DatabaseFavorites:
+
+    def __init__(self, user):
+        self.user = user
+
+    def game_ids(self):
+        return favorite_ids(self.user.pk)
+
+    def add(self, game_id):
+        add_favorites(self.user.pk, [game_id])
+
+    def remove(self, game_id):
+        remove_favorites(self.user.pk, [game_id])
+
+    def count(self):
+        return len(self.game_ids())
+
+    def games(self):
+        return Game.objects.filter(favorited_by__user=self.user)
+
+
+def get_favorites(request):
+    if request.user.is_authenticated:
+        return DatabaseFavorites(request.user)
+    return SessionFavorites(request.session)
+
+
+def merge_session_favorites(request, user):
+    """Переносить анонімний список бажаного із сесії в БД."""
+    session_favorites = SessionFavorites(request.session)
+    game_ids = session_favorites.game_ids()
+    if not game_ids:
+        return
+    add_favorites(user.pk, game_ids)
+    session_favorites.clear()
@@ -0,0 +1,142 @@
+"""
+Граф друзів.
+
+Дружба - дві дзеркальні записи Friend (user -> friend і friend -> user).
+Мутації пакетні: усі пари - один bulk_create і DELETE в транзакції,
+разом із запитами в друзі між цими користувачами. Пари групуються за першим
+користувачем, тож "додати 1000 друзів одному" - теж один DELETE; умова ділиться
+на кілька DELETE лише після DELETE_GROUPS різних користувачів (ліміт глибини
+виразу SQLite).
+
+friend_ids(user_id) - множина друзів (суміжність), кешується і скидається
+при кожній зміні. Спільні друзі і пропозиції рахує БД через підзапити по
+індексу (user, friend) - id друзів не передаються параметрами в IN, тож
+тисячі друзів не впираються в ліміт змінних SQLite і не тягнуться в Python.
+"""
+import operator
+from collections import defaultdict
+from functools import reduce
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import Friend, FriendRequest
+
+FRIENDS_TTL = 60 * 60
+SUGGESTIONS_LIMIT = 10
+DELETE_GROUPS = 100
+
+
+def friends_key(user_id):
+    return f"games:friends:{user_id}"
+
+
+def friend_ids(user_id):
+    return cache.get_or_set(
+        friends_key(user_id),
+        lambda: frozenset(Friend.objects.filter(user_id=user_id).values_list('friend_id', flat=True)),
+        FRIENDS_TTL,
+    )
+
+
+def are_friends(user_id, other_id):
+    return other_id in friend_ids(user_id)
+
+
+def invalidate_friends(user_ids):
+    keys = [friends_key(user_id) for user_id in set(user_ids)]
+    cache.delete_many(keys)
+    # Повторно після коміту: паралельний запит міг закешувати стару множину
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def _delete_between(model, pairs, first, second):
+    """Видаляє записи model між парами користувачів в обох напрямках."""
+    groups = defaultdict(set)
+    for user_id, other_id in pairs:
+        groups[user_id].add(other_id)
+    groups = list(groups.items())
+    for start in range(0, len(groups), DELETE_GROUPS):
+        condition = reduce(operator.or_, (
+            Q(**{first: user_id, f'{second}__in': others}) | Q(**{f'{first}__in': others, second: user_id})
+            for user_id, others in groups[start:start + DELETE_GROUPS]
+        ))
+        model.objects.filter(condition).delete()
+
+
+def _normalize(pairs):
+    return [(user_id, other_id) for user_id, other_id in pairs if user_id != other_id]
+
+
+def add_friendships(pairs):
+    """Робить друзями пари (user_id, other_id) і прибирає запити між ними."""
+    pairs = _normalize(pairs)
+    if not pairs:
+        return
+    with transaction.atomic():
+        Friend.objects.bulk_create(
+            [Friend(user_id=a, friend_id=b) for user_id, other_id in pairs
+             for a, b in ((user_id, other_id), (other_id, user_id))],
+            ignore_conflicts=True,
+        )
+        _delete_between(FriendRequest, pairs, 'sender_id', 'receiver_id')
+        invalidate_friends(user_id for pair in pairs for user_id in pair)
+
+
+def remove_friendships(pairs):
+    pairs = _normalize(pairs)
+    if not pairs:
+        return
+    with transaction.atomic():
+        _delete_between(Friend, pairs, 'user_id', 'friend_id')
+        invalidate_friends(user_id for pair in pairs for user_id in pair)
+
+
+def _friends_of(user_id):
+    return Friend.objects.filter(user_id=user_id).values('friend_id')
+
+
+def mutual_friends(user_id, other_id):
+    """Спільні друзі - один запит з підзапитом."""
+    return User.objects.filter(
+        friend_of__user_id=user_id,
+        id__in=_friends_of(other_id),
+    ).select_related('profile')
+
+
+def mutual_counts(user_id, other_ids):
+    """{other_id: кількість спільних друзів} для списку користувачів - одним GROUP BY."""
+    rows = (
+        Friend.objects
+        .filter(user_id__in=other_ids, friend_id__in=_friends_of(user_id))
+        .values('user_id')
+        .order_by()
+        .annotate(mutual=Count('id'))
+    )
+    return {row['user_id']: row['mutual'] for row in rows}
+
+
+def suggestions(user_id, limit=SUGGESTIONS_LIMIT):
+    """Друзі друзів, яких ще немає в друзях і з якими немає запиту, за кількістю спільних друзів."""
+    pending = FriendRequest.objects.filter(status='pending')
+    rows = list(
+        Friend.objects
+        .filter(user_id__in=_friends_of(user_id))
+        .exclude(friend_id=user_id)
+        .exclude(friend_id__in=_friends_of(user_id))
+        .exclude(friend_id__in=pending.filter(sender_id=user_id).values('receiver_id'))
+        .exclude(friend_id__in=pending.filter(receiver_id=user_id).values('sender_id'))
+        .values('friend_id')
+        .order_by()
+        .annotate(mutual=Count('id'))
+        .order_by('-mutual', 'friend_id')[:limit]
+    )
+    users = User.objects.select_related('profile').in_bulk([row['friend_id'] for row in rows])
+    result = []
+    for row in rows:
+        user = users[row['friend_id']]
+        user.mutual = row['mutual']
+        result.append(user)
+    return result
@@ -0,0 +1,214 @@
+"""
+Похідні зображення: зменшені копії в AVIF, WebP і JPEG поруч з оригіналом.
+
+Для games/foo.png це games/foo.240w.avif, games/foo.240w.webp, games/foo.240w.jpg
+і т.д. для кожної ширини з IMAGE_SPECS. Що згенеровано, записано в JSON-полі
+моделі (Game.image_variants, ...) разом з ім'ям оригіналу - тож сторінка
+знає про варіанти без звернень до сховища, а після заміни файлу старі
+варіанти просто ігноруються, поки не з'являться нові. Там же - хеші вмісту
+оригіналу і кожного варіанту для URL (?v=, див. games.media): рахуються тут,
+один раз на файл.
+
+Генерація - фонова задача (games.tasks), її виконує воркер run_tasks, а не
+запит із завантаженням. Pillow відпускає GIL на декодуванні і кодуванні, тож
+потоки воркера працюють паралельно. Наявні файли добудовує команда
+build_image_derivatives.
+"""
+import io
+import logging
+import os
+from typing import NamedTuple
+
+from django.apps import apps
+from django.core.files.storage import default_storage
+from PIL import ExifTags, Image, ImageOps, UnidentifiedImageError
+
+from . import tasks
+from .caching import game_detail_cache
+from .media import content_version, versioned_url
+
+logger = logging.getLogger(__name__)
+
+# Формат -> (розширення, MIME, параметри Pillow). Порядок - від найкращого;
+# останній (JPEG) - запасний для <img> у браузерах без AVIF/WebP
+FORMATS = {
+    'avif': ('avif', 'image/avif', {'quality': 50}),
+    'webp': ('webp', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+class ImageSpec(NamedTuple):
+    field: str
+    variants_field: str
+    # Ширини в пікселях: 1x і 2x для місць, де зображення показується
+    widths: tuple
+
+
+IMAGE_SPECS = {
+    # Картка каталогу 120px, шапка сторінки гри ~460px, карусель ~920px
+    'games.Game': ImageSpec('image', 'image_variants', (120, 240, 460, 920)),
+    'games.GameScreenshot': ImageSpec('image', 'image_variants', (460, 920, 1600)),
+    # Аватар 45px у пошуку і ~180px у профілі
+    'games.Profile': ImageSpec('avatar', 'avatar_variants', (45, 90, 184, 368)),
+}
+
+
+def spec_for(instance):
+    return IMAGE_SPECS.get(instance._meta.label)
+
+
+def derivative_name(name, width, fmt):
+    return f"{os.path.splitext(name)[0]}.{width}w.{FORMATS[fmt][0]}"
+
+
+def variants_current(file, variants):
+    """Чи відповідають збережені варіанти поточному файлу (і чи є в них хеші вмісту)."""
+    return bool(file) and bool(variants) and variants.get('source') == file.name and 'versions' in variants
+
+
+def _prepare(image, fmt):
+    if fmt == 'jpeg':
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            # JPEG без прозорості - кладемо на білий фон
+            rgba = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            return background
+        return image.convert('RGB')
+    if image.mode not in ('RGB', 'RGBA'):
+        return image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    return image
+
+
+def _derivatives_exist(storage, name, widths):
+    try:
+        source_time = storage.get_modified_time(name)
+        return all(
+            storage.exists(path) and storage.get_modified_time(path) >= source_time
+            for path in (derivative_name(name, width, fmt) for width in widths for fmt in FORMATS)
+        )
+    except (NotImplementedError, OSError):
+        return False
+
+
+def generate_derivatives(storage, name, spec_widths):
+    """Створює варіанти файлу name. Повертає словник для *_variants або None."""
+    try:
+        with storage.open(name) as source:
+            versions = {name: content_version(source.chunks())}
+            source.seek(0)
+            image = Image.open(source)
+            width, height = image.size
+            # Розміри - з урахуванням повороту з EXIF, як їх побачить користувач
+            rotated = image.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8)
+            if rotated:
+                width, height = height, width
+            widths = [w for w in spec_widths if w < width] or [width]
+            variants = {
+                'source': name, 'width': width, 'height': height, 'widths': widths,
+                'formats': list(FORMATS), 'versions': versions,
+            }
+            if _derivatives_exist(storage, name, widths):
+                # Спільний файл (аватар за замовчуванням) або повторний запуск
+                for path in (derivative_name(name, w, fmt) for w in widths for fmt in FORMATS):
+                    with storage.open(path) as derivative:
+                        versions[path] = content_version(derivative.chunks())
+                return variants
+            # JPEG декодується одразу в зменшеному масштабі, якщо оригінал значно більший
+            draft = (max(widths), max(max(widths) * height // width, 1))
+            image.draft('RGB', draft[::-1] if rotated else draft)
+            image = ImageOps.exif_transpose(image)
+            image.load()
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        logger.warning("Cannot read image %s", name, exc_info=True)
+        return None
+
+    for target in sorted(widths, reverse=True):
+        # Кожен наступний розмір - з попереднього: менше пікселів на вході
+        image = image.resize((target, max(round(height * target / width), 1)), Image.LANCZOS, reducing_gap=3.0)
+        for fmt, (_, _, options) in FORMATS.items():
+            buffer = io.BytesIO()
+            _prepare(image, fmt).save(buffer, format=fmt.upper(), **options)
+            path = derivative_name(name, target, fmt)
+            if storage.exists(path):
+                storage.delete(path)
+            storage.save(path, buffer)
+            versions[path] = content_version([buffer.getvalue()])
+    return variants
+
+
+def process_instance(model, pk):
+    """Генерує варіанти для одного об'єкта і зберігає їх, якщо файл не змінився."""
+    spec = IMAGE_SPECS[model._meta.label]
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return None
+    file = getattr(instance, spec.field)
+    if not file or variants_current(file, getattr(instance, spec.variants_field)):
+        return None
+    variants = generate_derivatives(file.storage, file.name, spec.widths)
+    if variants is not None:
+        save_variants(model, [(pk, file.name, variants)])
+    return variants
+
+
+def save_variants(model, rows):
+    """rows - (pk, ім'я файлу, варіанти). update() без сигналів; кеші скидаються тут."""
+    spec = IMAGE_SPECS[model._meta.label]
+    game_ids = set()
+    for pk, name, variants in rows:
+        # Якщо файл встигли замінити - ці варіанти вже не для нього
+        updated = model.objects.filter(pk=pk, **{spec.field: name}).update(**{spec.variants_field: variants})
+        if updated and model._meta.label == 'games.Game':
+            game_ids.add(pk)
+        elif updated and model._meta.label == 'games.GameScreenshot':
+            game_ids.update(model.objects.filter(pk=pk).values_list('game_id', flat=True))
+    # Версію каталогу (фрагменти з картинками) змінює сам Game.objects.update()
+    for game_id in game_ids:
+        game_detail_cache.invalidate(game_id)
+
+
+@tasks.task(max_attempts=3)
+def build_variants(model, pk):
+    process_instance(apps.get_model(model), pk)
+
+
+def schedule(instance):
+    """Ставить генерацію варіантів у чергу задач, якщо файл змінився."""
+    spec = spec_for(instance)
+    if spec is None:
+        return
+    file = getattr(instance, spec.field)
+    if not file or variants_current(file, getattr(instance, spec.variants_field)):
+        return
+    label = instance._meta.label
+    # Повторне збереження з тим самим файлом не ставить другу задачу
+    tasks.enqueue(build_variants, key=f"images:{label}:{instance.pk}:{file.name}", model=label, pk=instance.pk)
+
+
+def image_representation(name, variants, storage=default_storage):
+    """
+    {'url', 'width', 'height', 'srcset': {формат: "url 120w, ..."}} - для шаблонів і API.
+    name - ім'я файлу в сховищі (FieldFile.name або рядок з .values()).
+    """
+    if not name:
+        return None
+    current = bool(variants) and variants.get('source') == name
+    versions = variants.get('versions', {}) if current else {}
+
+    def url(path):
+        return versioned_url(storage, path, versions.get(path))
+
+    representation = {'url': url(name), 'width': None, 'height': None, 'srcset': {}}
+    if current:
+        representation['width'] = variants['width']
+        representation['height'] = variants['height']
+        representation['srcset'] = {
+            fmt: ', '.join(
+                f"{url(derivative_name(name, width, fmt))} {width}w"
+                for width in variants['widths']
+            )
+            for fmt in variants['formats'] if fmt in FORMATS
+        }
+    return representation
@@ -0,0 +1,215 @@
+import asyncio
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import stripe
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, transaction
+from django.test import Client
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from games import payments
+from games.cart import DatabaseCart
+from games.models import Game
+
+SESSION_PARAMS = {
+    "payment_method_types": ["card"],
+    "line_items": [{
+        "price_data": {"currency": "uah", "product_data": {"name": "Game"}, "unit_amount": 10000},
+        "quantity": 1,
+    }],
+    "mode": "payment",
+    "success_url": "http://localhost/payment/success/?session_id={CHECKOUT_SESSION_ID}",
+    "cancel_url": "http://localhost/cart/",
+}
+
+
+class FakeStripe:
+    """Повільний локальний Stripe: кожна відповідь через delay секунд, keep-alive."""
+
+    def __init__(self, delay):
+        self.connections = 0
+        # Кожна сесія з новим id - замовлення унікальні за stripe_session_id
+        ids = itertools.count()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                fake.connections += 1
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(delay)
+                body = json.dumps({
+                    "id": f"cs_bench_{next(ids)}", "object": "checkout.session",
+                    "url": "https://checkout.stripe.test/cs_bench", "payment_status": "unpaid",
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Порівнює створення Checkout Session при повільному Stripe: синхронні воркери "
+        "(stripe.checkout.Session.create) проти одного async воркера з пулом з'єднань - "
+        "окремо клієнт Stripe і повний запит /stripe/checkout/ через ASGI з усіма middleware"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--delay", type=float, default=0.5, help="затримка відповіді Stripe, с")
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--workers", type=int, default=4, help="кількість синхронних воркерів")
+        parser.add_argument("--concurrency", type=int, default=100, help="одночасних запитів до async воркера")
+
+    def handle(self, *args, **options):
+        delay, total = options["delay"], options["requests"]
+        self.stdout.write(f"upstream delay: {delay * 1000:.0f} ms, requests: {total}")
+
+        fake = FakeStripe(delay)
+        try:
+            with mock.patch.object(stripe, "api_base", fake.url):
+                elapsed, busy = self.measure_sync(total, options["workers"])
+                self.report(f"sync x{options['workers']}", total, elapsed, fake.connections)
+                self.stdout.write(
+                    f"    workers blocked on Stripe {busy / (elapsed * options['workers']):.0%} of the time; "
+                    f"any other request waits for a free worker"
+                )
+
+                fake.connections = 0
+                elapsed, cpu = asyncio.run(self.measure_async(total, options["concurrency"]))
+                self.report("async x1", total, elapsed, fake.connections)
+                self.stdout.write(
+                    f"    worker busy (CPU) {cpu / elapsed:.0%} of the time; "
+                    f"the rest it serves other requests while Stripe answers"
+                )
+
+                fake.connections = 0
+                elapsed, statuses = self.measure_asgi(total, options["concurrency"])
+                self.report("asgi x1", total, elapsed, fake.connections)
+                sync_only = [
+                    path for path in settings.MIDDLEWARE
+                    if not getattr(import_string(path), "async_capable", False)
+                ]
+                self.stdout.write(
+                    f"    full middleware stack, responses {dict(statuses)}; "
+                    f"sync-only middleware: {', '.join(sync_only) or 'none'}"
+                )
+        finally:
+            fake.close()
+
+    def report(self, name, total, elapsed, connections):
+        self.stdout.write(
+            f"{name:>9}: {total / elapsed:7.1f} checkouts/s, {elapsed:6.2f} s total, "
+            f"{connections} connections to Stripe"
+        )
+
+    def measure_sync(self, total, workers):
+        def checkout(_):
+            start = time.perf_counter()
+            stripe.checkout.Session.create(**SESSION_PARAMS)
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(workers) as pool:
+            busy = sum(pool.map(checkout, range(total)))
+        return time.perf_counter() - start, busy
+
+    async def measure_async(self, total, concurrency):
+        # Свій breaker - щоб бенчмарк не відкрив спільний; thread_time - лише потік event loop
+        with mock.patch.object(payments, "breaker", payments.CircuitBreaker()):
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def checkout():
+                async with semaphore:
+                    await payments.create_checkout_session(SESSION_PARAMS)
+
+            cpu_start, start = time.thread_time(), time.perf_counter()
+            await asyncio.gather(*(checkout() for _ in range(total)))
+            return time.perf_counter() - start, time.thread_time() - cpu_start
+
+    def measure_asgi(self, total, concurrency):
+        # Користувач і кошик - у транзакції, яка відкочується. async_to_sync, а не asyncio.run:
+        # sync-частини запиту (ORM, сесії) тоді йдуть у цей потік і бачать незакомічені дані
+        with transaction.atomic():
+            user = User.objects.create_user(username="bench-checkout")
+            game = Game.objects.create(title="bench", description="bench", genre="bench", release_year=2020, price=100)
+            DatabaseCart(user).add(game.id)
+            client = Client()
+            client.force_login(user)
+            cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+            # Як у тестовому клієнті: обробник не закриває з'єднання посеред транзакції
+            request_started.disconnect(close_old_connections)
+            request_finished.disconnect(close_old_connections)
+            try:
+                result = async_to_sync(self.run_asgi)(total, concurrency, cookie)
+            finally:
+                request_started.connect(close_old_connections)
+                request_finished.connect(close_old_connections)
+            transaction.set_rollback(True)
+        return result
+
+    async def run_asgi(self, total, concurrency, cookie):
+        handler = ASGIHandler()
+        path = reverse("stripe_checkout")
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+            "query_string": b"", "root_path": "",
+            "headers": [(b"host", b"localhost"), (b"cookie", cookie.encode())],
+            "client": ("127.0.0.1", 0), "server": ("localhost", 80),
+        }
+        statuses = {}
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses[message["status"]] = statuses.get(message["status"], 0) + 1
+
+        async def checkout():
+            messages = [{"type": "http.request", "body": b"", "more_body": False}]
+            done = asyncio.Event()
+
+            async def receive():
+                # Після тіла запиту Django чекає на http.disconnect - клієнт не відключається
+                if messages:
+                    return messages.pop()
+                await done.wait()
+                return {"type": "http.disconnect"}
+
+            async with semaphore:
+                await handler(dict(scope), receive, send)
+            done.set()
+
+        with mock.patch.object(payments, "breaker", payments.CircuitBreaker()):
+            start = time.perf_counter()
+            await asyncio.gather(*(checkout() for _ in range(total)))
+            return time.perf_counter() - start, statuses
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from django.views import static
+
+from games.media import content_version, serve_media, versioned_url
+
+RANGE_SIZE = 64 * 1024
+
+
+def _body_size(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+class Command(BaseCommand):
+    help = (
+        "Порівнює роздачу медіа django.views.static.serve і games.media.serve_media: "
+        "повний GET, повторний перегляд сторінки, Range-запит і sendfile"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--images", type=int, default=30, help="картинок на сторінці каталогу")
+        parser.add_argument("--small", type=int, default=50, help="розмір картинки, КБ")
+        parser.add_argument("--large", type=int, default=1024, help="розмір великого файлу, КБ")
+
+    def handle(self, *args, **options):
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                self.run(options)
+        finally:
+            shutil.rmtree(media_root)
+
+    def run(self, options):
+        factory = RequestFactory()
+        # Хеш вмісту рахується при збереженні (як у games.images), а не на запит
+        versions = {}
+
+        def save(name, size):
+            content = os.urandom(size * 1024)
+            name = default_storage.save(name, ContentFile(content))
+            versions[name] = content_version([content])
+            return name
+
+        images = [save(f"bench/{i}.jpg", options["small"]) for i in range(options["images"])]
+        large = save("bench/large.bin", options["large"])
+
+        def old(path, **headers):
+            return static.serve(factory.get("/media/" + path, headers=headers), path, document_root=settings.MEDIA_ROOT)
+
+        # URL з хешем будує сторінка, а не запит до /media/
+        urls = {path: versioned_url(default_storage, path, versions[path]) for path in images + [large]}
+
+        def new(path, **headers):
+            return serve_media(factory.get(urls[path], headers=headers), path)
+
+        self.stdout.write(f"{options['requests']} full GETs of a {options['small']} KB image:")
+        for name, serve in (("serve", old), ("serve_media", new)):
+            start = time.perf_counter()
+            for i in range(options["requests"]):
+                _body_size(serve(images[i % len(images)]))
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"  {name:>11}: {elapsed / options['requests'] * 1e6:7.0f} us/request")
+
+        # Повторний перегляд: без Cache-Control браузер перевіряє кожну картинку,
+        # immutable-відповідь береться з кешу без запиту
+        self.stdout.write(f"repeat view of a page with {len(images)} images:")
+        for name, serve in (("serve", old), ("serve_media", new)):
+            revalidations = sum(
+                "immutable" not in serve(path).get("Cache-Control", "") for path in images
+            )
+            self.stdout.write(f"  {name:>11}: {revalidations} requests to the server")
+
+        self.stdout.write(f"Range: bytes=0-{RANGE_SIZE - 1} of a {options['large']} KB file:")
+        for name, serve in (("serve", old), ("serve_media", new)):
+            response = serve(large, range=f"bytes=0-{RANGE_SIZE - 1}")
+            self.stdout.write(
+                f"  {name:>11}: status {response.status_code}, "
+                f"{_body_size(response) // 1024} KB through Python"
+            )
+
+        with override_settings(GAMES_MEDIA_SENDFILE="x-accel-redirect"):
+            start = time.perf_counter()
+            for _ in range(options["requests"]):
+                sent = _body_size(new(large))
+            elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"x-accel-redirect, full {options['large']} KB file: "
+            f"{elapsed / options['requests'] * 1e6:.0f} us/request, {sent} bytes through Python"
+        )
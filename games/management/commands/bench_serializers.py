@@ -0,0 +1,93 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from games.fast_serializers import (
+    FastGameSerializer,
+    FastMessageSerializer,
+    FastProfileSerializer,
+)
+from games.models import Conversation, Game, Message, Profile
+from games.serializers import GameSerializer, MessageSerializer, ProfileSerializer
+
+
+class Command(BaseCommand):
+    help = "Порівнює швидкість DRF-серіалізаторів і fast-path серіалізаторів (рядків/с)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=2000)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        # Тестові дані створюються в транзакції, яка потім відкочується
+        with transaction.atomic():
+            self.seed(rows)
+            cases = [
+                ("game", Game.objects.all(), GameSerializer, FastGameSerializer),
+                (
+                    "message",
+                    Message.objects.filter(text__startswith="bench-"),
+                    MessageSerializer,
+                    FastMessageSerializer,
+                ),
+                (
+                    "profile",
+                    Profile.objects.filter(nickname__startswith="bench-"),
+                    ProfileSerializer,
+                    FastProfileSerializer,
+                ),
+            ]
+            for name, queryset, drf_class, fast_class in cases:
+                drf = self.measure(
+                    lambda: drf_class(queryset.all(), many=True).data, options["repeat"]
+                )
+                fast = self.measure(
+                    lambda: fast_class().serialize(queryset.all()), options["repeat"]
+                )
+                count = queryset.count()
+                self.stdout.write(
+                    f"{name:8} rows={count:6}  drf={count / drf:10.0f} rows/s  "
+                    f"fast={count / fast:10.0f} rows/s  x{drf / fast:.1f}"
+                )
+            transaction.set_rollback(True)
+
+    def measure(self, func, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def seed(self, rows):
+        Game.objects.bulk_create(
+            Game(
+                title=f"bench-{i}",
+                description="bench " * 40,
+                genre="bench",
+                release_year=2000 + i % 25,
+                price=100 + i % 50,
+                discount=i % 3 * 10,
+            )
+            for i in range(rows)
+        )
+        users = [
+            User.objects.create(username=f"bench-{i}") for i in range(min(rows, 200))
+        ]
+        conversations = [
+            Conversation.objects.between(users[i], users[(i + 1) % len(users)], create=True)
+            for i in range(len(users))
+        ]
+        Message.objects.bulk_create(
+            Message(
+                conversation=conversations[i % len(users)],
+                sender=users[i % len(users)],
+                receiver=users[(i + 1) % len(users)],
+                text=f"bench-{i}",
+            )
+            for i in range(rows)
+        )
@@ -0,0 +1,104 @@
+import json
+import random
+
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from games.models import Game
+from games.sessions import encode_ids, flush_dirty
+
+# (назва, SESSION_ENGINE, GAMES_SESSION_WRITE_BEHIND)
+ENGINES = (
+    ("db", "django.contrib.sessions.backends.db", 0),
+    ("games.sessions", "games.sessions", 0),
+    ("write-behind", "games.sessions", 30),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Рахує запити до django_session для анонімних відвідувачів, що додають ігри "
+        "в бажане і кошик: стандартні DB-сесії, кеш з пропуском незмінених сесій і "
+        "write-behind (flush_dirty раз на інтервал; вважаємо, що відвідувач вкладається в один)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--visitors", type=int, default=50)
+        parser.add_argument("--clicks", type=int, default=30, help="дій на відвідувача")
+        parser.add_argument("--games", type=int, default=200)
+
+    def handle(self, *args, **options):
+        # Тестові дані створюються в транзакції, яка потім відкочується
+        with transaction.atomic():
+            game_ids = [
+                game.id for game in Game.objects.bulk_create(
+                    Game(title=f"bench-{i}", description="bench", genre="bench", release_year=2020, price=100)
+                    for i in range(options["games"])
+                )
+            ]
+            scenario = self.scenario(game_ids, options["visitors"], options["clicks"])
+            self.stdout.write(
+                f"{options['visitors']} visitors x {options['clicks']} clicks "
+                f"(favorites, cart, repeated adds, page views)"
+            )
+            for name, engine, write_behind in ENGINES:
+                counts = self.measure(engine, write_behind, scenario)
+                self.stdout.write(
+                    f"  {name:>14}: {counts['SELECT']:5} SELECT, {counts['INSERT']:4} INSERT, "
+                    f"{counts['UPDATE']:5} UPDATE, {counts['writes']:4} write statements total"
+                )
+            transaction.set_rollback(True)
+
+        sample = sorted(random.sample(game_ids, min(20, len(game_ids))))
+        self.stdout.write(
+            f"20 favorite ids in the session: list {len(json.dumps(sample, separators=(',', ':')))} bytes, "
+            f"compact {len(encode_ids(sample))} bytes"
+        )
+
+    def scenario(self, game_ids, visitors, clicks):
+        random.seed(1)
+        steps = []
+        for visitor in range(visitors):
+            # Відвідувач крутиться навколо кількох ігор - частина кліків повторні
+            liked = random.sample(game_ids, 8)
+            actions = []
+            for _ in range(clicks):
+                game_id = random.choice(liked)
+                actions.append(random.choice([
+                    reverse("add_to_favorites", args=[game_id]),
+                    reverse("add_to_favorites_ajax", args=[game_id]),
+                    reverse("add_to_cart", args=[game_id]),
+                    reverse("remove_from_cart", args=[game_id]),
+                    reverse("favorites"),
+                    reverse("cart"),
+                ]))
+            steps.append(actions)
+        return steps
+
+    def measure(self, engine, write_behind, scenario):
+        cache.clear()
+        Session.objects.all().delete()
+        with override_settings(SESSION_ENGINE=engine, GAMES_SESSION_WRITE_BEHIND=write_behind), \
+                CaptureQueriesContext(connection) as queries:
+            for actions in scenario:
+                client = Client()
+                for url in actions:
+                    client.get(url)
+                if write_behind:
+                    # Запуск run_tasks між відвідувачами
+                    flush_dirty()
+            if write_behind:
+                flush_dirty()
+                flush_dirty()
+        counts = {"SELECT": 0, "INSERT": 0, "UPDATE": 0, "DELETE": 0}
+        for query in queries:
+            if "django_session" in query["sql"]:
+                verb = query["sql"].split(None, 1)[0].upper()
+                counts[verb] = counts.get(verb, 0) + 1
+        counts["writes"] = counts["INSERT"] + counts["UPDATE"] + counts["DELETE"]
+        return counts
@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from games.images import (
+    FORMATS, IMAGE_SPECS, derivative_name, generate_derivatives, save_variants, variants_current,
+)
+
+
+class Command(BaseCommand):
+    help = "Генерує зменшені копії (AVIF/WebP/JPEG) для наявних зображень ігор, скріншотів і аватарів"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--force", action="store_true", help="перегенерувати навіть актуальні")
+
+    def handle(self, *args, **options):
+        with ThreadPoolExecutor(options["workers"]) as pool:
+            for label, spec in IMAGE_SPECS.items():
+                model = apps.get_model(label)
+                done, failed = self.backfill(model, spec, pool, options)
+                self.stdout.write(f"{label}: {done} processed, {failed} failed")
+        self.stdout.write(self.style.SUCCESS("Done"))
+
+    def backfill(self, model, spec, pool, options):
+        done = failed = 0
+        last_id = 0
+        # Один файл (аватар за замовчуванням) обробляється один раз за запуск
+        seen = {}
+        while True:
+            rows = list(
+                model.objects.filter(pk__gt=last_id).order_by("pk")
+                .only("pk", spec.field, spec.variants_field)[:options["batch_size"]]
+            )
+            if not rows:
+                break
+            last_id = rows[-1].pk
+
+            pending = [
+                row for row in rows
+                if getattr(row, spec.field)
+                and (options["force"] or not variants_current(getattr(row, spec.field), getattr(row, spec.variants_field)))
+            ]
+            names = {getattr(row, spec.field).name for row in pending} - set(seen)
+            storage = model._meta.get_field(spec.field).storage
+            if options["force"]:
+                # Наявні похідні файли інакше вважались би актуальними
+                self.delete_derivatives(storage, names, spec)
+            futures = {name: pool.submit(generate_derivatives, storage, name, spec.widths) for name in names}
+            seen.update((name, future.result()) for name, future in futures.items())
+
+            updates = []
+            for row in pending:
+                name = getattr(row, spec.field).name
+                if seen[name] is None:
+                    failed += 1
+                else:
+                    updates.append((row.pk, name, seen[name]))
+            save_variants(model, updates)
+            done += len(updates)
+        return done, failed
+
+    def delete_derivatives(self, storage, names, spec):
+        for name in names:
+            for width in spec.widths:
+                for fmt in FORMATS:
+                    path = derivative_name(name, width, fmt)
+                    if storage.exists(path):
+                        storage.delete(path)
@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from games.models import Conversation, Friend, Message
+from games.realtime import InProcessChatBroker, conversation_channel
+from games.views import fetch_messages
+
+POLL_INTERVAL = 2
+
+
+class Command(BaseCommand):
+    help = (
+        "Порівнює навантаження чату: опитування fetch_messages кожні 2 с "
+        "проти WebSocket-доставки через InProcessChatBroker"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chats", type=int, default=1000)
+        parser.add_argument("--samples", type=int, default=500, help="скільки poll-запитів заміряти")
+        parser.add_argument("--messages", type=int, default=5000, help="скільки повідомлень розіслати")
+
+    def handle(self, *args, **options):
+        chats = options["chats"]
+        # Тестові дані створюються в транзакції, яка потім відкочується
+        with transaction.atomic():
+            pairs = self.seed(chats)
+            poll_time = self.measure_polling(pairs, options["samples"])
+            transaction.set_rollback(True)
+
+        push_time = asyncio.run(self.measure_push(pairs, options["messages"]))
+
+        poll_rps = chats / POLL_INTERVAL
+        self.stdout.write(f"chats: {chats}")
+        self.stdout.write(
+            f"polling:   {poll_rps:8.0f} req/s incoming (1 per chat every {POLL_INTERVAL}s, "
+            f"even when idle); {poll_time * 1000:.2f} ms per request -> "
+            f"{poll_rps * poll_time:.2f} CPU-s per second"
+        )
+        self.stdout.write(
+            f"websocket: 0 req/s when idle; {push_time * 1e6:.1f} us per delivered message -> "
+            f"{1 / push_time:8.0f} deliveries/s per core"
+        )
+
+    def seed(self, chats):
+        users = User.objects.bulk_create(
+            User(username=f"loadtest-{i}") for i in range(chats * 2)
+        )
+        pairs = [(users[2 * i], users[2 * i + 1]) for i in range(chats)]
+        Friend.objects.bulk_create(
+            Friend(user=a, friend=b) for x, y in pairs for a, b in ((x, y), (y, x))
+        )
+        conversations = Conversation.objects.bulk_create(
+            Conversation(first_user=a, second_user=b) for a, b in pairs
+        )
+        Message.objects.bulk_create(
+            Message(conversation=c, sender=a, receiver=b, text="hello")
+            for c, (a, b) in zip(conversations, pairs)
+        )
+        return pairs
+
+    def measure_polling(self, pairs, samples):
+        factory = RequestFactory()
+        start = time.perf_counter()
+        for i in range(samples):
+            user, friend = pairs[i % len(pairs)]
+            request = factory.get(f"/chat/{friend.id}/fetch/")
+            request.user = user
+            fetch_messages(request, friend.id)
+        return (time.perf_counter() - start) / samples
+
+    async def measure_push(self, pairs, messages):
+        broker = InProcessChatBroker()
+        channels = [conversation_channel(a.id, b.id) for a, b in pairs]
+        # Дві підписки на розмову - обидва співрозмовники онлайн
+        subscriptions = [
+            await broker.subscribe(channel) for channel in channels for _ in range(2)
+        ]
+        payload = {"id": 1, "sender": "loadtest", "text": "hello", "timestamp": ""}
+
+        start = time.perf_counter()
+        for i in range(messages):
+            broker.publish(channels[i % len(channels)], payload)
+        delivered = 0
+        for subscription in subscriptions:
+            await asyncio.sleep(0)
+            while not subscription.queue.empty():
+                subscription.queue.get_nowait()
+                delivered += 1
+        elapsed = time.perf_counter() - start
+        return elapsed / max(delivered, 1)
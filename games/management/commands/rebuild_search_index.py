@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from games.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Перебудовує пошуковий індекс каталогу ігор"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = get_backend().rebuild(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} games"))
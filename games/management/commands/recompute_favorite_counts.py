@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from games.models import Favorite, Game
+
+
+class Command(BaseCommand):
+    help = "Перераховує Game.favorite_count за таблицею Favorite"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        fixed = total = 0
+        last_id = 0
+        while True:
+            ids = list(Game.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:batch_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+            total += len(ids)
+            with transaction.atomic():
+                fixed += self.recompute(ids)
+        self.stdout.write(self.style.SUCCESS(f"Checked {total} games, fixed {fixed}"))
+
+    def recompute(self, ids):
+        # Один GROUP BY на пачку ігор; рядки ігор заблоковані, щоб нові зміни не загубились
+        games = list(Game.objects.select_for_update().filter(id__in=ids).only("id", "favorite_count"))
+        actual = dict(
+            Favorite.objects.filter(game_id__in=ids).values_list("game_id").order_by().annotate(Count("id"))
+        )
+        changed = []
+        for game in games:
+            if game.favorite_count != actual.get(game.id, 0):
+                game.favorite_count = actual.get(game.id, 0)
+                changed.append(game)
+        Game.objects.bulk_update(changed, ["favorite_count"])
+        return len(changed)
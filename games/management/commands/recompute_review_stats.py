@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from games.caching import game_detail_cache
+from games.models import Game, Review
+
+
+class Command(BaseCommand):
+    help = "Перераховує агрегати відгуків (кількість, сума, гістограма) для всіх ігор"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        fixed = total = 0
+        last_id = 0
+        while True:
+            ids = list(Game.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:batch_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+            total += len(ids)
+            with transaction.atomic():
+                fixed += self.recompute(ids)
+
+        # Версію каталогу змінює bulk_update (GameQuerySet.update)
+        self.stdout.write(self.style.SUCCESS(f"Checked {total} games, fixed {fixed}"))
+
+    def recompute(self, ids):
+        # Один GROUP BY на пачку ігор; рядки ігор заблоковані, щоб нові відгуки не загубились
+        games = list(Game.objects.select_for_update().filter(id__in=ids).only("id", *Game.REVIEW_STAT_FIELDS))
+        rows = Review.objects.filter(game_id__in=ids).values("game_id").order_by().annotate(
+            review_count=Count("id"),
+            review_sum=Sum("rating"),
+            **{f"reviews_{n}": Count("id", filter=Q(rating=n)) for n in range(1, 6)},
+        )
+        actual = {row.pop("game_id"): row for row in rows}
+
+        changed = []
+        for game in games:
+            stats = actual.get(game.id, {})
+            expected = {field: stats.get(field) or 0 for field in Game.REVIEW_STAT_FIELDS}
+            if any(getattr(game, field) != value for field, value in expected.items()):
+                for field, value in expected.items():
+                    setattr(game, field, value)
+                changed.append(game)
+        Game.objects.bulk_update(changed, Game.REVIEW_STAT_FIELDS)
+        for game in changed:
+            game_detail_cache.invalidate(game.id)
+        return len(changed)
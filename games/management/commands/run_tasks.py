@@ -0,0 +1,121 @@
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from games import sessions, tasks
+from games.caching import is_shared_cache
+
+logger = logging.getLogger(__name__)
+
+PURGE_INTERVAL = 60 * 60
+
+
+def _serve(threads, poll_interval, once):
+    worker = tasks.Worker(threads=threads, poll_interval=poll_interval, once=once)
+    # SIGTERM (systemd, docker stop) - дочекатися поточних задач і вийти
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: worker.stop())
+    worker.run()
+
+
+class Command(BaseCommand):
+    help = "Воркер фонових задач (games.tasks): пул процесів, у кожному - пул потоків"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=1)
+        parser.add_argument("--threads", type=int, default=4, help="потоків у кожному процесі")
+        parser.add_argument("--poll-interval", type=float, default=tasks.POLL_INTERVAL, help="с між перевірками порожньої черги")
+        parser.add_argument("--once", action="store_true", help="виконати готові задачі і вийти")
+
+    def handle(self, *args, **options):
+        # Задачі скидають кеші (куплені ігри, кошик, сторінка гри) - з LocMemCache воркера
+        # ці інвалідації до веб-процесів не дійдуть
+        for alias in {"default", getattr(settings, "GAMES_DETAIL_CACHE", "default")}:
+            if not is_shared_cache(alias):
+                raise CommandError(
+                    f"Cache '{alias}' is local to this process: configure a shared cache "
+                    "(GAMES_REDIS_URL) or run tasks in the web process with GAMES_TASKS_EAGER = True"
+                )
+        self.stdout.write(
+            f"Task worker: {options['processes']} process(es) x {options['threads']} thread(s)"
+        )
+        purged = tasks.purge()
+        if purged:
+            self.stdout.write(f"Purged {purged} finished tasks")
+
+        worker_args = (options["threads"], options["poll_interval"], options["once"])
+        if options["processes"] <= 1:
+            if not options["once"]:
+                self.start_purger()
+                self.start_session_flusher()
+            _serve(*worker_args)
+            if options["once"]:
+                self.flush_sessions()
+            return
+
+        # З'єднання з БД не можна ділити з дочірніми процесами після fork
+        connections.close_all()
+        # fork: дочірні процеси успадковують налаштований Django
+        context = multiprocessing.get_context("fork")
+        processes = [
+            context.Process(target=_serve, args=worker_args, name=f"tasks-{i}")
+            for i in range(options["processes"])
+        ]
+        for process in processes:
+            process.start()
+
+        def stop(*args):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        # Ctrl+C отримує вся група процесів - дочірні зупиняться самі
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        if not options["once"]:
+            self.start_purger()
+            self.start_session_flusher()
+        for process in processes:
+            process.join()
+        if options["once"]:
+            self.flush_sessions()
+
+    def start_purger(self):
+        def purge():
+            while True:
+                time.sleep(PURGE_INTERVAL)
+                tasks.purge()
+                connection.close()
+
+        threading.Thread(target=purge, name="tasks-purge", daemon=True).start()
+
+    def start_session_flusher(self):
+        # GAMES_SESSION_WRITE_BEHIND: зміни сесій з кешу - в django_session раз на інтервал
+        interval = sessions.write_behind_interval()
+        if not interval:
+            return
+
+        def flush():
+            while True:
+                time.sleep(interval)
+                try:
+                    sessions.flush_dirty()
+                except Exception:
+                    # Наступний запуск підхопить той самий індекс
+                    logger.exception("Session flush failed")
+                finally:
+                    connection.close()
+
+        threading.Thread(target=flush, name="sessions-flush", daemon=True).start()
+
+    def flush_sessions(self):
+        if sessions.write_behind_interval():
+            # Другий виклик - записи, що додались у індекс під час першого
+            flushed = sessions.flush_dirty() + sessions.flush_dirty()
+            self.stdout.write(f"Flushed {flushed} sessions")
@@ -0,0 +1,167 @@
+"""
+Роздача медіафайлів (/media/): аватари, обкладинки, скріншоти та їхні варіанти.
+
+URL зображень містять хеш вмісту: /media/games/foo.jpg?v=<hash>. Такий URL
+ніколи не змінює вміст, тож відповідь на нього кешується назавжди
+(immutable) - повторний перегляд сторінки не робить жодного запиту за
+картинками. Хеш рахується один раз, коли games.images будує варіанти, і
+зберігається разом з ними (*_variants['versions']); запит його не рахує.
+Поки варіантів немає, URL без хешу - з перевіркою кешу.
+
+serve_media відповідає на умовні запити (ETag з часу зміни і розміру, Last-Modified) і Range
+(одним діапазоном). Якщо перед Django стоїть nginx/Apache, GAMES_MEDIA_SENDFILE
+віддає передачу файлу їм через X-Accel-Redirect / X-Sendfile - воркер Python
+лише перевіряє шлях і ставить заголовки.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views.decorators.http import require_safe
+
+VERSION_LENGTH = 12
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def content_version(chunks):
+    """Хеш вмісту для ?v= з ітератора байтів (File.chunks(), [buffer.getvalue()])."""
+    digest = hashlib.md5()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()[:VERSION_LENGTH]
+
+
+def versioned_url(storage, name, version):
+    url = storage.url(name)
+    return f"{url}?v={version}" if version else url
+
+
+def _parse_range(header, size):
+    """(start, end) включно, None - віддати файл повністю, False - діапазон поза файлом."""
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        # Кілька діапазонів чи інші одиниці - дозволено відповісти повним файлом
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-500 - останні 500 байт
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get('if-range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _read_range(path, start, end):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _offload(path, name):
+    mode = getattr(settings, 'GAMES_MEDIA_SENDFILE', '')
+    response = HttpResponse()
+    if mode == 'x-accel-redirect':
+        # Внутрішній location nginx (internal), що дивиться в MEDIA_ROOT
+        response['X-Accel-Redirect'] = settings.GAMES_MEDIA_ACCEL_PREFIX + quote(name)
+    else:
+        response['X-Sendfile'] = path
+    # Діапазони, довжину і сам файл віддає фронт-сервер
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Not found")
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404("Not found")
+    if not os.path.isfile(full_path):
+        raise Http404("Not found")
+
+    name = os.path.relpath(full_path, settings.MEDIA_ROOT).replace(os.sep, '/')
+    # Без читання файлу: хеш вмісту є лише в URL, який будує сторінка
+    etag = quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if getattr(settings, 'GAMES_MEDIA_SENDFILE', ''):
+            response = _offload(full_path, name)
+        else:
+            response = _file_response(request, full_path, stat.st_size, etag, last_modified)
+        content_type, encoding = mimetypes.guess_type(full_path)
+        response['Content-Type'] = content_type or 'application/octet-stream'
+        if encoding:
+            response['Content-Encoding'] = encoding
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if request.GET.get('v'):
+        # URL з хешем вмісту ніколи не зміниться: новий вміст - новий хеш у *_variants
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        # Старий або відсутній хеш - кешувати можна, але з перевіркою
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+def _file_response(request, full_path, size, etag, last_modified):
+    byte_range = None
+    if 'range' in request.headers and _if_range_matches(request, etag, last_modified):
+        byte_range = _parse_range(request.headers['range'], size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{size}"
+    elif byte_range is None:
+        if request.method == 'HEAD':
+            response = HttpResponse()
+        else:
+            response = FileResponse(open(full_path, 'rb'))
+        response['Content-Length'] = str(size)
+    else:
+        start, end = byte_range
+        if request.method == 'HEAD':
+            response = HttpResponse(status=206)
+        else:
+            response = StreamingHttpResponse(_read_range(full_path, start, end), status=206)
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    return response
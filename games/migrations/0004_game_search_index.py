@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-18 10:00
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS games_game_fts USING fts5("
+        "title, description, genre, tokenize='unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO games_game_fts (rowid, title, description, genre) "
+        "SELECT id, title, description, genre FROM games_game"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS games_game_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0003_alter_message_receiver'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
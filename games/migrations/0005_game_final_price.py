@@ -0,0 +1,20 @@
+# Generated by Django 6.0 on 2026-10-18 13:40
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0004_game_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='final_price',
+            field=models.GeneratedField(db_index=True, db_persist=True, expression=django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Cast('price', models.FloatField()), '*', django.db.models.expressions.CombinedExpression(models.Value(100), '-', models.F('discount'))), '/', models.Value(100)), output_field=models.DecimalField(decimal_places=2, max_digits=10)),
+        ),
+    ]
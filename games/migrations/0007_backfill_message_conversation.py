@@ -0,0 +1,49 @@
+# Generated by Django 6.0 on 2026-10-18 14:00
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def backfill_conversations(apps, schema_editor):
+    Conversation = apps.get_model('games', 'Conversation')
+    Message = apps.get_model('games', 'Message')
+
+    pairs = set()
+    for sender_id, receiver_id in Message.objects.values_list('sender_id', 'receiver_id').distinct().iterator():
+        pairs.add(tuple(sorted((sender_id, receiver_id))))
+    Conversation.objects.bulk_create(
+        [Conversation(first_user_id=first, second_user_id=second) for first, second in pairs],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    conversation_ids = {
+        (first, second): pk
+        for pk, first, second in Conversation.objects.values_list('id', 'first_user_id', 'second_user_id')
+    }
+
+    # Пачками по id, щоб не тримати всю таблицю повідомлень у пам'яті
+    last_id = 0
+    while True:
+        batch = list(
+            Message.objects.filter(id__gt=last_id)
+            .order_by('id')
+            .only('id', 'sender_id', 'receiver_id')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for message in batch:
+            message.conversation_id = conversation_ids[tuple(sorted((message.sender_id, message.receiver_id)))]
+        Message.objects.bulk_update(batch, ['conversation'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0006_conversation'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 14:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0007_backfill_message_conversation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='conversation',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='games.conversation'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'timestamp', 'id'], name='message_history_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-18 15:00
+
+from django.db import migrations, models
+
+
+def backfill_unread_counters(apps, schema_editor):
+    Conversation = apps.get_model('games', 'Conversation')
+    Message = apps.get_model('games', 'Message')
+
+    unread = (
+        Message.objects.filter(is_read=False)
+        .exclude(sender_id=models.F('receiver_id'))
+        .values('conversation_id', 'receiver_id')
+        .annotate(count=models.Count('id'))
+        .order_by()
+    )
+    pairs = dict(Conversation.objects.values_list('id', 'first_user_id'))
+    for row in unread.iterator():
+        field = 'first_unread' if row['receiver_id'] == pairs[row['conversation_id']] else 'second_unread'
+        Conversation.objects.filter(pk=row['conversation_id']).update(**{field: row['count']})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0008_message_history_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='first_unread',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='second_unread',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_unread_counters, migrations.RunPython.noop),
+    ]
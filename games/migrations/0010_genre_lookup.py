@@ -0,0 +1,40 @@
+# Generated by Django 6.0 on 2026-10-18 16:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_genres(apps, schema_editor):
+    Genre = apps.get_model('games', 'Genre')
+    Game = apps.get_model('games', 'Game')
+
+    names = Game.objects.exclude(genre='').values_list('genre', flat=True).distinct()
+    Genre.objects.bulk_create([Genre(name=name) for name in names], ignore_conflicts=True)
+    for genre in Genre.objects.all():
+        Game.objects.filter(genre=genre.name).update(genre_ref=genre)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0009_conversation_unread_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Genre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='genre_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='games', to='games.genre'),
+        ),
+        migrations.RunPython(backfill_genres, migrations.RunPython.noop),
+    ]
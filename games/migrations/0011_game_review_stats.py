@@ -0,0 +1,75 @@
+# Generated by Django 6.0 on 2026-10-18 17:00
+
+import django.core.validators
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+def backfill_review_stats(apps, schema_editor):
+    Game = apps.get_model('games', 'Game')
+    Review = apps.get_model('games', 'Review')
+
+    stats = Review.objects.values('game_id').order_by().annotate(
+        review_count=models.Count('id'),
+        review_sum=models.Sum('rating'),
+        **{f'reviews_{n}': models.Count('id', filter=models.Q(rating=n)) for n in range(1, 6)},
+    )
+    for row in stats.iterator():
+        Game.objects.filter(pk=row.pop('game_id')).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0010_genre_lookup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='review_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='reviews_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='reviews_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='reviews_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='reviews_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='reviews_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='rating',
+            field=models.IntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)]),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='review_average',
+            field=models.GeneratedField(db_index=True, db_persist=True, expression=models.Case(models.When(review_count=0, then=models.Value(0.0)), default=django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Cast('review_sum', models.FloatField()), '/', models.F('review_count'))), output_field=models.FloatField()),
+        ),
+        migrations.RunPython(backfill_review_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 6.0 on 2026-10-18 23:00
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+import django.db.models.functions.math
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0016_favorite'),
+    ]
+
+    # Вираз GeneratedField не можна змінити на місці - колонка перестворюється
+    operations = [
+        migrations.RemoveField(
+            model_name='game',
+            name='final_price',
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='final_price',
+            field=models.GeneratedField(db_index=True, db_persist=True, expression=django.db.models.functions.math.Round(django.db.models.functions.comparison.Cast(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Cast('price', models.FloatField()), '*', django.db.models.expressions.CombinedExpression(models.Value(100), '-', models.F('discount'))), '/', models.Value(100)), models.DecimalField(decimal_places=2, max_digits=10)), 2), output_field=models.DecimalField(decimal_places=2, max_digits=10)),
+        ),
+    ]
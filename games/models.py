@@ -1,22 +1,168 @@
-from django.db import models
+import time
+
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import models, transaction
+from django.db.models.functions import Cast, Greatest, Round
 
 # Create your models here.
+class Genre(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+
+    class Meta:
+        ordering = ["name"]
+
+    def __str__(self):
+        return self.name
+
+
+class CatalogVersion(models.Model):
+    """
+    Версія каталогу (games.caching.catalog_version): один рядок у БД, тож її бачать
+    усі процеси - веб-воркери, run_tasks, адмінка. Значення - час останньої зміни
+    в наносекундах; лише зростає, навіть якщо годинники процесів розходяться.
+    """
+    version = models.BigIntegerField()
+
+    @classmethod
+    def current(cls):
+        return cls.objects.get_or_create(pk=1, defaults={'version': time.time_ns()})[0].version
+
+    @classmethod
+    def bump(cls):
+        now = time.time_ns()
+        if not cls.objects.filter(pk=1).update(version=Greatest(models.F('version') + 1, models.Value(now))):
+            cls.objects.get_or_create(pk=1, defaults={'version': now})
+
+
+class GameQuerySet(models.QuerySet):
+    """
+    update() і bulk_create() не шлють сигналів Game і не викликають save() - версію
+    каталогу і genre_ref (з genre) оновлюють самі.
+    """
+    # Поля, яких немає на сторінках каталогу: їх зміна кеш каталогу не скидає
+    NON_CATALOG_FIELDS = {'favorite_count'}
+
+    def update(self, **kwargs):
+        genre = kwargs.get('genre')
+        if 'genre' in kwargs and 'genre_ref' not in kwargs and not hasattr(genre, 'resolve_expression'):
+            kwargs['genre_ref'] = Genre.objects.get_or_create(name=genre)[0] if genre else None
+        rows = super().update(**kwargs)
+        if rows and set(kwargs) - self.NON_CATALOG_FIELDS:
+            from .caching import bump_catalog_version
+            bump_catalog_version()
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        names = {obj.genre for obj in objs if obj.genre}
+        genres = {}
+        if names:
+            Genre.objects.bulk_create([Genre(name=name) for name in names], ignore_conflicts=True)
+            genres = dict(Genre.objects.filter(name__in=names).values_list('name', 'id'))
+        for obj in objs:
+            obj.genre_ref_id = genres.get(obj.genre)
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if objs:
+            from .caching import bump_catalog_version
+            bump_catalog_version()
+        return objs
+
+
 class Game(models.Model):
     title = models.CharField(max_length=100)
     description = models.TextField()
     genre = models.CharField(max_length=50)
+    # Довідник жанрів: фільтри і фасети працюють по індексованому id, а не по тексту.
+    # Заповнюється в save() з genre
+    genre_ref = models.ForeignKey(
+        Genre, related_name="games", null=True, blank=True, editable=False, on_delete=models.PROTECT
+    )
     release_year = models.IntegerField()
     rating = models.FloatField(default=0)
 
     image = models.ImageField(upload_to="games/", blank=True, null=True)
+    # Зменшені копії image в AVIF/WebP/JPEG - заповнює games.images після завантаження
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     discount = models.PositiveIntegerField(default=0, help_text="Знижка у відсотках")
+    # Ціна зі знижкою, яку рахує сама БД (STORED generated column) - щоб фільтрувати
+    # і сортувати по ній в SQL. Оновлюється і при save(), і при queryset.update().
+    # Cast у float, бо SQLite з NUMERIC робить цілочисельне ділення. Round до копійок:
+    # у колонці має бути те саме значення, що читає Django, - по ньому будується курсор
+    final_price = models.GeneratedField(
+        expression=Round(
+            Cast(
+                Cast("price", models.FloatField()) * (100 - models.F("discount")) / 100,
+                models.DecimalField(max_digits=10, decimal_places=2),
+            ),
+            2,
+        ),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        db_persist=True,
+        db_index=True,
+    )
+
+    # Агрегати відгуків: оновлюються атомарно в Review.save() і сигналом post_delete,
+    # виправляються командою recompute_review_stats
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    review_sum = models.PositiveIntegerField(default=0, editable=False)
+    reviews_1 = models.PositiveIntegerField(default=0, editable=False)
+    reviews_2 = models.PositiveIntegerField(default=0, editable=False)
+    reviews_3 = models.PositiveIntegerField(default=0, editable=False)
+    reviews_4 = models.PositiveIntegerField(default=0, editable=False)
+    reviews_5 = models.PositiveIntegerField(default=0, editable=False)
+    # Середня оцінка рахується в БД з review_sum/review_count - сортування каталогу без AVG()
+    review_average = models.GeneratedField(
+        expression=models.Case(
+            models.When(review_count=0, then=models.Value(0.0)),
+            default=Cast("review_sum", models.FloatField()) / models.F("review_count"),
+        ),
+        output_field=models.FloatField(),
+        db_persist=True,
+        db_index=True,
+    )
+
+    REVIEW_STAT_FIELDS = (
+        'review_count', 'review_sum', 'reviews_1', 'reviews_2', 'reviews_3', 'reviews_4', 'reviews_5',
+    )
+    # Скільки користувачів додали гру в бажане: оновлюється в games.favorites,
+    # виправляється командою recompute_favorite_counts
+    favorite_count = models.PositiveIntegerField(default=0, editable=False, db_index=True)
+
+    objects = GameQuerySet.as_manager()
     
     class Meta:
         ordering = ["title"]
     
     def __str__(self):
         return self.title
+
+    def save(self, *args, **kwargs):
+        if self.genre:
+            self.genre_ref = Genre.objects.get_or_create(name=self.genre)[0]
+        else:
+            self.genre_ref = None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'genre' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'genre_ref'}
+        elif update_fields is None and not self._state.adding:
+            # Лічильники відгуків і бажаного та варіанти зображення могли змінитися
+            # після завантаження гри - не перезаписуємо їх
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and not f.generated
+                and f.name not in self.REVIEW_STAT_FIELDS and f.name not in ('image_variants', 'favorite_count')
+            ]
+        super().save(*args, **kwargs)
+
+    def rating_histogram(self):
+        # [(5, кількість, відсоток), ..., (1, ...)]
+        return [
+            (stars, count, round(100 * count / self.review_count) if self.review_count else 0)
+            for stars, count in (
+                (stars, getattr(self, f'reviews_{stars}')) for stars in range(5, 0, -1)
+            )
+        ]
     
     @property
     def sell_price(self):
@@ -27,18 +173,46 @@ class Game(models.Model):
 class Review(models.Model):
     game = models.ForeignKey(Game, on_delete=models.CASCADE)
     text = models.TextField()
-    rating = models.IntegerField()
+    rating = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
+
+    def _update_game_stats(self, sign, game_id=None, rating=None):
+        game_id = self.game_id if game_id is None else game_id
+        rating = self.rating if rating is None else rating
+        stats = {
+            'review_count': models.F('review_count') + sign,
+            'review_sum': models.F('review_sum') + sign * rating,
+        }
+        if 1 <= rating <= 5:
+            field = f'reviews_{rating}'
+            stats[field] = models.F(field) + sign
+        Game.objects.filter(pk=game_id).update(**stats)
+
+    # Видалення (і instance.delete(), і queryset.delete(), і каскад) зменшує агрегати
+    # сигналом post_delete - games.signals.release_review_stats.
+    # Review.objects.update() агрегатів не змінює - після нього recompute_review_stats
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                # Оцінку чи гру могли змінити - агрегати переносяться зі старих значень на нові
+                previous = Review.objects.select_for_update().filter(pk=self.pk).values_list('game_id', 'rating').first()
+            super().save(*args, **kwargs)
+            if previous is None:
+                self._update_game_stats(1)
+            elif previous != (self.game_id, self.rating):
+                self._update_game_stats(-1, *previous)
+                self._update_game_stats(1)
 
 class GameScreenshot(models.Model):
     game = models.ForeignKey(Game, related_name="screenshots", on_delete=models.CASCADE)
     image = models.ImageField(upload_to="game_screenshots/")
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f"Screen for {self.game.title}"
 
 from django.contrib.auth.models import User
 from django.utils import timezone
-from datetime import timedelta
 
 class Profile(models.Model):
     STATUS_CHOICES = (
@@ -53,6 +227,7 @@ class Profile(models.Model):
         default='avatars/default.png',
         blank=True
     )
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
     bio = models.TextField(blank=True)
     status = models.CharField(
         max_length=10,
@@ -62,7 +237,9 @@ class Profile(models.Model):
     last_seen = models.DateTimeField(default=timezone.now)
 
     def is_online(self):
-        return self.last_seen >= timezone.now() - timedelta(minutes=5)
+        # Для списків - presence.online_status() одним викликом на сторінку
+        from .presence import online_status
+        return online_status([self.user_id])[self.user_id]
     
     def __str__(self):
         return self.nickname
@@ -77,6 +254,58 @@ class PurchasedGame(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.game.title}"
+
+
+class Cart(models.Model):
+    # Кошик авторизованого користувача; анонімний кошик - у сесії (див. games.cart)
+    user = models.OneToOneField(User, related_name='cart', on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Cart of {self.user_id}"
+
+
+class CartItem(models.Model):
+    cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
+    game = models.ForeignKey(Game, on_delete=models.CASCADE)
+    added_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('cart', 'game')
+
+    def __str__(self):
+        return f"{self.cart_id} - {self.game_id}"
+
+
+class Order(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('paid', 'Paid'),
+    )
+
+    user = models.ForeignKey(User, related_name='orders', on_delete=models.CASCADE)
+    # id Stripe Checkout Session - ключ ідемпотентності для видачі покупок
+    stripe_session_id = models.CharField(max_length=255, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    paid_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Order {self.pk} ({self.status})"
+
+
+class OrderLine(models.Model):
+    order = models.ForeignKey(Order, related_name='lines', on_delete=models.CASCADE)
+    game = models.ForeignKey(Game, on_delete=models.PROTECT)
+    # Ціна на момент оформлення
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        unique_together = ('order', 'game')
+
+    def __str__(self):
+        return f"{self.order_id} - {self.game_id}"
     
 class Friend(models.Model):
     user = models.ForeignKey(User, related_name='friends', on_delete=models.CASCADE)
@@ -88,14 +317,100 @@ class Friend(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.friend.username}"
+
+
+class ConversationManager(models.Manager):
+    def between(self, user, other, create=False):
+        # Пара користувачів у канонічному порядку: first_user.id <= second_user.id
+        first_id, second_id = sorted((getattr(user, 'pk', user), getattr(other, 'pk', other)))
+        if create:
+            return self.get_or_create(first_user_id=first_id, second_user_id=second_id)[0]
+        return self.filter(first_user_id=first_id, second_user_id=second_id).first()
+
+    def for_user(self, user):
+        return self.filter(models.Q(first_user=user) | models.Q(second_user=user))
+
+    def unread_counts(self, user):
+        # {id співрозмовника: кількість непрочитаних} - один запит по лічильниках
+        counts = {}
+        rows = self.for_user(user).values_list('first_user_id', 'second_user_id', 'first_unread', 'second_unread')
+        for first_id, second_id, first_unread, second_unread in rows:
+            if first_id == user.pk:
+                counts[second_id] = first_unread
+            else:
+                counts[first_id] = second_unread
+        return counts
+
+    def unread_total(self, user):
+        total = self.for_user(user).aggregate(
+            total=models.Sum(models.Case(
+                models.When(first_user=user, then='first_unread'),
+                default='second_unread',
+            ))
+        )['total']
+        return total or 0
+
+
+class Conversation(models.Model):
+    first_user = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    second_user = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Денормалізовані лічильники непрочитаних для кожного учасника
+    first_unread = models.PositiveIntegerField(default=0)
+    second_unread = models.PositiveIntegerField(default=0)
+
+    objects = ConversationManager()
+
+    class Meta:
+        unique_together = ('first_user', 'second_user')
+
+    def __str__(self):
+        return f"{self.first_user_id} - {self.second_user_id}"
+
+    @staticmethod
+    def unread_field(user_id, other_id):
+        # Канонічний порядок пари: менший id - first_user
+        return 'first_unread' if user_id <= other_id else 'second_unread'
+
+    def mark_read(self, user):
+        user_id = getattr(user, 'pk', user)
+        with transaction.atomic():
+            updated = self.messages.filter(receiver_id=user_id, is_read=False).update(is_read=True)
+            if updated:
+                # Віднімаємо саме стільки, скільки позначили: повідомлення, що прийшли
+                # паралельно, залишаться в лічильнику
+                other_id = self.second_user_id if user_id == self.first_user_id else self.first_user_id
+                field = self.unread_field(user_id, other_id)
+                Conversation.objects.filter(pk=self.pk).update(
+                    **{field: Greatest(models.F(field) - updated, 0)}
+                )
+        return updated
+
     
 class Message(models.Model):
+    conversation = models.ForeignKey(Conversation, related_name='messages', on_delete=models.CASCADE)
     sender = models.ForeignKey(User, related_name='sent_messages', on_delete=models.CASCADE)
     receiver = models.ForeignKey(User, related_name='received_messages', on_delete=models.CASCADE)
     text = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Історія розмови - один range scan по індексу
+            models.Index(fields=['conversation', 'timestamp', 'id'], name='message_history_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            if self.conversation_id is None:
+                self.conversation = Conversation.objects.between(self.sender_id, self.receiver_id, create=True)
+            super().save(*args, **kwargs)
+            if adding and not self.is_read and self.sender_id != self.receiver_id:
+                field = Conversation.unread_field(self.receiver_id, self.sender_id)
+                Conversation.objects.filter(pk=self.conversation_id).update(**{field: models.F(field) + 1})
+
     def __str__(self):
         return f"{self.sender} - {self.receiver}"
     
@@ -138,3 +453,53 @@ class FriendRequest(models.Model):
 
     def __str__(self):
         return f"{self.sender} - {self.receiver} : {self.status}"
+
+
+class Task(models.Model):
+    """Фонова задача (games.tasks): виконується командою run_tasks."""
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    name = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict)
+    # Ключ ідемпотентності: поки задача з ключем є в таблиці, друга не створюється
+    key = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    # Не раніше цього часу (затримка або пауза перед повтором)
+    run_at = models.DateTimeField(default=timezone.now)
+    # Оренда воркера: якщо він впав, після цього часу задачу візьме інший
+    locked_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # Вибірка наступних задач воркером
+            models.Index(fields=['status', 'run_at'], name='task_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
+class Favorite(models.Model):
+    user = models.ForeignKey(User, related_name='favorites', on_delete=models.CASCADE)
+    game = models.ForeignKey(Game, related_name='favorited_by', on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Індекс (user, game) - і захист від дублів, і вибірка списку користувача
+            models.UniqueConstraint(fields=['user', 'game'], name='favorite_user_game_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.game_id}"
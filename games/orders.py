@@ -0,0 +1,126 @@
+"""
+Замовлення і видача покупок.
+
+stripe_checkout створює Order зі знімком цін, ключ - id Stripe Checkout Session.
+Оплату підтверджує Stripe: вебхук checkout.session.completed або перевірка
+сесії через API на payment_success. Обидва шляхи лише ставлять задачу
+(games.tasks) з ключем за id сесії і одразу відповідають; fulfill_order
+ідемпотентний - повторний вебхук чи оновлення сторінки нічого не дублюють.
+Після видачі - задача з листом-квитанцією.
+"""
+import stripe
+from django.core.cache import cache
+from django.core.mail import send_mail
+from django.db import transaction
+from django.utils import timezone
+
+from . import tasks
+from .cart import cart_count_key
+from .models import CartItem, Order, OrderLine, PurchasedGame
+from .ownership import invalidate_owned_games
+
+# Події Stripe, після яких сесія може бути оплачена
+FULFILLMENT_EVENTS = ('checkout.session.completed', 'checkout.session.async_payment_succeeded')
+
+
+def create_order(user, stripe_session_id, games):
+    """games - рядки з 'id' і 'final_price' (знімок цін кошика)."""
+    with transaction.atomic():
+        order = Order.objects.create(
+            user=user,
+            stripe_session_id=stripe_session_id,
+            total=sum(game['final_price'] for game in games),
+        )
+        OrderLine.objects.bulk_create(
+            [OrderLine(order=order, game_id=game['id'], price=game['final_price']) for game in games]
+        )
+    return order
+
+
+def fulfill_order(stripe_session_id):
+    """Видає всі ігри замовлення одним bulk_create. Повертає Order або None."""
+    with transaction.atomic():
+        order = Order.objects.select_for_update().filter(stripe_session_id=stripe_session_id).first()
+        if order is None or order.status == 'paid':
+            return order
+
+        game_ids = list(order.lines.values_list('game_id', flat=True))
+        PurchasedGame.objects.bulk_create(
+            [PurchasedGame(user_id=order.user_id, game_id=game_id) for game_id in game_ids],
+            ignore_conflicts=True,
+        )
+        CartItem.objects.filter(cart__user_id=order.user_id, game_id__in=game_ids).delete()
+        # Лічильник кошика в навбарі - одразу і ще раз після коміту
+        cache.delete(cart_count_key(order.user_id))
+        transaction.on_commit(lambda: cache.delete(cart_count_key(order.user_id)))
+        invalidate_owned_games(order.user_id)
+
+        order.status = 'paid'
+        order.paid_at = timezone.now()
+        order.save(update_fields=['status', 'paid_at'])
+        # В тій самій транзакції: квитанція буде рівно тоді, коли видано покупки
+        tasks.enqueue(send_receipt, key=f"receipt:{order.pk}", order_id=order.pk)
+    return order
+
+
+def session_is_paid(session):
+    return session['payment_status'] in ('paid', 'no_payment_required')
+
+
+def confirm_checkout_session(stripe_session_id):
+    """Питає Stripe про стан сесії і видає покупки, якщо її оплачено."""
+    session = stripe.checkout.Session.retrieve(stripe_session_id)
+    if not session_is_paid(session):
+        return None
+    return fulfill_order(session['id'])
+
+
+class PaymentPending(Exception):
+    """Stripe ще не підтвердив оплату - задача повториться пізніше."""
+
+
+@tasks.task(max_attempts=6, retry_delay=5)
+def confirm_checkout(stripe_session_id):
+    if confirm_checkout_session(stripe_session_id) is None:
+        raise PaymentPending(stripe_session_id)
+
+
+@tasks.task()
+def fulfill(stripe_session_id):
+    fulfill_order(stripe_session_id)
+
+
+def enqueue_confirmation(stripe_session_id, restart=False):
+    # Оновлення сторінки успіху не ставить нових запитів до Stripe. restart - перевірку,
+    # що вичерпала спроби, почати знову (ключ тримається до purge)
+    return tasks.enqueue(
+        confirm_checkout, key=f"confirm:{stripe_session_id}", restart_failed=restart,
+        stripe_session_id=stripe_session_id,
+    )
+
+
+def handle_webhook_event(event):
+    """Ставить видачу покупок у чергу. Повертає Task або None, якщо подія не про оплату."""
+    if event['type'] not in FULFILLMENT_EVENTS:
+        return None
+    session = event['data']['object']
+    if not session_is_paid(session):
+        return None
+    # Stripe повторює вебхуки - ключ за сесією, а не за подією: completed і
+    # async_payment_succeeded однієї сесії теж дають одну видачу
+    return tasks.enqueue(fulfill, key=f"fulfill:{session['id']}", stripe_session_id=session['id'])
+
+
+@tasks.task()
+def send_receipt(order_id):
+    order = Order.objects.select_related('user').filter(pk=order_id).first()
+    if order is None or not order.user.email:
+        return
+    titles = order.lines.order_by('game__title').values_list('game__title', 'price')
+    lines = "\n".join(f"  {title} - {price} грн" for title, price in titles)
+    send_mail(
+        f"GameHub: замовлення #{order.pk}",
+        f"Дякуємо за покупку! Ігри вже у вашій бібліотеці:\n\n{lines}\n\nРазом: {order.total} грн",
+        None,
+        [order.user.email],
+    )
@@ -0,0 +1,44 @@
+"""
+Множина id ігор, якими володіє користувач.
+
+Завантажується одним values_list по PurchasedGame, кешується в спільному кеші
+і ще раз на об'єкті request - скільки б перевірок "вже куплено" не було на
+сторінці, це не більше одного звернення до кешу за запит. Скидається при
+видачі покупок (fulfill_order) і зміні PurchasedGame (сигнали).
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import PurchasedGame
+
+OWNED_TTL = 60 * 60
+REQUEST_ATTR = '_owned_game_ids'
+
+
+def owned_games_key(user_id):
+    return f"games:owned:{user_id}"
+
+
+def owned_game_ids(user_id):
+    return cache.get_or_set(
+        owned_games_key(user_id),
+        lambda: frozenset(PurchasedGame.objects.filter(user_id=user_id).values_list('game_id', flat=True)),
+        OWNED_TTL,
+    )
+
+
+def request_owned_game_ids(request):
+    """Ігри поточного користувача, один раз за запит. Для анонімних - порожня множина."""
+    if not request.user.is_authenticated:
+        return frozenset()
+    owned = getattr(request, REQUEST_ATTR, None)
+    if owned is None:
+        owned = owned_game_ids(request.user.pk)
+        setattr(request, REQUEST_ATTR, owned)
+    return owned
+
+
+def invalidate_owned_games(user_id):
+    cache.delete(owned_games_key(user_id))
+    # Повторно після коміту: паралельний запит міг закешувати старий набір
+    transaction.on_commit(lambda: cache.delete(owned_games_key(user_id)))
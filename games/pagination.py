@@ -0,0 +1,161 @@
+import base64
+import datetime
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import GeneratedField, Q
+
+# Скільки секунд кешується приблизна кількість ігор у каталозі
+APPROXIMATE_COUNT_TTL = 300
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder обрізає мікросекунди, а курсору потрібне точне значення
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values, reverse=False):
+    payload = json.dumps(
+        {"v": list(values), "r": reverse}, separators=(",", ":"), cls=CursorEncoder
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values, reverse = payload["v"], bool(payload["r"])
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values, reverse
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class CursorPaginator:
+    """
+    Keyset-пагінація: замість OFFSET фільтрує за останнім рядком сторінки
+    (title > X OR (title = X AND id > Y)), тому глибокі сторінки не повільніші
+    за першу і не потрібен COUNT(*).
+    Ключ (title, id) збігається з Game.Meta.ordering + id для унікальності.
+    Поля з "-" сортуються за спаданням, як в order_by().
+    """
+
+    def __init__(self, queryset, per_page, ordering=("title", "id")):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+        self.fields = [f.lstrip("-") for f in ordering]
+
+    def _keyset_filter(self, values, reverse):
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            descending = field.startswith("-")
+            lookup = "lt" if descending != reverse else "gt"
+            step = Q(**{f"{self.fields[i]}__{lookup}": values[i]})
+            for prev_field, prev_value in zip(self.fields[:i], values[:i]):
+                step &= Q(**{prev_field: prev_value})
+            condition |= step
+        return condition
+
+    def _clean(self, values, cursor):
+        # Курсор приходить від клієнта: кожне значення приводиться до типу свого поля
+        if len(values) != len(self.fields):
+            raise InvalidCursor(cursor)
+        cleaned = []
+        for name, value in zip(self.fields, values):
+            if value is None or isinstance(value, (list, dict)):
+                raise InvalidCursor(cursor)
+            try:
+                field = self.queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                cleaned.append(value)
+                continue
+            if isinstance(field, GeneratedField):
+                field = field.output_field
+            try:
+                cleaned.append(field.to_python(value))
+            except ValidationError:
+                raise InvalidCursor(cursor)
+        return cleaned
+
+    def _order_by(self, reverse):
+        if not reverse:
+            return list(self.ordering)
+        return [f[1:] if f.startswith("-") else f"-{f}" for f in self.ordering]
+
+    def _key(self, obj):
+        # obj - модель або dict з .values()
+        if isinstance(obj, dict):
+            return [obj[field] for field in self.fields]
+        return [getattr(obj, field) for field in self.fields]
+
+    def page(self, cursor=None):
+        values, reverse = (None, False)
+        if cursor:
+            values, reverse = decode_cursor(cursor)
+            values = self._clean(values, cursor)
+
+        queryset = self.queryset.order_by(*self._order_by(reverse))
+        if values is not None:
+            queryset = queryset.filter(self._keyset_filter(values, reverse))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        # При русі назад "ще є рядки" означає попередню сторінку, а не наступну
+        if reverse:
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = encode_cursor(self._key(rows[-1]))
+        if rows and has_previous:
+            previous_cursor = encode_cursor(self._key(rows[0]), reverse=True)
+        return CursorPage(rows, next_cursor, previous_cursor)
+
+
+def approximate_count(queryset, key):
+    """Кількість рядків з кешу: точна на момент підрахунку, оновлюється раз на TTL."""
+    digest = hashlib.md5(key.encode()).hexdigest()
+    cache_key = f"games:approx_count:{digest}"
+    count = cache.get(cache_key)
+    if count is None:
+        count = queryset.count()
+        cache.set(cache_key, count, APPROXIMATE_COUNT_TTL)
+    return count
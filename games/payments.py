@@ -0,0 +1,130 @@
+"""
+Асинхронний клієнт Stripe для checkout під ASGI (gamehub/asgi.py).
+
+Поки Stripe відповідає, async view не тримає воркер: на одному event loop
+чекають сотні запитів. Налаштування клієнта:
+  - пул httpx-з'єднань з keep-alive, один на event loop (з'єднання прив'язані
+    до циклу, тому спільний пул між циклами неможливий);
+  - короткі таймаути замість стандартних 80 с stripe;
+  - повтори з експоненційною затримкою (max_network_retries у stripe, POST
+    отримує Idempotency-Key, тож повтор не створить другої сесії);
+  - circuit breaker: після CIRCUIT_FAILURES помилок поспіль запити не
+    відправляються CIRCUIT_RESET секунд, потім пропускається один пробний.
+"""
+import asyncio
+import ssl
+import threading
+import time
+import weakref
+
+import httpx
+import stripe
+from django.conf import settings
+
+CONNECT_TIMEOUT = 3
+READ_TIMEOUT = 10
+POOL_SIZE = 20
+KEEPALIVE_EXPIRY = 30
+MAX_RETRIES = 2
+CIRCUIT_FAILURES = 5
+CIRCUIT_RESET = 30
+
+
+class CircuitOpenError(stripe.error.APIConnectionError):
+    """Stripe вважається недоступним - запит не відправлявся."""
+
+
+class CircuitBreaker:
+
+    def __init__(self, failures=CIRCUIT_FAILURES, reset_timeout=CIRCUIT_RESET):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failed = 0
+        self._opened_at = None
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return 'open'
+            return 'half_open'
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            # Пробний запит; решта чекають ще reset_timeout, поки він не вдасться
+            self._opened_at = time.monotonic()
+            return True
+
+    def success(self):
+        with self._lock:
+            self._failed = 0
+            self._opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self._failed += 1
+            if self._failed >= self.failures:
+                self._opened_at = time.monotonic()
+
+
+class PooledHTTPXClient(stripe.HTTPXClient):
+    """HTTPXClient stripe з обмеженим пулом з'єднань і circuit breaker."""
+
+    def __init__(self, breaker, **kwargs):
+        kwargs.setdefault('timeout', httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT))
+        super().__init__(**kwargs)
+        self.breaker = breaker
+        # Стандартний AsyncClient stripe створює без лімітів пулу - замінюємо своїм
+        self._client_async = httpx.AsyncClient(
+            verify=ssl.create_default_context(cafile=stripe.ca_bundle_path),
+            limits=httpx.Limits(
+                max_connections=POOL_SIZE,
+                max_keepalive_connections=POOL_SIZE,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+        )
+
+    async def request_async(self, method, url, headers, post_data=None):
+        if not self.breaker.allow():
+            raise CircuitOpenError("Stripe is unavailable, circuit breaker is open")
+        try:
+            response = await super().request_async(method, url, headers, post_data)
+        except stripe.error.APIConnectionError:
+            self.breaker.failure()
+            raise
+        # 4xx - помилка запиту, а не недоступність Stripe
+        if response[1] >= 500:
+            self.breaker.failure()
+        else:
+            self.breaker.success()
+        return response
+
+
+breaker = CircuitBreaker()
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_stripe_client():
+    """StripeClient з пулом з'єднань поточного event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = stripe.StripeClient(
+            settings.STRIPE_SECRET_KEY,
+            base_addresses={'api': stripe.api_base},
+            max_network_retries=MAX_RETRIES,
+            http_client=PooledHTTPXClient(breaker),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def create_checkout_session(params):
+    return await get_stripe_client().v1.checkout.sessions.create_async(params)
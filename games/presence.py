@@ -0,0 +1,232 @@
+"""
+Присутність користувачів.
+
+Heartbeat (PresenceMiddleware, на кожен запит) пишеться в TTL-сховище:
+InMemoryPresenceStore - пам'ять процесу, CachePresenceStore - спільний кеш
+Django для кількох воркерів. Profile.last_seen оновлюється не на кожен запит,
+а пачками, не частіше ніж раз на LAST_SEEN_FLUSH_INTERVAL для користувача.
+"""
+import threading
+from datetime import timedelta
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Profile
+
+# Скільки часу після останнього heartbeat користувач вважається онлайн
+ONLINE_TTL = timedelta(minutes=5)
+# Не частіше одного запису в сховище на користувача за цей час
+HEARTBEAT_INTERVAL = timedelta(seconds=30)
+# Не частіше одного запису last_seen в БД на користувача за цей час
+LAST_SEEN_FLUSH_INTERVAL = timedelta(minutes=5)
+# last_seen у БД відстає від heartbeat до LAST_SEEN_FLUSH_INTERVAL - поріг для запасного варіанту
+DB_ONLINE_THRESHOLD = ONLINE_TTL + LAST_SEEN_FLUSH_INTERVAL
+FLUSH_BATCH_SIZE = 500
+
+
+class BasePresenceStore:
+    def touch(self, user_id, timestamp):
+        raise NotImplementedError
+
+    def remove(self, user_id):
+        raise NotImplementedError
+
+    def last_seen_many(self, user_ids):
+        """{user_id: timestamp} лише для тих, у кого TTL ще не минув."""
+        raise NotImplementedError
+
+
+class InMemoryPresenceStore(BasePresenceStore):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seen = {}
+        self._last_sweep = timezone.now()
+
+    def touch(self, user_id, timestamp):
+        with self._lock:
+            self._seen[user_id] = timestamp
+            # Прострочені записи прибираються не частіше ніж раз на TTL
+            if timestamp - self._last_sweep >= ONLINE_TTL:
+                threshold = timestamp - ONLINE_TTL
+                self._seen = {uid: ts for uid, ts in self._seen.items() if ts >= threshold}
+                self._last_sweep = timestamp
+
+    def remove(self, user_id):
+        with self._lock:
+            self._seen.pop(user_id, None)
+
+    def last_seen_many(self, user_ids):
+        threshold = timezone.now() - ONLINE_TTL
+        with self._lock:
+            return {
+                uid: self._seen[uid]
+                for uid in user_ids
+                if uid in self._seen and self._seen[uid] >= threshold
+            }
+
+
+class CachePresenceStore(BasePresenceStore):
+    """Спільне сховище в кеші GAMES_PRESENCE_CACHE (за замовчуванням 'default')."""
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, 'GAMES_PRESENCE_CACHE', 'default')]
+
+    def _key(self, user_id):
+        return f"games:presence:{user_id}"
+
+    def touch(self, user_id, timestamp):
+        self.cache.set(self._key(user_id), timestamp, ONLINE_TTL.total_seconds())
+
+    def remove(self, user_id):
+        self.cache.delete(self._key(user_id))
+
+    def last_seen_many(self, user_ids):
+        keys = {self._key(uid): uid for uid in user_ids}
+        return {keys[key]: ts for key, ts in self.cache.get_many(keys).items()}
+
+
+class PresenceTracker:
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._touched = {}   # user_id -> останній запис у сховище
+        self._flushed = {}   # user_id -> останній запис last_seen у БД
+        self._pending = {}   # user_id -> last_seen для наступного flush
+        self._last_flush = timezone.now()
+
+    def heartbeat(self, user_id, now=None):
+        now = now or timezone.now()
+        touch, due = self._mark(user_id, now)
+        if touch:
+            self.store.touch(user_id, now)
+        if due:
+            self.flush(now)
+
+    async def aheartbeat(self, user_id, now=None):
+        # Запис у сховище і БД - не частіше HEARTBEAT_INTERVAL/FLUSH, тож потік потрібен рідко
+        now = now or timezone.now()
+        touch, due = self._mark(user_id, now)
+        if touch:
+            await sync_to_async(self.store.touch)(user_id, now)
+        if due:
+            await sync_to_async(self.flush)(now)
+
+    def _mark(self, user_id, now):
+        """Облік у пам'яті без I/O: (чи писати в сховище, чи скидати last_seen у БД)."""
+        with self._lock:
+            touched = self._touched.get(user_id)
+            touch = touched is None or now - touched >= HEARTBEAT_INTERVAL
+            if touch:
+                self._touched[user_id] = now
+            flushed = self._flushed.get(user_id)
+            if user_id in self._pending or flushed is None or now - flushed >= LAST_SEEN_FLUSH_INTERVAL:
+                self._pending[user_id] = now
+            due = self._pending and (
+                len(self._pending) >= FLUSH_BATCH_SIZE
+                or now - self._last_flush >= LAST_SEEN_FLUSH_INTERVAL
+            )
+        return touch, bool(due)
+
+    def disconnect(self, user_id):
+        # Після виходу користувач одразу офлайн; last_seen записує logout_view
+        self.store.remove(user_id)
+        with self._lock:
+            self._touched.pop(user_id, None)
+            self._pending.pop(user_id, None)
+
+    def flush(self, now=None):
+        now = now or timezone.now()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = now
+            self._flushed.update(dict.fromkeys(pending, now))
+            # Старі позначки вже нічого не обмежують
+            self._flushed = {
+                uid: ts for uid, ts in self._flushed.items() if now - ts < LAST_SEEN_FLUSH_INTERVAL
+            }
+            self._touched = {
+                uid: ts for uid, ts in self._touched.items() if now - ts < HEARTBEAT_INTERVAL
+            }
+
+        items = list(pending.items())
+        for start in range(0, len(items), FLUSH_BATCH_SIZE):
+            batch = items[start:start + FLUSH_BATCH_SIZE]
+            # Один UPDATE на пачку замість save() на кожного користувача
+            Profile.objects.filter(user_id__in=[uid for uid, _ in batch]).update(
+                last_seen=Case(
+                    *[When(user_id=uid, then=Value(ts)) for uid, ts in batch],
+                    output_field=DateTimeField(),
+                )
+            )
+        return len(items)
+
+    def online_status(self, user_ids):
+        user_ids = set(user_ids)
+        live = self.store.last_seen_many(user_ids)
+        status = {uid: uid in live for uid in user_ids}
+
+        # Кого немає у сховищі (інший воркер, перезапуск) - за last_seen з БД, одним запитом
+        missing = [uid for uid in user_ids if uid not in live]
+        if missing:
+            online = Profile.objects.filter(
+                user_id__in=missing,
+                status='online',
+                last_seen__gte=timezone.now() - DB_ONLINE_THRESHOLD,
+            ).values_list('user_id', flat=True)
+            status.update(dict.fromkeys(online, True))
+        return status
+
+
+_tracker = None
+
+
+def get_tracker():
+    global _tracker
+    if _tracker is None:
+        path = getattr(settings, 'GAMES_PRESENCE_STORE', 'games.presence.InMemoryPresenceStore')
+        _tracker = PresenceTracker(import_string(path)())
+    return _tracker
+
+
+def heartbeat(user_id):
+    get_tracker().heartbeat(user_id)
+
+
+async def aheartbeat(user_id):
+    await get_tracker().aheartbeat(user_id)
+
+
+def online_status(user_ids):
+    """{user_id: True/False} для всіх переданих id - не більше одного запиту до БД."""
+    return get_tracker().online_status(user_ids)
+
+
+class PresenceMiddleware:
+    # Під ASGI працює в event loop - async view (stripe_checkout) не переходять у потік
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.user.is_authenticated:
+            heartbeat(request.user.id)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        user = await request.auser()
+        if user.is_authenticated:
+            await aheartbeat(user.id)
+        return await self.get_response(request)
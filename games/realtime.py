@@ -0,0 +1,141 @@
+"""
+Pub/sub для чату: кожна розмова - окремий канал, WebSocket-з'єднання
+підписуються на нього, chat_view публікує нові повідомлення.
+
+InProcessChatBroker працює в межах одного процесу (runserver, один воркер).
+Для кількох воркерів потрібен спільний брокер - RedisChatBroker.
+"""
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+
+def conversation_channel(user_id, other_id):
+    low, high = sorted((int(user_id), int(other_id)))
+    return f"chat:{low}:{high}"
+
+
+def message_payload(message):
+    # Той самий формат, що й у fetch_messages
+    return {
+        'id': message.id,
+        'sender': message.sender.username,
+        'text': message.text,
+        'timestamp': message.timestamp.isoformat(),
+    }
+
+
+class BaseChatBroker:
+    def publish(self, channel, message):
+        """Синхронна публікація (викликається з view)."""
+        raise NotImplementedError
+
+    async def subscribe(self, channel):
+        """Повертає підписку з корутиною get() -> dict."""
+        raise NotImplementedError
+
+    async def unsubscribe(self, channel, subscription):
+        raise NotImplementedError
+
+
+class _LocalSubscription:
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class InProcessChatBroker(BaseChatBroker):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            # view працює в іншому потоці, ніж event loop з'єднання
+            subscription.loop.call_soon_threadsafe(subscription.queue.put_nowait, message)
+
+    async def subscribe(self, channel):
+        subscription = _LocalSubscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    async def unsubscribe(self, channel, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscribers.get(channel, ()))
+
+
+class _RedisSubscription:
+    def __init__(self, client, pubsub):
+        self.client = client
+        self.pubsub = pubsub
+
+    async def get(self):
+        while True:
+            message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
+            if message is not None:
+                return json.loads(message['data'])
+
+    async def close(self):
+        await self.pubsub.aclose()
+        await self.client.aclose()
+
+
+class RedisChatBroker(BaseChatBroker):
+    """Спільний брокер для кількох процесів. Потрібен пакет redis і GAMES_CHAT_BROKER_URL."""
+
+    def __init__(self):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured("RedisChatBroker requires the 'redis' package")
+        self.url = getattr(settings, 'GAMES_CHAT_BROKER_URL', 'redis://localhost:6379/0')
+        self._publisher = redis.Redis.from_url(self.url)
+
+    def publish(self, channel, message):
+        self._publisher.publish(channel, json.dumps(message))
+
+    async def subscribe(self, channel):
+        import redis.asyncio
+
+        client = redis.asyncio.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(channel)
+        return _RedisSubscription(client, pubsub)
+
+    async def unsubscribe(self, channel, subscription):
+        await subscription.close()
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        path = getattr(settings, 'GAMES_CHAT_BROKER', 'games.realtime.InProcessChatBroker')
+        _broker = import_string(path)()
+    return _broker
+
+
+def publish_message(message):
+    channel = conversation_channel(message.sender_id, message.receiver_id)
+    get_broker().publish(channel, message_payload(message))
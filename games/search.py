@@ -0,0 +1,170 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Game
+
+# Скільки id за замовчуванням повертає search(); search_games() не обмежений -
+# пагінація і COUNT(*) йдуть по самому пошуковому запиту
+SEARCH_RESULT_LIMIT = 500
+
+# Бекенд за замовчуванням для типу БД (connection.vendor)
+VENDOR_BACKENDS = {
+    "sqlite": "games.search.SQLiteFTSBackend",
+}
+DEFAULT_BACKEND = "games.search.DatabaseSearchBackend"
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())
+
+
+class BaseSearchBackend:
+    """Інтерфейс пошукового індексу по Game.title / description / genre."""
+
+    def index(self, game):
+        raise NotImplementedError
+
+    def remove(self, game_id):
+        raise NotImplementedError
+
+    def rebuild(self, batch_size=1000):
+        raise NotImplementedError
+
+    def filter(self, queryset, query):
+        """
+        queryset, обмежений іграми, що відповідають запиту, з alias search_rank
+        (менше - релевантніше). Без обмеження кількості: сторінки і COUNT(*) - в SQL.
+        """
+        raise NotImplementedError
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT, queryset=None):
+        """
+        Повертає список id ігор, відсортований за релевантністю.
+        queryset - фільтри каталогу: застосовуються в самому пошуковому запиті, до limit.
+        """
+        if queryset is None:
+            queryset = Game.objects.all()
+        return list(
+            self.filter(queryset, query).order_by("search_rank", "id").values_list("id", flat=True)[:limit]
+        )
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Запасний бекенд без індексу: звичайний icontains по трьох полях."""
+
+    def index(self, game):
+        pass
+
+    def remove(self, game_id):
+        pass
+
+    def rebuild(self, batch_size=1000):
+        return Game.objects.count()
+
+    def filter(self, queryset, query):
+        condition = Q()
+        for token in tokenize(query):
+            condition &= (
+                Q(title__icontains=token)
+                | Q(genre__icontains=token)
+                | Q(description__icontains=token)
+            )
+        if not condition:
+            return queryset.none()
+        return queryset.filter(condition).alias(search_rank=Value(0.0))
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    Інвертований індекс на FTS5. rowid віртуальної таблиці = Game.id,
+    таблиця створюється міграцією 0004_game_search_index.
+    """
+
+    table = "games_game_fts"
+    # Ваги bm25 для колонок (title, description, genre): назва важливіша за опис
+    weights = (10.0, 1.0, 5.0)
+
+    def index(self, game):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [game.pk])
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, title, description, genre) "
+                "VALUES (%s, %s, %s, %s)",
+                [game.pk, game.title, game.description, game.genre],
+            )
+
+    def remove(self, game_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [game_id])
+
+    def rebuild(self, batch_size=1000):
+        rows = Game.objects.values_list("id", "title", "description", "genre")
+        total = 0
+        batch = []
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+            for row in rows.iterator(chunk_size=batch_size):
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    total += self._insert_many(cursor, batch)
+                    batch = []
+            if batch:
+                total += self._insert_many(cursor, batch)
+        return total
+
+    def _insert_many(self, cursor, rows):
+        cursor.executemany(
+            f"INSERT INTO {self.table} (rowid, title, description, genre) "
+            "VALUES (%s, %s, %s, %s)",
+            rows,
+        )
+        return len(rows)
+
+    def match_expression(self, query):
+        # Кожне слово - префікс ("witch" знайде "Witcher"), слова через AND
+        tokens = tokenize(query)
+        return " ".join(f'"{token}"*' for token in tokens)
+
+    def filter(self, queryset, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return queryset.none()
+        weights = ", ".join(str(w) for w in self.weights)
+        table = queryset.model._meta.db_table
+        matches = RawSQL(f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s", [expression])
+        # bm25 рахується лише всередині MATCH-запиту - корельований підзапит по rowid
+        rank = RawSQL(
+            f"SELECT bm25({self.table}, {weights}) FROM {self.table} "
+            f"WHERE {self.table} MATCH %s AND rowid = {table}.id",
+            [expression],
+            output_field=FloatField(),
+        )
+        return queryset.filter(id__in=matches).alias(search_rank=rank)
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        # GAMES_SEARCH_BACKEND не задано - за типом БД: FTS5 є лише в SQLite
+        path = getattr(settings, "GAMES_SEARCH_BACKEND", None) or VENDOR_BACKENDS.get(
+            connection.vendor, DEFAULT_BACKEND
+        )
+        _backend = import_string(path)()
+    return _backend
+
+
+def search_games(query, queryset=None):
+    """Фільтрує queryset за пошуковим запитом, зберігаючи порядок релевантності."""
+    if queryset is None:
+        queryset = Game.objects.all()
+    return get_backend().filter(queryset, query).order_by("search_rank", "id")
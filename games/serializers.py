@@ -1,9 +1,32 @@
 from rest_framework import serializers
 from .models import *
 from django.contrib.auth.models import User
+from .images import image_representation
+
+
+class ImageVariantsField(serializers.Field):
+    # Файл і його варіанти (games.images): {'url', 'width', 'height', 'srcset': {формат: ...}}
+    def __init__(self, variants_field, **kwargs):
+        self.variants_field = variants_field
+        super().__init__(source='*', read_only=True, **kwargs)
+
+    def to_representation(self, instance):
+        file = getattr(instance, self.field_name)
+        return image_representation(file.name, getattr(instance, self.variants_field), file.storage)
+
 
 class GameSerializer(serializers.ModelSerializer):
     sell_price = serializers.ReadOnlyField()
+    review_average = serializers.FloatField(read_only=True)
+    image = ImageVariantsField('image_variants')
+
+    def __init__(self, *args, **kwargs):
+        # GameSerializer(games, fields=['id', 'title']) - лише вибрані поля
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
     class Meta:
         model = Game
@@ -17,10 +40,14 @@ class GameSerializer(serializers.ModelSerializer):
             'price',
             'discount',
             'sell_price',
+            'review_count',
+            'review_average',
+            'image',
         ]
 
 class ProfileSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user.username')
+    avatar = ImageVariantsField('avatar_variants')
 
     class Meta:
         model = Profile
@@ -29,6 +56,7 @@ class ProfileSerializer(serializers.ModelSerializer):
             'nickname',
             'bio',
             'status',
+            'avatar',
         ]
 
 
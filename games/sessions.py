@@ -0,0 +1,204 @@
+"""
+Сесії для гарячих ключів: кошик і бажане анонімних користувачів.
+
+SESSION_ENGINE = 'games.sessions': як cached_db - читання з кешу
+(SESSION_CACHE_ALIAS), запис і в django_session, і в кеш. Як і з cached_db,
+для кількох процесів кеш має бути спільним (Redis, Memcached), інакше процес
+може читати свою застарілу копію.
+
+Запис у БД:
+  - GAMES_SESSION_WRITE_BEHIND = 0 - одразу (write-through);
+  - GAMES_SESSION_WRITE_BEHIND = N с (лише зі спільним кешем) - нова сесія
+    пишеться в БД одразу, зміни наявної - лише в кеш, а її ключ потрапляє в
+    індекс змінених сесій у тому ж кеші. run_tasks раз на N с записує їх у
+    django_session пачками (flush_dirty) - кілька кліків за інтервал дають
+    один UPDATE. Якщо кеш втратить дані, втрачаються зміни не більше ніж за
+    2N с: flush обробляє індекс із відставанням на один запуск, щоб не
+    пропустити запис, який саме додається.
+
+save() нічого не пише - ні в БД, ні в кеш, - якщо вміст сесії не змінився
+з моменту завантаження: повторне "в кошик" чи перегляд сторінок не дають записів.
+
+Списки id (SessionIds) зберігаються компактно: відсортовані різниці в base36
+через крапку - "5.7.1.2f" замість [5,12,13,100].
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+
+KEY_PREFIX = 'games.sessions'
+# Індекс змінених сесій: лічильник і записи <номер> -> ключ сесії
+DIRTY_SEQ = f'{KEY_PREFIX}:dirty:seq'
+DIRTY_CURSOR = f'{KEY_PREFIX}:dirty:cursor'
+DIRTY_SEEN = f'{KEY_PREFIX}:dirty:seen'
+DIRTY_TTL = 24 * 60 * 60
+FLUSH_BATCH_SIZE = 500
+
+
+def write_behind_interval():
+    return getattr(settings, 'GAMES_SESSION_WRITE_BEHIND', 0)
+
+
+def _dirty_entry(number):
+    return f'{KEY_PREFIX}:dirty:{number}'
+
+
+def _dirty_marker(session_key):
+    return f'{KEY_PREFIX}:dirty-key:{session_key}'
+
+
+def encode_ids(ids):
+    """Множина id -> "5.7.1.2f" (перше число і різниці, base36)."""
+    parts = []
+    previous = 0
+    for game_id in sorted(set(ids)):
+        parts.append(_base36(game_id - previous))
+        previous = game_id
+    return '.'.join(parts)
+
+
+def decode_ids(value):
+    """Зворотне до encode_ids; списки і словники - формат старих сесій."""
+    if not value:
+        return []
+    if isinstance(value, (list, dict)):
+        return sorted({int(game_id) for game_id in value})
+    ids = []
+    current = 0
+    for part in value.split('.'):
+        current += int(part, 36)
+        ids.append(current)
+    return ids
+
+
+def _base36(number):
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    result = ''
+    while True:
+        number, digit = divmod(number, 36)
+        result = digits[digit] + result
+        if not number:
+            return result
+
+
+class SessionIds:
+    """Множина id під ключем сесії. Сесія змінюється, лише якщо змінилась множина."""
+
+    def __init__(self, session, key):
+        self.session = session
+        self.key = key
+
+    def ids(self):
+        return decode_ids(self.session.get(self.key))
+
+    def __contains__(self, game_id):
+        return game_id in set(self.ids())
+
+    def __len__(self):
+        return len(self.ids())
+
+    def _store(self, ids):
+        self.session[self.key] = encode_ids(ids)
+
+    def add(self, game_id):
+        ids = self.ids()
+        if game_id in ids:
+            return False
+        self._store(ids + [game_id])
+        return True
+
+    def remove(self, game_id):
+        ids = self.ids()
+        if game_id not in ids:
+            return False
+        ids.remove(game_id)
+        self._store(ids)
+        return True
+
+    def clear(self):
+        if self.key in self.session:
+            del self.session[self.key]
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = KEY_PREFIX
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._snapshot = None
+
+    def _dumps(self, data):
+        return self.serializer().dumps(data)
+
+    def load(self):
+        data = super().load()
+        self._snapshot = self._dumps(data)
+        return data
+
+    async def aload(self):
+        return await sync_to_async(self.load)()
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        snapshot = self._dumps(data)
+        if not must_create and snapshot == self._snapshot and not settings.SESSION_SAVE_EVERY_REQUEST:
+            # Вміст той самий - ні кешу, ні БД
+            return
+        if not must_create and self._snapshot is not None and write_behind_interval():
+            # Сесія вже є в БД (завантажена) - лише кеш, у БД її запише flush_dirty
+            self._cache.set(self.cache_key, data, self.get_expiry_age())
+            self._mark_dirty()
+        else:
+            # cached_db: спершу django_session, потім кеш
+            super().save(must_create)
+        self._snapshot = snapshot
+
+    def _mark_dirty(self):
+        # Поки ключ уже в індексі (маркер не знято flush_dirty), повторні зміни його не додають
+        if not self._cache.add(_dirty_marker(self.session_key), 1, DIRTY_TTL):
+            return
+        self._cache.add(DIRTY_SEQ, 0, None)
+        number = self._cache.incr(DIRTY_SEQ)
+        self._cache.set(_dirty_entry(number), self.session_key, DIRTY_TTL)
+
+    async def asave(self, must_create=False):
+        return await sync_to_async(self.save)(must_create)
+
+
+def flush_dirty():
+    """
+    Записує змінені сесії з кешу в django_session (GAMES_SESSION_WRITE_BEHIND).
+    Повертає кількість записаних. Викликає run_tasks раз на інтервал.
+    """
+    cache = caches[settings.SESSION_CACHE_ALIAS]
+    cursor = cache.get(DIRTY_CURSOR, 0)
+    seq = cache.get(DIRTY_SEQ, 0)
+    # Номери до seq попереднього запуску: їхні записи точно вже додано
+    upto = min(cache.get(DIRTY_SEEN, cursor), seq)
+    session_keys = []
+    for start in range(cursor + 1, upto + 1, FLUSH_BATCH_SIZE):
+        numbers = range(start, min(start + FLUSH_BATCH_SIZE, upto + 1))
+        entries = cache.get_many([_dirty_entry(number) for number in numbers])
+        session_keys.extend(dict.fromkeys(entries.values()))
+        cache.delete_many(list(entries))
+
+    sessions = []
+    for session_key in dict.fromkeys(session_keys):
+        # Маркер - до читання даних: зміна після цього знову потрапить в індекс
+        cache.delete(_dirty_marker(session_key))
+        store = SessionStore(session_key)
+        data = cache.get(store.cache_key)
+        if data is None:
+            # Сесію видалено (вихід) або кеш її втратив
+            continue
+        store._session_cache = data
+        sessions.append(store.create_model_instance(data))
+    # Лише UPDATE: видалену з БД сесію не відновлюємо
+    Session.objects.bulk_update(sessions, ['session_data', 'expire_date'], batch_size=FLUSH_BATCH_SIZE)
+    cache.set(DIRTY_CURSOR, upto, None)
+    cache.set(DIRTY_SEEN, seq, None)
+    return len(sessions)
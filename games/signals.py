@@ -0,0 +1,102 @@
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.db import transaction
+from django.dispatch import receiver
+
+from .caching import bump_catalog_version, game_detail_cache
+from .cart import merge_session_cart
+from . import images
+from .favorites import merge_session_favorites
+from .friends import invalidate_friends
+from .models import Friend, Game, GameScreenshot, Genre, Profile, PurchasedGame, Review
+from .ownership import invalidate_owned_games
+from .search import get_backend
+
+
+@receiver(post_save, sender=Game)
+def index_game(sender, instance, **kwargs):
+    get_backend().index(instance)
+
+
+@receiver(post_delete, sender=Game)
+def unindex_game(sender, instance, **kwargs):
+    get_backend().remove(instance.pk)
+
+
+def _invalidate_game_detail(game_id):
+    game_detail_cache.invalidate(game_id)
+    # Повторно після коміту: читач міг встигнути покласти в кеш старі дані
+    transaction.on_commit(lambda: game_detail_cache.invalidate(game_id))
+
+
+@receiver([post_save, post_delete], sender=Game)
+def invalidate_game(sender, instance, **kwargs):
+    _invalidate_game_detail(instance.pk)
+    # Нова версія каталогу скидає закешовані фрагменти списку і ETag-и
+    bump_catalog_version()
+
+
+@receiver([post_save, post_delete], sender=GameScreenshot)
+def invalidate_game_screenshots(sender, instance, **kwargs):
+    _invalidate_game_detail(instance.game_id)
+
+
+@receiver(post_delete, sender=Review)
+def release_review_stats(sender, instance, origin=None, **kwargs):
+    # post_delete шлеться і для queryset.delete(), і для каскаду - не лише для instance.delete().
+    # Каскад від видалення самої гри пропускаємо: агрегати зникають разом з нею, N оновлень зайві
+    origin_model = getattr(origin, 'model', None) or type(origin)
+    if issubclass(origin_model, Game):
+        return
+    instance._update_game_stats(-1)
+
+
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_game_reviews(sender, instance, **kwargs):
+    # Версію каталогу змінює Game.objects.update() агрегатів відгуків (GameQuerySet)
+    _invalidate_game_detail(instance.game_id)
+
+
+@receiver([post_save, post_delete], sender=Genre)
+def invalidate_genres(sender, instance, **kwargs):
+    # Довідник жанрів і фасети кешуються з версією каталогу
+    bump_catalog_version()
+
+
+@receiver([post_save, post_delete], sender=PurchasedGame)
+def invalidate_owned(sender, instance, **kwargs):
+    # bulk_create у fulfill_order сигналів не шле - там скидається явно
+    invalidate_owned_games(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Friend)
+def invalidate_friend_set(sender, instance, **kwargs):
+    # Пакетні зміни з games.friends сигналів не шлють і скидають кеш самі;
+    # це - для адмінки і каскадного видалення користувачів
+    invalidate_friends((instance.user_id, instance.friend_id))
+
+
+@receiver(post_save, sender=Game)
+@receiver(post_save, sender=GameScreenshot)
+@receiver(post_save, sender=Profile)
+def schedule_image_derivatives(sender, instance, **kwargs):
+    # Лише якщо файл новий - інакше варіанти вже є
+    images.schedule(instance)
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    merge_session_cart(request, user)
+
+
+@receiver(user_logged_in)
+def merge_favorites_on_login(sender, request, user, **kwargs):
+    merge_session_favorites(request, user)
+
+
+@receiver(pre_delete, sender=User)
+def release_favorite_counts(sender, instance, **kwargs):
+    # Favorite користувача видаляються каскадом, повз games.favorites - лічильники ігор зменшуємо тут
+    Game.objects.filter(favorited_by__user=instance).update(favorite_count=F('favorite_count') - 1)
@@ -0,0 +1,34 @@
+"""
+Статика через WhiteNoise під ASGI.
+
+WhiteNoiseMiddleware лише синхронний: під ASGI Django проганяє через потік увесь
+ланцюжок під ним, разом з async view (stripe_checkout). Тут той самий middleware,
+але з async-гілкою: пошук файлу - словник у пам'яті, потік потрібен лише для
+віддачі самої статики.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise import middleware
+
+
+class WhiteNoiseMiddleware(middleware.WhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
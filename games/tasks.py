@@ -0,0 +1,322 @@
+"""
+Черга фонових задач у таблиці Task.
+
+Повільні побічні дії (перевірка оплати в Stripe, видача покупок з вебхука,
+листи, генерація варіантів зображень) не виконуються в запиті: view кладе
+задачу в чергу і одразу відповідає, задачу виконує воркер - команда run_tasks
+(пул процесів і потоків).
+
+  - enqueue() пише рядок у тій самій транзакції, що й зміни view: задача
+    з'явиться лише якщо транзакція закомітилась, і не загубиться після коміту;
+  - key - ключ ідемпотентності: повторний enqueue з тим самим ключем (повторний
+    вебхук, оновлення сторінки) повертає наявну задачу;
+  - воркер забирає задачу умовним UPDATE (compare-and-set), тож кілька
+    потоків і процесів не виконають її двічі; оренда locked_until повертає
+    задачу в чергу, якщо воркер впав;
+  - помилка - повтор з експоненційною затримкою і jitter, після max_attempts
+    спроб задача позначається failed;
+  - queue_stats() - глибина черги і затримки, для api_task_stats.
+
+Задачі скидають кеші (куплені ігри, кошик, сторінка гри), тож окремий воркер
+можливий лише зі спільним кешем - run_tasks без нього не запускається.
+GAMES_TASKS_EAGER = True (один процес без спільного кешу, розробка) виконує
+задачі в самому веб-процесі: після коміту задача йде в пул потоків (EAGER_THREADS),
+запит на неї не чекає; затримка і повтор після помилки - таймером до run_at.
+Черга в БД та сама, тож задачі, що не встигли до перезапуску процесу, виконає
+наступний enqueue з тим самим ключем або run_tasks. GAMES_TASKS_EAGER_INLINE = True
+виконує задачу прямо в on_commit потоку запиту - лише для тестів.
+"""
+import logging
+import random
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Callable, NamedTuple
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Min, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 5
+RETRY_DELAY = 10
+MAX_RETRY_DELAY = 60 * 60
+LEASE = 5 * 60
+POLL_INTERVAL = 1
+CLAIM_CANDIDATES = 10
+RETENTION = timedelta(days=7)
+METRICS_WINDOW = timedelta(hours=1)
+# Потоків веб-процесу для задач у режимі GAMES_TASKS_EAGER
+EAGER_THREADS = 2
+
+
+class TaskSpec(NamedTuple):
+    func: Callable
+    max_attempts: int
+    retry_delay: float
+
+
+REGISTRY = {}
+
+
+def task(name=None, max_attempts=DEFAULT_MAX_ATTEMPTS, retry_delay=RETRY_DELAY):
+    """Реєструє функцію як задачу. Аргументи задачі - лише іменовані і JSON-серіалізовні."""
+    def decorator(func):
+        func.task_name = name or f"{func.__module__}.{func.__name__}"
+        REGISTRY[func.task_name] = TaskSpec(func, max_attempts, retry_delay)
+        return func
+    return decorator
+
+
+def get_task(name):
+    if name not in REGISTRY:
+        # Модуль задачі ще не імпортовано в цьому процесі - ім'я за замовчуванням є шляхом до неї
+        try:
+            import_string(name)
+        except ImportError:
+            pass
+    return REGISTRY.get(name)
+
+
+def enqueue(func, *, key=None, delay=0, restart_failed=False, **kwargs):
+    """
+    Ставить задачу в чергу (в поточній транзакції). Повертає Task.
+    restart_failed - задачу з тим самим ключем, що вичерпала спроби, запустити знову.
+    """
+    name = func if isinstance(func, str) else func.task_name
+    spec = get_task(name)
+    if spec is None:
+        raise LookupError(f"Unknown task {name}")
+    fields = {
+        'name': name,
+        'kwargs': kwargs,
+        'max_attempts': spec.max_attempts,
+        'run_at': timezone.now() + timedelta(seconds=delay),
+    }
+    if key is None:
+        created, item = True, Task.objects.create(**fields)
+    else:
+        item, created = Task.objects.get_or_create(key=key, defaults=fields)
+        if not created and restart_failed and item.status == 'failed':
+            Task.objects.filter(pk=item.pk, status='failed').update(
+                status='queued', attempts=0, run_at=fields['run_at'],
+                started_at=None, finished_at=None, locked_until=None,
+            )
+            item.refresh_from_db()
+    if getattr(settings, 'GAMES_TASKS_EAGER', False) and item.status == 'queued':
+        if getattr(settings, 'GAMES_TASKS_EAGER_INLINE', False):
+            # run_task забере задачу, лише якщо настав її run_at
+            transaction.on_commit(lambda: run_task(item.pk))
+        else:
+            run_at = item.run_at
+            transaction.on_commit(lambda: _submit(item.pk, run_at))
+    return item
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(EAGER_THREADS, thread_name_prefix='tasks-eager')
+        return _executor
+
+
+def _submit(pk, run_at):
+    """GAMES_TASKS_EAGER: виконати задачу в пулі потоків процесу, коли настане run_at."""
+    delay = (run_at - timezone.now()).total_seconds()
+    if delay > 0:
+        timer = threading.Timer(delay, _get_executor().submit, args=(_run_in_background, pk))
+        timer.daemon = True
+        timer.start()
+    else:
+        _get_executor().submit(_run_in_background, pk)
+
+
+def _run_in_background(pk):
+    try:
+        run_task(pk)
+        # Помилка з повтором - задача знову в черзі з новим run_at
+        retry_at = Task.objects.filter(pk=pk, status='queued').values_list('run_at', flat=True).first()
+        if retry_at is not None:
+            _submit(pk, retry_at)
+    except Exception:
+        logger.exception("Background task %s crashed", pk)
+    finally:
+        close_old_connections()
+
+
+def backoff(attempts, retry_delay=RETRY_DELAY):
+    """Затримка перед наступною спробою: експонента з jitter, щоб повтори не йшли хвилею."""
+    delay = min(retry_delay * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+    return random.uniform(delay / 2, delay)
+
+
+def _due(now):
+    return Q(status='queued', run_at__lte=now) | Q(status='running', locked_until__lt=now)
+
+
+def _claim(pk, now, condition):
+    claimed = Task.objects.filter(condition, pk=pk).update(
+        status='running',
+        attempts=F('attempts') + 1,
+        started_at=now,
+        locked_until=now + timedelta(seconds=LEASE),
+    )
+    return Task.objects.get(pk=pk) if claimed else None
+
+
+def claim_next():
+    """Забирає найстарішу готову задачу. None - черга порожня."""
+    now = timezone.now()
+    condition = _due(now)
+    candidates = Task.objects.filter(condition).order_by('run_at').values_list('pk', flat=True)[:CLAIM_CANDIDATES]
+    for pk in candidates:
+        # Інший воркер міг забрати кандидата між SELECT і UPDATE - тоді пробуємо наступного
+        item = _claim(pk, now, condition)
+        if item is not None:
+            return item
+    return None
+
+
+def execute(item):
+    """Виконує забрану задачу і записує результат: done, повтор або failed."""
+    spec = get_task(item.name)
+    if spec is None:
+        _finish(item, 'failed', error=f"Unknown task {item.name}")
+        return False
+    if item.attempts > item.max_attempts:
+        # Воркер падав на цій задачі, поки не вичерпав спроби
+        _finish(item, 'failed', error=item.last_error or "Lease expired")
+        return False
+    try:
+        spec.func(**item.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if item.attempts < item.max_attempts:
+            logger.warning("Task %s %s failed, retrying", item.name, item.pk, exc_info=True)
+            Task.objects.filter(pk=item.pk, status='running').update(
+                status='queued',
+                run_at=timezone.now() + timedelta(seconds=backoff(item.attempts, spec.retry_delay)),
+                locked_until=None,
+                last_error=error,
+            )
+        else:
+            logger.error("Task %s %s failed after %s attempts", item.name, item.pk, item.attempts, exc_info=True)
+            _finish(item, 'failed', error=error)
+        return False
+    _finish(item, 'done')
+    return True
+
+
+def _finish(item, status, error=''):
+    Task.objects.filter(pk=item.pk).update(
+        status=status, finished_at=timezone.now(), locked_until=None, last_error=error,
+    )
+
+
+def run_task(pk):
+    """Виконує одну задачу, якщо її ще не забрав воркер (режим GAMES_TASKS_EAGER)."""
+    now = timezone.now()
+    item = _claim(pk, now, _due(now))
+    if item is not None:
+        execute(item)
+
+
+def run_pending(limit=None):
+    """Виконує готові задачі в поточному потоці, поки черга не спорожніє. Повертає кількість."""
+    count = 0
+    while limit is None or count < limit:
+        item = claim_next()
+        if item is None:
+            break
+        execute(item)
+        count += 1
+    return count
+
+
+def purge(older_than=RETENTION):
+    """Видаляє завершені задачі - разом з ними звільняються й ключі ідемпотентності."""
+    deleted, _ = Task.objects.filter(
+        status__in=('done', 'failed'), finished_at__lt=timezone.now() - older_than,
+    ).delete()
+    return deleted
+
+
+class Worker:
+    """Потоки, що по черзі забирають і виконують задачі. stop() - завершити після поточних."""
+
+    def __init__(self, threads=1, poll_interval=POLL_INTERVAL, once=False):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.once = once
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        try:
+            while not self._stop.is_set():
+                item = claim_next()
+                if item is None:
+                    if self.once:
+                        break
+                    self._stop.wait(self.poll_interval)
+                else:
+                    execute(item)
+                # Потік живе довго - з'єднання з БД не повинно висіти
+                close_old_connections()
+        finally:
+            close_old_connections()
+
+    def run(self):
+        workers = [
+            threading.Thread(target=self._loop, name=f"tasks-{i}", daemon=True)
+            for i in range(self.threads)
+        ]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            # join з таймаутом - щоб головний потік отримував сигнали
+            while thread.is_alive():
+                thread.join(0.5)
+
+
+def queue_stats():
+    """Глибина черги і затримки - для моніторингу."""
+    now = timezone.now()
+    by_status = dict(Task.objects.values_list('status').order_by().annotate(Count('id')))
+    due = Task.objects.filter(status='queued', run_at__lte=now)
+    oldest = due.aggregate(oldest=Min('run_at'))['oldest']
+    recent = Task.objects.filter(status='done', finished_at__gte=now - METRICS_WINDOW).aggregate(
+        # Від моменту, коли задача стала готовою, до початку виконання
+        wait=Avg(ExpressionWrapper(F('started_at') - F('run_at'), output_field=DurationField())),
+        run=Avg(ExpressionWrapper(F('finished_at') - F('started_at'), output_field=DurationField())),
+        count=Count('id'),
+    )
+
+    def seconds(value):
+        return round(value.total_seconds(), 3) if value is not None else None
+
+    return {
+        'queued': by_status.get('queued', 0),
+        'due': due.count(),
+        'running': by_status.get('running', 0),
+        'done': by_status.get('done', 0),
+        'failed': by_status.get('failed', 0),
+        # Скільки чекає найстаріша готова задача - росте, якщо воркерів замало
+        'oldest_due_age': seconds(now - oldest) if oldest else 0,
+        'completed_last_hour': recent['count'],
+        'avg_wait': seconds(recent['wait']),
+        'avg_run': seconds(recent['run']),
+    }
@@ -0,0 +1,28 @@
+from django import template
+
+from ..images import FORMATS, image_representation
+
+register = template.Library()
+
+
+@register.inclusion_tag('games/picture.html')
+def picture(image, variants, sizes, alt='', css_class='', loading='lazy', width='', height=''):
+    """
+    <picture> з AVIF/WebP/JPEG варіантами image у srcset.
+    {% picture game.image game.image_variants "120px" alt=game.title %}
+    Поки варіантів немає - звичайний <img> з оригіналом.
+    """
+    representation = image_representation(image.name, variants, image.storage) if image else None
+    srcset = representation['srcset'] if representation else {}
+    return {
+        'representation': representation,
+        # Останній формат (JPEG) - у srcset самого <img>, решта - <source>
+        'sources': [(FORMATS[fmt][1], srcset[fmt]) for fmt in list(FORMATS)[:-1] if fmt in srcset],
+        'fallback_srcset': srcset.get(list(FORMATS)[-1], ''),
+        'sizes': sizes,
+        'alt': alt,
+        'css_class': css_class,
+        'loading': loading,
+        'width': width,
+        'height': height,
+    }
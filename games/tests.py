@@ -1,5 +1,7 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from .models import *
+from decimal import Decimal
+import json
 # Create your tests here.
 
 class GameModelTest(TestCase):
@@ -85,7 +87,1888 @@ class CartTest(TestCase):
         )
     
     def test_add_to_cart(self):
-        response = self.client.get(reverse("add_to_cart"), args=[self.game.id])
+        response = self.client.get(reverse("add_to_cart", args=[self.game.id]))
 
         session = self.client.session
-        self.assertIn(str(self.game.id), session["cart"])
+        self.assertEqual(decode_ids(session["cart"]), [self.game.id])
+
+
+from .sessions import decode_ids
+from .search import get_backend, search_games
+
+class GameSearchTest(TestCase):
+
+    def setUp(self):
+        self.witcher = Game.objects.create(
+            title="The Witcher 3",
+            description="Open world RPG about a monster hunter",
+            genre="RPG",
+            release_year=2015,
+        )
+        self.doom = Game.objects.create(
+            title="Doom",
+            description="Shooter where you fight demons, not a witcher story",
+            genre="Shooter",
+            release_year=2016,
+        )
+
+    def test_prefix_search(self):
+        self.assertEqual(get_backend().search("witc"), [self.witcher.id, self.doom.id])
+
+    def test_search_by_genre(self):
+        self.assertEqual(get_backend().search("shooter"), [self.doom.id])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.doom.title = "Quake"
+        self.doom.save()
+        self.assertEqual(get_backend().search("doom"), [])
+        self.witcher.delete()
+        self.assertEqual(get_backend().search("witcher"), [self.doom.id])
+
+    def test_game_list_uses_search(self):
+        response = self.client.get(reverse("game_list"), {"q": "hunter"})
+        self.assertContains(response, "The Witcher 3")
+        self.assertNotContains(response, "Doom")
+
+    def test_filters_apply_before_limit(self):
+        # Witcher релевантніший, але фільтр жанру має відсіяти його до LIMIT
+        shooters = Game.objects.filter(genre="Shooter")
+        self.assertEqual(get_backend().search("witc", limit=1), [self.witcher.id])
+        self.assertEqual(get_backend().search("witc", limit=1, queryset=shooters), [self.doom.id])
+        self.assertEqual(list(search_games("witc", shooters)), [self.doom])
+
+    def test_results_are_not_capped(self):
+        # Понад SEARCH_RESULT_LIMIT: кількість і остання сторінка рахуються в самому запиті
+        from . import search
+        for i in range(4):
+            Game.objects.create(title=f"Witcher clone {i}", genre="RPG", release_year=2020)
+        with mock.patch.object(search, "SEARCH_RESULT_LIMIT", 2):
+            response = self.client.get(reverse("game_list"), {"q": "witc", "page": 2})
+            self.assertEqual(response.context["page_obj"].paginator.count, 6)
+            self.assertEqual(len(response.context["page_obj"]), 3)
+            self.assertEqual(search_games("witc").count(), 6)
+
+    def test_backend_follows_database_vendor(self):
+        from . import search
+        with override_settings(GAMES_SEARCH_BACKEND=None), mock.patch.object(search, "_backend", None), \
+                mock.patch.object(connection, "vendor", "postgresql"):
+            self.assertIsInstance(get_backend(), search.DatabaseSearchBackend)
+
+
+import base64
+from django.core.cache import cache
+from .pagination import CursorPaginator
+
+class CursorPaginationTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        # Дві гри з однаковою назвою перевіряють тай-брейк по id
+        for title in ["Alpha", "Bravo", "Bravo", "Charlie", "Delta", "Echo", "Foxtrot"]:
+            Game.objects.create(title=title, description="", genre="test", release_year=2020)
+        self.expected = list(Game.objects.order_by("title", "id").values_list("id", flat=True))
+
+    def test_forward_and_backward(self):
+        paginator = CursorPaginator(Game.objects.all(), 3)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        seen = [game.id for page in pages for game in page]
+        self.assertEqual(seen, self.expected)
+        self.assertFalse(pages[0].has_previous())
+
+        back = paginator.page(pages[-1].previous_cursor)
+        self.assertEqual([g.id for g in back], [g.id for g in pages[-2]])
+        self.assertTrue(back.has_next())
+
+    def test_game_list_follows_cursor(self):
+        first = self.client.get(reverse("game_list"))
+        second = self.client.get(reverse("game_list"), {"cursor": first.context["page_obj"].next_cursor})
+        self.assertEqual([g.id for g in second.context["page_obj"]], self.expected[3:6])
+        self.assertEqual(second.context["total_count"], 7)
+
+    def test_api_cursor_mode(self):
+        response = self.client.get(reverse("api_game_list"), {"cursor": ""})
+        self.assertEqual([g["id"] for g in response.data["results"]], self.expected)
+        self.assertIsNone(response.data["next"])
+        bad = self.client.get(reverse("api_game_list"), {"cursor": "garbage"})
+        self.assertEqual(bad.status_code, 400)
+
+    def test_fractional_prices(self):
+        # 199.99 зі знижкою 33% = 133.9933: курсор по final_price мусить просуватися
+        Game.objects.all().delete()
+        for i in range(7):
+            Game.objects.create(title=f"G{i}", description="", genre="test", release_year=2020,
+                                price=Decimal("199.99"), discount=33 if i % 2 else 10)
+        self.assertEqual(Game.objects.filter(final_price=Decimal("133.99")).count(), 3)
+        for sort, ordering in (("price", ("final_price", "id")), ("-price", ("-final_price", "id"))):
+            expected = list(Game.objects.order_by(*ordering).values_list("id", flat=True))
+            seen, cursor = [], ""
+            for _ in range(len(expected) + 1):
+                data = self.client.get(reverse("api_game_list"), {"cursor": cursor, "sort": sort, "page_size": 2}).data
+                seen += [g["id"] for g in data["results"]]
+                cursor = data["next"]
+                if cursor is None:
+                    break
+            self.assertEqual(seen, expected, sort)
+
+    def test_tampered_cursor(self):
+        def forge(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+        for payload in ({"v": 5, "r": False}, {"v": ["a", "zz"], "r": False}, {"v": ["a"], "r": False},
+                        {"v": [None, 1], "r": False}, [1, 2]):
+            cursor = forge(payload)
+            api = self.client.get(reverse("api_game_list"), {"cursor": cursor, "sort": "price"})
+            self.assertEqual(api.status_code, 400, payload)
+            # Сторінка каталогу з поганим курсором показує першу сторінку
+            page = self.client.get(reverse("game_list"), {"cursor": cursor})
+            self.assertEqual(page.status_code, 200, payload)
+
+
+class ApiGameListTest(TestCase):
+
+    def setUp(self):
+        for i in range(5):
+            Game.objects.create(
+                title=f"Game {i}",
+                description="long text " * 50,
+                genre="test",
+                release_year=2020,
+                price=100,
+                discount=10,
+            )
+
+    def test_sparse_fields(self):
+        response = self.client.get(reverse("api_game_list"), {"fields": "id,title,sell_price"})
+        self.assertEqual(set(response.data[0]), {"id", "title", "sell_price"})
+        self.assertEqual(response.data[0]["sell_price"], 90)
+
+    def test_page_mode(self):
+        response = self.client.get(reverse("api_game_list"), {"page": 2, "page_size": 2})
+        self.assertEqual(response.data["count"], 5)
+        self.assertEqual([g["title"] for g in response.data["results"]], ["Game 2", "Game 3"])
+        self.assertEqual(self.client.get(reverse("api_game_list"), {"page": 9}).status_code, 404)
+
+    def test_ndjson_export(self):
+        response = self.client.get(reverse("api_game_list"), {"export": "ndjson", "fields": "id,title"})
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(json.loads(lines[0]), {"id": Game.objects.first().id, "title": "Game 0"})
+
+    def test_json_export_matches_list(self):
+        exported = self.client.get(reverse("api_game_list"), {"export": "json"})
+        listed = self.client.get(reverse("api_game_list"))
+        self.assertEqual(json.loads(b"".join(exported.streaming_content)), json.loads(listed.content))
+
+
+from .fast_serializers import FastGameSerializer, FastMessageSerializer, FastProfileSerializer
+from .serializers import GameSerializer, MessageSerializer, ProfileSerializer
+
+class FastSerializerParityTest(TestCase):
+
+    def setUp(self):
+        Game.objects.create(title="Full price", description="a", genre="RPG",
+                            release_year=2020, rating=4.5, price=199.99)
+        Game.objects.create(title="On sale", description="b", genre="RPG",
+                            release_year=2021, price=100, discount=33)
+        Game.objects.create(title="Free", description="c", genre="MOBA",
+                            release_year=2013, price=0)
+        self.alice = User.objects.create_user(username="alice", password="123456")
+        self.bob = User.objects.create_user(username="bob", password="123456")
+        Message.objects.create(sender=self.alice, receiver=self.bob, text="hi")
+        Message.objects.create(sender=self.bob, receiver=self.alice, text="hello")
+
+    def test_game_parity(self):
+        games = Game.objects.all()
+        self.assertEqual(FastGameSerializer().serialize(games), GameSerializer(games, many=True).data)
+
+    def test_game_parity_with_fields(self):
+        games = Game.objects.all()
+        fields = ["title", "sell_price"]
+        self.assertEqual(
+            FastGameSerializer(fields).serialize(games),
+            GameSerializer(games, many=True, fields=fields).data,
+        )
+
+    def test_message_parity(self):
+        messages = Message.objects.order_by("timestamp")
+        self.assertEqual(FastMessageSerializer().serialize(messages), MessageSerializer(messages, many=True).data)
+
+    def test_message_single_query(self):
+        with self.assertNumQueries(1):
+            FastMessageSerializer().serialize(Message.objects.all())
+
+    def test_profile_parity(self):
+        profiles = Profile.objects.order_by("id")
+        self.assertEqual(FastProfileSerializer().serialize(profiles), ProfileSerializer(profiles, many=True).data)
+
+
+class FinalPriceTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.cheap = Game.objects.create(title="Cheap", description="", genre="test",
+                                         release_year=2020, price=50)
+        self.sale = Game.objects.create(title="Sale", description="", genre="test",
+                                        release_year=2020, price=99, discount=33)
+        self.pricey = Game.objects.create(title="Pricey", description="", genre="test",
+                                          release_year=2020, price=300)
+
+    def test_final_price_matches_sell_price(self):
+        for game in Game.objects.all():
+            self.assertAlmostEqual(game.final_price, game.sell_price, places=2)
+
+    def test_final_price_follows_bulk_update(self):
+        Game.objects.filter(id=self.pricey.id).update(discount=50)
+        self.assertEqual(Game.objects.get(id=self.pricey.id).final_price, 150)
+
+    def test_price_filters_and_sort(self):
+        response = self.client.get(reverse("game_list"), {"min_price": 60, "sort": "-price"})
+        self.assertEqual([g.id for g in response.context["page_obj"]], [self.pricey.id, self.sale.id])
+
+        response = self.client.get(reverse("api_game_list"), {"on_sale": 1, "fields": "id"})
+        self.assertEqual(response.data, [{"id": self.sale.id}])
+
+    def test_api_cursor_sorted_by_price(self):
+        response = self.client.get(reverse("api_game_list"), {"cursor": "", "sort": "price", "page_size": 2})
+        self.assertEqual([g["id"] for g in response.data["results"]], [self.cheap.id, self.sale.id])
+        response = self.client.get(reverse("api_game_list"), {"cursor": response.data["next"], "sort": "price"})
+        self.assertEqual([g["id"] for g in response.data["results"]], [self.pricey.id])
+
+    def test_cart_total(self):
+        session = self.client.session
+        session["cart"] = {str(self.cheap.id): 1, str(self.sale.id): 1}
+        session.save()
+        response = self.client.get(reverse("cart"))
+        self.assertAlmostEqual(response.context["total"], Decimal("116.33"), places=2)
+
+
+import asyncio
+from unittest import mock
+from asgiref.sync import async_to_sync
+from .realtime import InProcessChatBroker, conversation_channel, get_broker
+from .websocket import chat_websocket
+
+class RealtimeChatTest(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", password="123456")
+        self.bob = User.objects.create_user(username="bob", password="123456")
+        Friend.objects.create(user=self.alice, friend=self.bob)
+        Friend.objects.create(user=self.bob, friend=self.alice)
+
+    def test_channel_is_symmetric(self):
+        self.assertEqual(
+            conversation_channel(self.alice.id, self.bob.id),
+            conversation_channel(self.bob.id, self.alice.id),
+        )
+
+    def test_in_process_fan_out(self):
+        async def scenario():
+            broker = InProcessChatBroker()
+            first = await broker.subscribe("chat:1:2")
+            second = await broker.subscribe("chat:1:2")
+            other = await broker.subscribe("chat:1:3")
+            broker.publish("chat:1:2", {"text": "hi"})
+            received = [await first.get(), await second.get()]
+            await broker.unsubscribe("chat:1:2", first)
+            return received, other.queue.empty(), broker.subscriber_count("chat:1:2")
+
+        received, other_empty, remaining = asyncio.run(scenario())
+        self.assertEqual(received, [{"text": "hi"}, {"text": "hi"}])
+        self.assertTrue(other_empty)
+        self.assertEqual(remaining, 1)
+
+    def test_chat_view_publishes(self):
+        self.client.force_login(self.alice)
+        with mock.patch.object(get_broker(), "publish") as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse("chat", args=[self.bob.id]), {"text": "hello"})
+        channel, payload = publish.call_args.args
+        self.assertEqual(channel, conversation_channel(self.alice.id, self.bob.id))
+        self.assertEqual(payload["text"], "hello")
+        self.assertEqual(payload["sender"], "alice")
+
+    def run_websocket(self, path, cookie, publish=None):
+        async def scenario():
+            inbox = asyncio.Queue()
+            sent = []
+            scope = {
+                "type": "websocket",
+                "path": path,
+                "headers": [(b"cookie", cookie.encode()), (b"host", b"testserver")],
+            }
+
+            async def send(event):
+                sent.append(event)
+
+            await inbox.put({"type": "websocket.connect"})
+            task = asyncio.ensure_future(chat_websocket(scope, inbox.get, send))
+            while not sent:
+                await asyncio.sleep(0.01)
+            if publish and sent[0]["type"] == "websocket.accept":
+                get_broker().publish(*publish)
+                while len(sent) < 2:
+                    await asyncio.sleep(0.01)
+            await inbox.put({"type": "websocket.disconnect"})
+            await task
+            return sent
+
+        return async_to_sync(scenario)()
+
+    def test_websocket_delivers_messages(self):
+        self.client.force_login(self.alice)
+        cookie = f"sessionid={self.client.cookies['sessionid'].value}"
+        channel = conversation_channel(self.alice.id, self.bob.id)
+        sent = self.run_websocket(f"/ws/chat/{self.bob.id}/", cookie, publish=(channel, {"text": "hi"}))
+        self.assertEqual(sent[0]["type"], "websocket.accept")
+        self.assertEqual(json.loads(sent[1]["text"]), {"text": "hi"})
+        self.assertEqual(get_broker().subscriber_count(channel), 0)
+
+    def test_websocket_rejects_non_friends(self):
+        carol = User.objects.create_user(username="carol", password="123456")
+        self.client.force_login(carol)
+        cookie = f"sessionid={self.client.cookies['sessionid'].value}"
+        sent = self.run_websocket(f"/ws/chat/{self.bob.id}/", cookie)
+        self.assertEqual(sent, [{"type": "websocket.close", "code": 4403}])
+
+
+class ConversationTest(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", password="123456")
+        self.bob = User.objects.create_user(username="bob", password="123456")
+        Friend.objects.create(user=self.alice, friend=self.bob)
+        Friend.objects.create(user=self.bob, friend=self.alice)
+
+    def test_messages_share_canonical_conversation(self):
+        first = Message.objects.create(sender=self.alice, receiver=self.bob, text="hi")
+        second = Message.objects.create(sender=self.bob, receiver=self.alice, text="hello")
+        self.assertEqual(first.conversation_id, second.conversation_id)
+        self.assertEqual(Conversation.objects.count(), 1)
+
+    def test_history_excludes_self_messages(self):
+        Message.objects.create(sender=self.alice, receiver=self.bob, text="hi")
+        Message.objects.create(sender=self.alice, receiver=self.alice, text="note to self")
+        self.client.force_login(self.alice)
+        response = self.client.get(reverse("api_messages", args=[self.bob.id]))
+        self.assertEqual([m["text"] for m in response.data], ["hi"])
+
+    def test_history_uses_index(self):
+        from django.db import connection
+        conversation = Conversation.objects.between(self.alice, self.bob, create=True)
+        sql, params = conversation.messages.order_by("timestamp", "id").query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = " ".join(str(row) for row in cursor.fetchall())
+        self.assertIn("message_history_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+
+from datetime import timedelta
+from django.utils import timezone
+
+class ChatHistoryTest(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", password="123456")
+        self.bob = User.objects.create_user(username="bob", password="123456")
+        Friend.objects.create(user=self.alice, friend=self.bob)
+        Friend.objects.create(user=self.bob, friend=self.alice)
+        for i in range(120):
+            Message.objects.create(sender=self.alice, receiver=self.bob, text=f"m{i}")
+        # Однаковий timestamp у всіх - перевіряє тай-брейк по id
+        Message.objects.update(timestamp=timezone.now() - timedelta(days=1))
+        self.client.force_login(self.alice)
+
+    def test_chat_renders_latest_page(self):
+        response = self.client.get(reverse("chat", args=[self.bob.id]))
+        texts = [m.text for m in response.context["messages"]]
+        self.assertEqual(texts, [f"m{i}" for i in range(70, 120)])
+        self.assertTrue(response.context["older_cursor"])
+
+    def test_load_older_pages_backwards(self):
+        cursor = self.client.get(reverse("chat", args=[self.bob.id])).context["older_cursor"]
+        collected = []
+        while cursor:
+            data = self.client.get(reverse("older_messages", args=[self.bob.id]), {"before": cursor}).json()
+            collected = [m["text"] for m in data["messages"]] + collected
+            cursor = data["older"]
+        self.assertEqual(collected, [f"m{i}" for i in range(70)])
+
+    def test_api_messages_cursor(self):
+        first = self.client.get(reverse("api_messages", args=[self.bob.id]), {"limit": 100})
+        self.assertEqual(len(first.data["results"]), 100)
+        second = self.client.get(reverse("api_messages", args=[self.bob.id]), {"before": first.data["older"]})
+        self.assertEqual([m["text"] for m in second.data["results"]], [f"m{i}" for i in range(20)])
+        self.assertIsNone(second.data["older"])
+
+    def test_api_messages_legacy_list(self):
+        # Запит без параметрів пагінації - та сама відповідь, що й до курсорів
+        response = self.client.get(reverse("api_messages", args=[self.bob.id]))
+        self.assertEqual([m["text"] for m in response.data], [f"m{i}" for i in range(120)])
+
+
+class MessageSyncTest(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", password="123456")
+        self.bob = User.objects.create_user(username="bob", password="123456")
+        self.carol = User.objects.create_user(username="carol", password="123456")
+        for a, b in [(self.alice, self.bob), (self.alice, self.carol)]:
+            Friend.objects.create(user=a, friend=b)
+            Friend.objects.create(user=b, friend=a)
+        self.first = Message.objects.create(sender=self.bob, receiver=self.alice, text="from bob")
+        self.second = Message.objects.create(sender=self.alice, receiver=self.bob, text="to bob")
+        self.third = Message.objects.create(sender=self.carol, receiver=self.alice, text="from carol")
+        # Колізія часу: id все одно впорядковує повідомлення
+        Message.objects.update(timestamp=timezone.now())
+        self.client.force_login(self.alice)
+
+    def test_fetch_after_id(self):
+        url = reverse("fetch_messages", args=[self.bob.id])
+        data = self.client.get(url, {"after": self.first.id}).json()
+        self.assertEqual([m["id"] for m in data["messages"]], [self.second.id])
+        self.assertEqual(data["last_id"], self.second.id)
+
+        data = self.client.get(url, {"after": data["last_id"]}).json()
+        self.assertEqual(data["messages"], [])
+        self.assertEqual(data["last_id"], self.second.id)
+
+    def test_fetch_resolves_senders_in_one_query(self):
+        url = reverse("fetch_messages", args=[self.bob.id])
+        with self.assertNumQueries(4):
+            # користувач, перевірка дружби, розмова, повідомлення (сесія - з кешу)
+            data = self.client.get(url).json()
+        self.assertEqual([m["sender"] for m in data["messages"]], ["bob", "alice"])
+
+    def test_sync_all_conversations(self):
+        data = self.client.get(reverse("sync_messages"), {"after": 0}).json()
+        self.assertEqual(
+            [(m["id"], m["friend_id"]) for m in data["messages"]],
+            [(self.first.id, self.bob.id), (self.second.id, self.bob.id), (self.third.id, self.carol.id)],
+        )
+        self.assertFalse(data["has_more"])
+
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+class UnreadCounterTest(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", password="123456")
+        self.bob = User.objects.create_user(username="bob", password="123456")
+        self.carol = User.objects.create_user(username="carol", password="123456")
+        for a, b in [(self.alice, self.bob), (self.alice, self.carol)]:
+            Friend.objects.create(user=a, friend=b)
+            Friend.objects.create(user=b, friend=a)
+        Message.objects.create(sender=self.bob, receiver=self.alice, text="1")
+        Message.objects.create(sender=self.bob, receiver=self.alice, text="2")
+        Message.objects.create(sender=self.carol, receiver=self.alice, text="3")
+        Message.objects.create(sender=self.alice, receiver=self.bob, text="4")
+
+    def test_counters_follow_message_create(self):
+        self.assertEqual(
+            Conversation.objects.unread_counts(self.alice),
+            {self.bob.id: 2, self.carol.id: 1},
+        )
+        self.assertEqual(Conversation.objects.unread_counts(self.bob), {self.alice.id: 1})
+        self.assertEqual(Conversation.objects.unread_total(self.alice), 3)
+
+    def test_mark_read_endpoint(self):
+        self.client.force_login(self.alice)
+        response = self.client.post(reverse("mark_messages_read", args=[self.bob.id]))
+        self.assertEqual(response.json(), {"marked": 2, "unread": 1})
+        self.assertFalse(Message.objects.filter(receiver=self.alice, sender=self.bob, is_read=False).exists())
+        # Лічильник співрозмовника не змінюється
+        self.assertEqual(Conversation.objects.unread_total(self.bob), 1)
+        self.assertEqual(self.client.get(reverse("mark_messages_read", args=[self.bob.id])).status_code, 405)
+
+    def test_opening_chat_marks_read(self):
+        self.client.force_login(self.alice)
+        self.client.get(reverse("chat", args=[self.carol.id]))
+        self.assertEqual(Conversation.objects.unread_counts(self.alice)[self.carol.id], 0)
+
+    def test_navbar_and_profile_cost_constant_queries(self):
+        self.client.force_login(self.alice)
+        response = self.client.get(reverse("profile"))
+        self.assertEqual(response.context["unread_messages"], 3)
+        unread = {item.friend_id: item.unread for item in response.context["friends"]}
+        self.assertEqual(unread, {self.bob.id: 2, self.carol.id: 1})
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("profile"))
+        Friend.objects.create(user=self.alice, friend=User.objects.create_user(username="dave"))
+        with self.assertNumQueries(len(queries)):
+            self.client.get(reverse("profile"))
+
+    def test_api_unread(self):
+        self.client.force_login(self.alice)
+        data = self.client.get(reverse("api_unread")).json()
+        self.assertEqual(data["total"], 3)
+        self.assertCountEqual(
+            data["conversations"],
+            [{"friend_id": self.bob.id, "unread": 2}, {"friend_id": self.carol.id, "unread": 1}],
+        )
+
+
+from . import presence
+from .presence import ONLINE_TTL, CachePresenceStore, InMemoryPresenceStore, PresenceTracker
+
+class PresenceTest(TestCase):
+
+    def setUp(self):
+        self.tracker = PresenceTracker(InMemoryPresenceStore())
+        patcher = mock.patch.object(presence, "_tracker", self.tracker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.users = [User.objects.create_user(username=f"user{i}", password="123456") for i in range(3)]
+
+    def test_bulk_status_in_one_query(self):
+        self.tracker.heartbeat(self.users[0].id)
+        ids = [u.id for u in self.users]
+        with self.assertNumQueries(1):
+            status = presence.online_status(ids)
+        self.assertEqual(status, {ids[0]: True, ids[1]: False, ids[2]: False})
+
+        for uid in ids:
+            self.tracker.heartbeat(uid)
+        with self.assertNumQueries(0):
+            self.assertTrue(all(presence.online_status(ids).values()))
+
+    def test_last_seen_writes_are_coalesced(self):
+        user = self.users[0]
+        start = timezone.now()
+        with self.assertNumQueries(0):
+            self.tracker.heartbeat(user.id, start)
+            self.tracker.heartbeat(user.id, start + timedelta(seconds=10))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.tracker.flush(start + timedelta(seconds=20)), 1)
+        self.assertEqual(Profile.objects.get(user=user).last_seen, start + timedelta(seconds=10))
+
+        # Протягом інтервалу повторний запис у БД не планується
+        self.tracker.heartbeat(user.id, start + timedelta(minutes=1))
+        self.assertEqual(self.tracker.flush(start + timedelta(minutes=1)), 0)
+
+        # Інтервал минув - наступний heartbeat сам скидає пачку
+        later = start + timedelta(minutes=1) + presence.LAST_SEEN_FLUSH_INTERVAL
+        self.tracker.heartbeat(user.id, later)
+        self.assertEqual(Profile.objects.get(user=user).last_seen, later)
+
+    def test_database_fallback_allows_for_flush_lag(self):
+        # Активний користувач, чий last_seen ще не скинуто: у сховищі іншого воркера його немає
+        user = self.users[0]
+        seen = timezone.now() - ONLINE_TTL - timedelta(minutes=1)
+        Profile.objects.filter(user=user).update(status="online", last_seen=seen)
+        self.assertTrue(presence.online_status([user.id])[user.id])
+
+        stale = timezone.now() - presence.DB_ONLINE_THRESHOLD - timedelta(minutes=1)
+        Profile.objects.filter(user=user).update(last_seen=stale)
+        self.assertFalse(presence.online_status([user.id])[user.id])
+
+    async def test_async_stack_is_not_adapted(self):
+        from django.core.handlers.asgi import ASGIHandler
+        from django.test import AsyncClient
+        # Усі middleware async-capable: async view не переходить у потік (лог адаптації - лише з DEBUG)
+        with override_settings(DEBUG=True), self.assertNoLogs("django.request", "DEBUG"):
+            ASGIHandler().load_middleware(is_async=True)
+
+        user = self.users[0]
+        client = AsyncClient()
+        await client.aforce_login(user)
+        await client.get(reverse("game_list"))
+        self.assertIn(user.id, self.tracker.store.last_seen_many([user.id]))
+
+    def test_cache_store(self):
+        cache.clear()
+        tracker = PresenceTracker(CachePresenceStore())
+        tracker.heartbeat(self.users[1].id)
+        self.assertEqual(tracker.store.last_seen_many([self.users[1].id, self.users[2].id]).keys(), {self.users[1].id})
+        tracker.disconnect(self.users[1].id)
+        self.assertEqual(tracker.store.last_seen_many([self.users[1].id]), {})
+
+    def test_requests_update_presence_and_logout_clears_it(self):
+        viewer, friend = self.users[0], self.users[1]
+        Friend.objects.create(user=viewer, friend=friend)
+        self.client.force_login(friend)
+        self.client.get(reverse("game_list"))
+
+        self.client.force_login(viewer)
+        response = self.client.get(reverse("profile"))
+        self.assertTrue(response.context["friends"][0].online)
+
+        self.client.force_login(friend)
+        self.client.get(reverse("logout"))
+        self.client.force_login(viewer)
+        response = self.client.get(reverse("user_search"), {"q": "user"})
+        online = {u.id: u.online for u in response.context["users"]}
+        self.assertEqual(online, {friend.id: False, self.users[2].id: False})
+
+
+import threading
+import time as time_module
+from .caching import CATALOG_VERSION_POLL, ReadThroughCache, catalog_version, game_detail_cache
+
+class GameDetailCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        game_detail_cache.clear()
+        self.game = Game.objects.create(
+            title="Cached", description="d", genre="RPG", release_year=2020, price=100
+        )
+        Review.objects.create(game=self.game, text="good", rating=4)
+
+    def test_repeat_requests_skip_database(self):
+        url = reverse("game_detail", args=[self.game.id])
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.context["game"].review_count, 1)
+        self.assertContains(response, "good")
+
+    def test_signals_invalidate(self):
+        url = reverse("game_detail", args=[self.game.id])
+        self.client.get(url)
+        Review.objects.create(game=self.game, text="great", rating=5)
+        self.assertEqual(self.client.get(url).context["game"].review_count, 2)
+
+        self.game.title = "Renamed"
+        self.game.save()
+        self.assertContains(self.client.get(url), "Renamed")
+
+        GameScreenshot.objects.create(game=self.game, image="game_screenshots/a.png")
+        self.assertEqual(len(self.client.get(url).context["screenshots"]), 1)
+
+        self.game.delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_posted_review_is_shown(self):
+        url = reverse("game_detail", args=[self.game.id])
+        self.client.get(url)
+        response = self.client.post(url, {"text": "posted", "rating": 3})
+        self.assertContains(response, "posted")
+
+    def test_stampede_loads_once(self):
+        calls = []
+
+        def loader(key):
+            calls.append(key)
+            time_module.sleep(0.1)
+            return {"key": key}
+
+        detail_cache = ReadThroughCache("stampede-test", loader)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(detail_cache.get(1))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, [{"key": 1}] * 8)
+        stats = detail_cache.stats()
+        self.assertEqual(stats["loads"], 1)
+
+        detail_cache.local.clear()
+        detail_cache.get(1)
+        self.assertEqual(detail_cache.stats()["shared_hits"], 1)
+
+    def test_invalidation_during_load_is_not_cached(self):
+        def loader(key):
+            # Інвалідація приходить, поки значення рахується
+            detail_cache.invalidate(key)
+            return {"key": key}
+
+        detail_cache = ReadThroughCache("generation-test", loader)
+        self.assertEqual(detail_cache.get(1), {"key": 1})
+        self.assertIsNone(cache.get(detail_cache._shared_key(1)))
+        for key in range(1000):
+            detail_cache.invalidate(key)
+        self.assertEqual(detail_cache._generation, 1001)
+
+
+class CatalogConditionalGetTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.game = Game.objects.create(
+            title="Stamped", description="d", genre="RPG", release_year=2020, price=10
+        )
+        self.ajax = {"HTTP_X_REQUESTED_WITH": "XMLHttpRequest"}
+
+    def test_fragment_is_cached_until_catalog_changes(self):
+        url = reverse("game_list")
+        self.client.get(url, {"genre": "RPG"}, **self.ajax)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {"genre": "RPG"}, **self.ajax)
+        self.assertContains(response, "Stamped")
+        self.assertNotContains(response, "<nav")
+
+        self.game.title = "Restamped"
+        self.game.save()
+        self.assertContains(self.client.get(url, {"genre": "RPG"}, **self.ajax), "Restamped")
+
+    def test_ajax_fragment_not_modified(self):
+        url = reverse("game_list")
+        response = self.client.get(url, **self.ajax)
+        self.assertIn("X-Requested-With", response["Vary"])
+        etag = response["ETag"]
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **self.ajax)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        # Повна сторінка залежить від користувача - без ETag
+        self.assertFalse(self.client.get(url).has_header("ETag"))
+
+        Game.objects.create(title="New", description="d", genre="RPG", release_year=2021, price=5)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag, **self.ajax).status_code, 200)
+
+    def test_version_is_shared_between_processes(self):
+        version = catalog_version()
+        Game.objects.filter(pk=self.game.pk).update(discount=10)
+        self.assertGreater(catalog_version(), version)
+        # Лічильника бажаного на сторінках каталогу немає
+        version = catalog_version()
+        Game.objects.filter(pk=self.game.pk).update(favorite_count=3)
+        self.assertEqual(catalog_version(), version)
+        # Інший процес змінює лише рядок у БД - тут його видно після CATALOG_VERSION_POLL
+        CatalogVersion.bump()
+        later = time_module.monotonic() + CATALOG_VERSION_POLL + 1
+        with mock.patch("games.caching.time.monotonic", return_value=later):
+            self.assertGreater(catalog_version(), version)
+
+    def test_api_not_modified(self):
+        for url in (reverse("api_game_list"), reverse("api_game_detail", args=[self.game.id])):
+            response = self.client.get(url, {"format": "json"})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.has_header("Last-Modified"))
+            repeat = self.client.get(url, {"format": "json"}, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(repeat.status_code, 304)
+            # Інші параметри - інший ETag
+            other = self.client.get(url, {"format": "json", "fields": "id"}, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(other.status_code, 200)
+
+
+from .facets import catalog_facets
+
+class CatalogFacetsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        get_backend().rebuild()
+        Game.objects.create(title="Witcher", description="d", genre="RPG", release_year=2015, price=300)
+        Game.objects.create(title="Witch Hunt", description="d", genre="Shooter", release_year=2015, price=0)
+        Game.objects.create(title="Doom", description="d", genre="Shooter", release_year=2016, price=1500, discount=50)
+
+    def facet(self, facets, name):
+        return {item.get("name", item.get("year", item.get("key"))): item["count"] for item in facets[name]}
+
+    def test_genre_is_normalized(self):
+        self.assertEqual(Genre.objects.count(), 2)
+        game = Game.objects.get(title="Doom")
+        self.assertEqual(game.genre_ref.name, "Shooter")
+        game.genre = "Action"
+        game.save(update_fields=["genre"])
+        self.assertEqual(Game.objects.get(pk=game.pk).genre_ref.name, "Action")
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("api_game_list"), {"genre": "RPG", "format": "json"})
+        self.assertIn("genre_ref_id", queries[-1]["sql"])
+
+    def test_queryset_update_sets_genre_ref(self):
+        Game.objects.filter(title="Doom").update(genre="Action")
+        self.assertEqual(Game.objects.get(title="Doom").genre_ref.name, "Action")
+        self.assertEqual(self.facet(catalog_facets({}), "genres"), {"Action": 1, "RPG": 1, "Shooter": 1})
+        Game.objects.filter(title="Doom").update(genre="")
+        self.assertIsNone(Game.objects.get(title="Doom").genre_ref)
+
+    def test_bulk_create_sets_genre_ref(self):
+        Game.objects.bulk_create([
+            Game(title="Gothic", description="d", genre="RPG", release_year=2001),
+            Game(title="Diablo", description="d", genre="ARPG", release_year=1996),
+        ])
+        self.assertEqual(Game.objects.get(title="Gothic").genre_ref.name, "RPG")
+        self.assertEqual(Game.objects.get(title="Diablo").genre_ref.name, "ARPG")
+        self.assertEqual(self.facet(catalog_facets({}), "genres"), {"ARPG": 1, "RPG": 2, "Shooter": 2})
+
+    def test_counts(self):
+        facets = catalog_facets({})
+        self.assertEqual(self.facet(facets, "genres"), {"RPG": 1, "Shooter": 2})
+        self.assertEqual(self.facet(facets, "years"), {2016: 1, 2015: 2})
+        self.assertEqual(
+            self.facet(facets, "prices"),
+            {"free": 1, "under_200": 0, "200_500": 1, "500_1000": 1, "over_1000": 0},
+        )
+
+    def test_counts_follow_query_but_not_own_filter(self):
+        facets = catalog_facets({"q": "witch", "genre": "RPG"})
+        # Жанровий фасет ігнорує власний фільтр, решта - ні
+        self.assertEqual(self.facet(facets, "genres"), {"RPG": 1, "Shooter": 1})
+        self.assertEqual(self.facet(facets, "years"), {2015: 1})
+
+    def test_cached_and_invalidated(self):
+        catalog_facets({"genre": "RPG"})
+        with self.assertNumQueries(0):
+            catalog_facets({"genre": "RPG"})
+        Game.objects.create(title="Gothic", description="d", genre="RPG", release_year=2001, price=100)
+        self.assertEqual(self.facet(catalog_facets({"genre": "RPG"}), "genres")["RPG"], 2)
+
+    def test_endpoint_and_html_filter(self):
+        data = self.client.get(reverse("api_game_facets"), {"year": 2015, "format": "json"}).json()
+        self.assertEqual(self.facet(data, "genres"), {"RPG": 1, "Shooter": 1})
+
+        response = self.client.get(reverse("game_list"), {"year": 2016})
+        self.assertContains(response, "Shooter (1)")
+        self.assertEqual([g.title for g in response.context["page_obj"]], ["Doom"])
+
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from io import StringIO
+
+class ReviewStatsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        game_detail_cache.clear()
+        self.game = Game.objects.create(title="Rated", description="d", genre="RPG", release_year=2020, price=10)
+        self.other = Game.objects.create(title="Other", description="d", genre="RPG", release_year=2020, price=10)
+        for rating in (5, 4, 4):
+            Review.objects.create(game=self.game, text="r", rating=rating)
+        Review.objects.create(game=self.other, text="r", rating=5)
+
+    def test_aggregates_follow_reviews(self):
+        self.game.refresh_from_db()
+        self.assertEqual((self.game.review_count, self.game.review_sum), (3, 13))
+        self.assertAlmostEqual(self.game.review_average, 13 / 3)
+        self.assertEqual(self.game.rating_histogram()[:2], [(5, 1, 33), (4, 2, 67)])
+
+        Review.objects.filter(rating=5, game=self.game).get().delete()
+        self.game.refresh_from_db()
+        self.assertEqual((self.game.review_count, self.game.reviews_5, self.game.review_average), (2, 0, 4.0))
+
+    def test_edit_and_queryset_delete(self):
+        review = Review.objects.get(game=self.game, rating=5)
+        review.rating = 2
+        review.save()
+        self.game.refresh_from_db()
+        self.assertEqual((self.game.review_count, self.game.review_sum, self.game.reviews_5, self.game.reviews_2), (3, 10, 0, 1))
+
+        # Перенесення відгуку на іншу гру
+        review.game = self.other
+        review.save()
+        self.game.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.game.review_count, self.game.review_sum, self.game.reviews_2), (2, 8, 0))
+        self.assertEqual((self.other.review_count, self.other.review_sum, self.other.reviews_2), (2, 7, 1))
+
+        Review.objects.filter(rating=4).delete()
+        self.game.refresh_from_db()
+        self.assertEqual((self.game.review_count, self.game.review_sum, self.game.reviews_4), (0, 0, 0))
+
+    def test_game_delete_skips_per_review_updates(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.game.delete()
+        self.assertFalse([q for q in queries if "review_count" in q["sql"] and q["sql"].startswith("UPDATE")])
+        self.assertEqual(Review.objects.count(), 1)
+
+    def test_posting_review_through_detail(self):
+        url = reverse("game_detail", args=[self.game.id])
+        response = self.client.post(url, {"text": "meh", "rating": 1})
+        self.assertEqual(response.context["game"].review_count, 4)
+        self.assertEqual(response.context["game"].reviews_1, 1)
+        # Оцінка поза 1-5 не проходить валідацію
+        self.client.post(url, {"text": "bad", "rating": 9})
+        self.assertEqual(Review.objects.filter(game=self.game).count(), 4)
+
+    def test_stale_game_save_keeps_counters(self):
+        stale = Game.objects.get(pk=self.game.pk)
+        Review.objects.create(game=self.game, text="r", rating=1)
+        stale.title = "Renamed"
+        stale.save()
+        self.assertEqual(Game.objects.get(pk=self.game.pk).review_count, 4)
+
+    def test_reviews_paginated(self):
+        for i in range(12):
+            Review.objects.create(game=self.other, text=f"bulk {i}", rating=3)
+        url = reverse("game_detail", args=[self.other.id])
+        first = self.client.get(url)
+        self.assertEqual(len(first.context["reviews"]), 10)
+        self.assertEqual(first.context["reviews_num_pages"], 2)
+        self.assertContains(first, "bulk 11")
+        second = self.client.get(url, {"reviews_page": 2})
+        self.assertEqual(len(second.context["reviews"]), 3)
+        self.assertContains(second, "bulk 0")
+
+    def test_catalog_sorted_by_score(self):
+        response = self.client.get(reverse("api_game_list"), {"sort": "rating", "fields": "id,review_average", "format": "json"})
+        self.assertEqual([g["id"] for g in response.json()], [self.other.id, self.game.id])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("api_game_list"), {"sort": "rating", "format": "json"})
+        self.assertNotIn("AVG", " ".join(q["sql"] for q in queries).upper())
+
+    def test_recompute_command(self):
+        Game.objects.filter(pk=self.game.pk).update(review_count=0, review_sum=0, reviews_4=7)
+        out = StringIO()
+        call_command("recompute_review_stats", stdout=out)
+        self.assertIn("fixed 1", out.getvalue())
+        self.game.refresh_from_db()
+        self.assertEqual((self.game.review_count, self.game.review_sum, self.game.reviews_4), (3, 13, 2))
+
+
+from .cart import cart_count_key
+
+class DatabaseCartTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="buyer", password="123456")
+        self.games = [
+            Game.objects.create(title=f"Game {i}", description="d", genre="RPG", release_year=2020, price=100, discount=10 * i)
+            for i in range(3)
+        ]
+
+    def test_session_cart_merged_on_login(self):
+        self.client.get(reverse("add_to_cart", args=[self.games[0].id]))
+        self.client.get(reverse("add_to_cart", args=[self.games[1].id]))
+        Cart.objects.create(user=self.user).items.create(game=self.games[1])
+
+        self.client.post(reverse("login"), {"username": "buyer", "password": "123456"})
+        self.assertCountEqual(
+            CartItem.objects.filter(cart__user=self.user).values_list("game_id", flat=True),
+            [self.games[0].id, self.games[1].id],
+        )
+        self.assertNotIn("cart", self.client.session)
+
+    def test_total_in_one_query(self):
+        self.client.force_login(self.user)
+        for game in self.games:
+            self.client.get(reverse("add_to_cart", args=[game.id]))
+        response = self.client.get(reverse("cart"))
+        self.assertAlmostEqual(response.context["total"], Decimal("270"), places=2)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("cart"))
+        # Список ігор і один агрегат для суми
+        cart_queries = [q["sql"].upper() for q in queries if "games_cartitem" in q["sql"]]
+        self.assertEqual(len(cart_queries), 2)
+        self.assertEqual(len([sql for sql in cart_queries if "SUM(" in sql]), 1)
+
+        self.client.get(reverse("remove_from_cart", args=[self.games[0].id]))
+        self.assertAlmostEqual(self.client.get(reverse("cart")).context["total"], Decimal("170"), places=2)
+
+    def test_navbar_count_is_cached(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse("add_to_cart", args=[self.games[0].id]))
+        self.assertIsNone(cache.get(cart_count_key(self.user.id)))
+
+        self.assertEqual(self.client.get(reverse("favorites")).context["cart_counter"], 1)
+        self.assertEqual(cache.get(cart_count_key(self.user.id)), 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("favorites"))
+        self.assertFalse([q for q in queries if "games_cartitem" in q["sql"]])
+
+
+import hashlib
+import hmac
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.test import override_settings
+import stripe
+
+class StripeStub:
+    """Локальна заглушка Stripe API: створення і отримання Checkout Session."""
+
+    def __init__(self):
+        self.sessions = {}
+        self.requests = 0
+        # Скільки наступних POST відповісти 500
+        self.failures = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, data, status=200):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stub.requests += 1
+                if stub.failures:
+                    stub.failures -= 1
+                    return self.reply({"error": {"type": "api_error", "message": "Internal error"}}, 500)
+                session_id = f"cs_test_{len(stub.sessions) + 1}"
+                stub.sessions[session_id] = {
+                    "id": session_id,
+                    "object": "checkout.session",
+                    "url": f"https://checkout.stripe.test/{session_id}",
+                    "payment_status": "unpaid",
+                }
+                self.reply(stub.sessions[session_id])
+
+            def do_GET(self):
+                session_id = self.path.rstrip("/").split("/")[-1].split("?")[0]
+                if session_id not in stub.sessions:
+                    self.reply({"error": {"type": "invalid_request_error", "message": "No such session"}}, 404)
+                else:
+                    self.reply(stub.sessions[session_id])
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        self.patcher = mock.patch.object(stripe, "api_base", f"http://127.0.0.1:{self.server.server_port}")
+        self.patcher.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.patcher.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+from django.core import mail
+from . import images, orders, tasks
+
+
+WEBHOOK_SECRET = "whsec_test"
+
+
+def signed_webhook(client, event):
+    payload = json.dumps(event)
+    timestamp = int(time_module.time())
+    signature = hmac.new(WEBHOOK_SECRET.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return client.post(
+        reverse("stripe_webhook"), payload, content_type="application/json",
+        HTTP_STRIPE_SIGNATURE=f"t={timestamp},v1={signature}",
+    )
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET, GAMES_TASKS_EAGER=False)
+class OrderFulfillmentTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="buyer", email="buyer@example.com", password="123456")
+        self.games = [
+            Game.objects.create(title=f"Game {i}", description="d", genre="RPG", release_year=2020, price=100, discount=50 * i)
+            for i in range(2)
+        ]
+        self.client.force_login(self.user)
+        for game in self.games:
+            self.client.get(reverse("add_to_cart", args=[game.id]))
+        # Варіанти аватара за замовчуванням тут не потрібні - не генеруємо їх у MEDIA_ROOT
+        Task.objects.filter(name=images.build_variants.task_name).delete()
+        self.stub = StripeStub().__enter__()
+        self.addCleanup(self.stub.__exit__)
+
+    def checkout(self):
+        response = self.client.get(reverse("stripe_checkout"))
+        self.assertTrue(response["Location"].startswith("https://checkout.stripe.test/"))
+        return Order.objects.get(user=self.user)
+
+    def completed_event(self, order, payment_status="paid"):
+        return {
+            "id": "evt_test",
+            "object": "event",
+            "type": "checkout.session.completed",
+            "data": {"object": {"id": order.stripe_session_id, "object": "checkout.session", "payment_status": payment_status}},
+        }
+
+    def test_checkout_creates_pending_order(self):
+        order = self.checkout()
+        self.assertEqual(order.status, "pending")
+        self.assertEqual(order.total, Decimal("150"))
+        self.assertEqual(sorted(order.lines.values_list("price", flat=True)), [Decimal("50"), Decimal("100")])
+        self.assertFalse(PurchasedGame.objects.exists())
+
+    def test_success_page_does_not_trust_session(self):
+        order = self.checkout()
+        self.client.get(reverse("payment_success"), {"session_id": order.stripe_session_id})
+        self.assertFalse(PurchasedGame.objects.exists())
+        # Stripe ще не підтвердив оплату - перевірка повториться пізніше
+        with self.assertLogs("games.tasks", "WARNING"):
+            self.assertEqual(tasks.run_pending(), 1)
+        check = Task.objects.get(key=f"confirm:{order.stripe_session_id}")
+        self.assertEqual((check.status, check.attempts), ("queued", 1))
+        self.assertGreater(check.run_at, timezone.now())
+        self.assertFalse(PurchasedGame.objects.exists())
+
+        self.stub.sessions[order.stripe_session_id]["payment_status"] = "paid"
+        self.client.get(reverse("payment_success"), {"session_id": order.stripe_session_id})
+        self.assertEqual(Task.objects.filter(name=orders.confirm_checkout.task_name).count(), 1)
+        Task.objects.filter(pk=check.pk).update(run_at=timezone.now())
+        tasks.run_pending()
+        response = self.client.get(reverse("payment_success"), {"session_id": order.stripe_session_id})
+        self.assertEqual(response.context["order"].status, "paid")
+        self.assertEqual(PurchasedGame.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(self.client.get(reverse("favorites")).context["cart_counter"], 0)
+
+    def test_success_page_restarts_exhausted_check(self):
+        order = self.checkout()
+        params = {"session_id": order.stripe_session_id}
+        self.assertTrue(self.client.get(reverse("payment_success"), params).context["checking"])
+        check = Task.objects.get(key=f"confirm:{order.stripe_session_id}")
+        with self.assertLogs("games.tasks", "WARNING"):
+            for _ in range(check.max_attempts):
+                Task.objects.filter(pk=check.pk).update(run_at=timezone.now())
+                tasks.run_pending()
+        self.assertEqual(Task.objects.get(pk=check.pk).status, "failed")
+
+        # Автооновлення не перезапускає перевірку і зупиняється
+        polled = self.client.get(reverse("payment_success"), {**params, "poll": 1})
+        self.assertFalse(polled.context["checking"])
+        self.assertNotContains(polled, "location.replace")
+        self.assertEqual(Task.objects.get(pk=check.pk).status, "failed")
+
+        # Новий візит - перевірка знову в черзі
+        self.stub.sessions[order.stripe_session_id]["payment_status"] = "paid"
+        self.assertTrue(self.client.get(reverse("payment_success"), params).context["checking"])
+        self.assertEqual(Task.objects.get(pk=check.pk).attempts, 0)
+        tasks.run_pending()
+        order.refresh_from_db()
+        self.assertEqual(order.status, "paid")
+
+    def test_webhook_is_idempotent(self):
+        order = self.checkout()
+        self.assertEqual(signed_webhook(self.client, self.completed_event(order, "unpaid")).status_code, 200)
+        self.assertFalse(Task.objects.exists())
+
+        signed_webhook(self.client, self.completed_event(order))
+        signed_webhook(self.client, self.completed_event(order))
+        self.assertEqual(Task.objects.filter(key=f"fulfill:{order.stripe_session_id}").count(), 1)
+        self.assertFalse(PurchasedGame.objects.exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            tasks.run_pending()
+        inserts = [q for q in queries if q["sql"].startswith("INSERT") and "games_purchasedgame" in q["sql"]]
+        self.assertEqual(len(inserts), 1)
+
+        self.assertEqual(PurchasedGame.objects.filter(user=self.user).count(), 2)
+        order.refresh_from_db()
+        self.assertEqual(order.status, "paid")
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["buyer@example.com"])
+        self.assertIn("Game 1", mail.outbox[0].body)
+
+    def test_webhook_rejects_bad_signature(self):
+        order = self.checkout()
+        response = self.client.post(
+            reverse("stripe_webhook"), json.dumps(self.completed_event(order)),
+            content_type="application/json", HTTP_STRIPE_SIGNATURE="t=1,v1=forged",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PurchasedGame.objects.exists())
+
+
+from games import payments
+
+
+class CircuitBreakerTest(TestCase):
+
+    def test_opens_after_failures_and_lets_one_probe_through(self):
+        breaker = payments.CircuitBreaker(failures=2, reset_timeout=30)
+        breaker.failure()
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+
+        with mock.patch("games.payments.time.monotonic", return_value=time_module.monotonic() + 31):
+            self.assertEqual(breaker.state, "half_open")
+            self.assertTrue(breaker.allow())
+            self.assertFalse(breaker.allow())
+
+        breaker.success()
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
+
+
+class AsyncCheckoutTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="buyer", password="123456")
+        game = Game.objects.create(title="Game", description="d", genre="RPG", release_year=2020, price=100)
+        self.client.force_login(self.user)
+        self.client.get(reverse("add_to_cart", args=[game.id]))
+        self.stub = StripeStub().__enter__()
+        self.addCleanup(self.stub.__exit__)
+        breaker = payments.CircuitBreaker(failures=2)
+        patcher = mock.patch.object(payments, "breaker", breaker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_retries_server_error(self):
+        self.stub.failures = 1
+        response = self.client.get(reverse("stripe_checkout"))
+        self.assertTrue(response["Location"].startswith("https://checkout.stripe.test/"))
+        self.assertEqual(self.stub.requests, 2)
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+
+    def test_open_circuit_skips_stripe(self):
+        payments.breaker.failure()
+        payments.breaker.failure()
+        response = self.client.get(reverse("stripe_checkout"))
+        self.assertEqual(response["Location"], reverse("cart") + "?payment_error=1")
+        self.assertEqual(self.stub.requests, 0)
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(self.client.get(response["Location"]).context["payment_error"])
+
+
+from .orders import create_order, fulfill_order
+from .ownership import owned_game_ids
+
+
+class OwnershipTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="owner", password="123456")
+        self.games = [
+            Game.objects.create(title=f"Game {i}", description="d", genre="RPG", release_year=2020, price=100)
+            for i in range(3)
+        ]
+        PurchasedGame.objects.create(user=self.user, game=self.games[0])
+        self.client.force_login(self.user)
+
+    def owned_queries(self, queries):
+        return [q for q in queries if "games_purchasedgame" in q["sql"]]
+
+    def test_loaded_once_and_cached(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("game_detail", args=[self.games[0].id]))
+        self.assertContains(response, "У бібліотеці")
+        self.assertEqual(len(self.owned_queries(queries)), 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("game_detail", args=[self.games[1].id]))
+        self.assertContains(response, reverse("add_to_cart", args=[self.games[1].id]))
+        self.assertEqual(self.owned_queries(queries), [])
+
+    def test_purchase_invalidates(self):
+        self.assertEqual(owned_game_ids(self.user.pk), {self.games[0].id})
+        create_order(self.user, "cs_owned", [{"id": self.games[1].id, "final_price": Decimal("100")}])
+        fulfill_order("cs_owned")
+        self.assertEqual(owned_game_ids(self.user.pk), {self.games[0].id, self.games[1].id})
+
+        PurchasedGame.objects.filter(user=self.user, game=self.games[0]).delete()
+        self.assertEqual(owned_game_ids(self.user.pk), {self.games[1].id})
+
+    def test_cart_rejects_owned(self):
+        response = self.client.get(reverse("add_to_cart", args=[self.games[0].id]))
+        self.assertRedirects(response, reverse("game_detail", args=[self.games[0].id]))
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_merge_skips_owned(self):
+        self.client.logout()
+        for game in self.games[:2]:
+            self.client.get(reverse("add_to_cart", args=[game.id]))
+        self.client.login(username="owner", password="123456")
+        self.assertEqual(list(CartItem.objects.values_list("game_id", flat=True)), [self.games[1].id])
+
+    def test_exposed_to_catalog_and_api(self):
+        response = self.client.get(reverse("game_list"))
+        self.assertEqual(response.context["owned_ids"], [self.games[0].id])
+        self.assertContains(response, 'id="owned-game-ids"')
+
+        response = self.client.get(reverse("api_owned_games"), {"format": "json"})
+        self.assertEqual(response.json(), {"game_ids": [self.games[0].id]})
+
+
+from .friends import add_friendships, friend_ids, mutual_counts, mutual_friends, remove_friendships, suggestions
+
+
+class FriendGraphTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.me, self.ann, self.bob, self.cat, self.dan = [
+            User.objects.create_user(username=name, password="123456")
+            for name in ("me", "ann", "bob", "cat", "dan")
+        ]
+
+    def test_bulk_mutations_are_single_statements(self):
+        FriendRequest.objects.create(sender=self.ann, receiver=self.me)
+        with CaptureQueriesContext(connection) as queries:
+            add_friendships([(self.me.id, self.ann.id), (self.me.id, self.bob.id)])
+        writes = [q["sql"].split()[0] for q in queries if q["sql"].startswith(("INSERT", "DELETE"))]
+        self.assertEqual(writes, ["INSERT", "DELETE"])
+        self.assertEqual(Friend.objects.count(), 4)
+        self.assertFalse(FriendRequest.objects.exists())
+
+        remove_friendships([(self.ann.id, self.me.id), (self.bob.id, self.me.id)])
+        self.assertFalse(Friend.objects.exists())
+
+    def test_adjacency_set_is_cached_and_invalidated(self):
+        add_friendships([(self.me.id, self.ann.id)])
+        self.assertEqual(friend_ids(self.me.id), {self.ann.id})
+        with self.assertNumQueries(0):
+            self.assertEqual(friend_ids(self.me.id), {self.ann.id})
+
+        remove_friendships([(self.me.id, self.ann.id)])
+        self.assertEqual(friend_ids(self.me.id), set())
+        self.assertEqual(friend_ids(self.ann.id), set())
+
+    def test_mutual_friends_and_suggestions(self):
+        add_friendships([
+            (self.me.id, self.ann.id), (self.me.id, self.bob.id),
+            (self.ann.id, self.cat.id), (self.bob.id, self.cat.id),
+            (self.ann.id, self.dan.id),
+        ])
+        self.assertEqual(set(mutual_friends(self.me.id, self.cat.id)), {self.ann, self.bob})
+        self.assertEqual(mutual_counts(self.me.id, [self.cat.id, self.dan.id]), {self.cat.id: 2, self.dan.id: 1})
+
+        with self.assertNumQueries(2):
+            result = suggestions(self.me.id)
+        self.assertEqual([(u.id, u.mutual) for u in result], [(self.cat.id, 2), (self.dan.id, 1)])
+
+        FriendRequest.objects.create(sender=self.me, receiver=self.cat)
+        self.assertEqual([u.id for u in suggestions(self.me.id)], [self.dan.id])
+
+    def test_many_friends(self):
+        others = User.objects.bulk_create(User(username=f"fan-{i}") for i in range(1200))
+        add_friendships([(self.me.id, other.id) for other in others] + [(others[0].id, self.cat.id)])
+        self.assertEqual(len(friend_ids(self.me.id)), 1200)
+        with self.assertNumQueries(1):
+            self.assertEqual(mutual_counts(self.me.id, [self.cat.id]), {self.cat.id: 1})
+        self.assertEqual([u.id for u in suggestions(self.me.id)], [self.cat.id])
+
+    def test_request_views_use_graph(self):
+        self.client.force_login(self.me)
+        FriendRequest.objects.create(sender=self.ann, receiver=self.me)
+        fr = FriendRequest.objects.get()
+        self.client.get(reverse("accept_friend_request", args=[fr.id]))
+        self.assertEqual(friend_ids(self.me.id), {self.ann.id})
+        self.assertEqual(self.client.get(reverse("chat", args=[self.ann.id])).status_code, 200)
+
+        self.client.get(reverse("remove_friend", args=[self.ann.id]))
+        self.assertEqual(friend_ids(self.ann.id), set())
+        self.assertRedirects(self.client.get(reverse("chat", args=[self.ann.id])), reverse("profile"))
+
+
+import io as io_module
+import shutil
+import tempfile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image as PILImage
+
+
+def uploaded_image(name="cover.jpg", size=(1000, 500), mode="RGB", fmt="JPEG"):
+    buffer = io_module.BytesIO()
+    PILImage.new(mode, size, (200, 30, 30)).save(buffer, format=fmt)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+class ImageDerivativesTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, GAMES_TASKS_EAGER=True, GAMES_TASKS_EAGER_INLINE=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_game(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            game = Game.objects.create(
+                title="Pictured", description="d", genre="RPG", release_year=2020, price=100, **kwargs
+            )
+        game.refresh_from_db()
+        return game
+
+    def test_upload_generates_derivatives(self):
+        game = self.create_game(image=uploaded_image())
+        variants = game.image_variants
+        self.assertEqual(variants["source"], game.image.name)
+        self.assertEqual((variants["width"], variants["height"]), (1000, 500))
+        self.assertEqual(variants["widths"], [120, 240, 460, 920])
+        storage = game.image.storage
+        for fmt in images.FORMATS:
+            path = images.derivative_name(game.image.name, 240, fmt)
+            with storage.open(path) as derivative:
+                self.assertEqual(PILImage.open(derivative).size, (240, 120))
+
+    def test_small_and_transparent_image(self):
+        game = self.create_game(image=uploaded_image("logo.png", (100, 80), "RGBA", "PNG"))
+        self.assertEqual(game.image_variants["widths"], [100])
+        with game.image.storage.open(images.derivative_name(game.image.name, 100, "jpeg")) as derivative:
+            self.assertEqual(PILImage.open(derivative).mode, "RGB")
+
+    def test_catalog_and_api_expose_srcset(self):
+        game = self.create_game(image=uploaded_image())
+        response = self.client.get(reverse("game_list"))
+        self.assertContains(response, '<source type="image/avif"')
+        path = images.derivative_name(game.image.name, 120, "webp")
+        versions = game.image_variants["versions"]
+        self.assertContains(response, f"{game.image.storage.url(path)}?v={versions[path]} 120w")
+
+        data = self.client.get(reverse("api_game_detail", args=[game.id]), {"format": "json"}).json()
+        self.assertEqual(data["image"]["url"], f"{game.image.url}?v={versions[game.image.name]}")
+        self.assertIn(" 920w", data["image"]["srcset"]["avif"])
+        self.assertEqual(FastGameSerializer().serialize(Game.objects.all()), GameSerializer(Game.objects.all(), many=True).data)
+
+    def test_content_versions_are_stored_with_variants(self):
+        game = self.create_game(image=uploaded_image())
+        versions = game.image_variants["versions"]
+        with game.image.open("rb") as source:
+            self.assertEqual(versions[game.image.name], content_version(source.chunks()))
+        self.assertEqual(len(versions), 1 + len(game.image_variants["widths"]) * len(images.FORMATS))
+
+        # Сторінка не рахує хешів: вони вже є в image_variants
+        with mock.patch("games.images.content_version", side_effect=AssertionError):
+            self.assertContains(self.client.get(reverse("game_list")), f"?v={versions[game.image.name]}")
+
+        source = game.image.name
+        game.image = uploaded_image("new.jpg", size=(800, 400))
+        with self.captureOnCommitCallbacks(execute=True):
+            game.save()
+        game.refresh_from_db()
+        self.assertNotIn(versions[source], game.image_variants["versions"].values())
+
+    def test_replaced_file_ignores_old_variants(self):
+        game = self.create_game(image=uploaded_image())
+        game.image = uploaded_image("new.jpg")
+        game.save()
+        game.refresh_from_db()
+        representation = images.image_representation(game.image.name, game.image_variants)
+        self.assertEqual(representation["srcset"], {})
+
+    def test_backfill_command(self):
+        game = Game.objects.create(title="Old", description="d", genre="RPG", release_year=2020, price=1)
+        Game.objects.filter(pk=game.pk).update(image=game.image.field.storage.save("games/old.jpg", uploaded_image()))
+        out = StringIO()
+        call_command("build_image_derivatives", stdout=out)
+        game.refresh_from_db()
+        self.assertEqual(game.image_variants["source"], "games/old.jpg")
+        self.assertIn("games.Game: 1 processed, 0 failed", out.getvalue())
+
+        out = StringIO()
+        call_command("build_image_derivatives", stdout=out)
+        self.assertIn("games.Game: 0 processed", out.getvalue())
+
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from .media import content_version, versioned_url
+
+
+class MediaServingTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.content = bytes(range(256)) * 40
+        self.name = default_storage.save("avatars/a.png", ContentFile(self.content))
+
+    def test_hashed_url_is_immutable(self):
+        url = versioned_url(default_storage, self.name, content_version([self.content]))
+        self.assertRegex(url, r"^/media/avatars/a\.png\?v=[0-9a-f]{12}$")
+        response = self.client.get(url)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(response["Content-Type"], "image/png")
+
+        response = self.client.get("/media/avatars/a.png")
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+    def test_etag_follows_file_changes(self):
+        etag = self.client.get("/media/avatars/a.png")["ETag"]
+        default_storage.delete(self.name)
+        default_storage.save(self.name, ContentFile(b"changed"))
+        response = self.client.get("/media/avatars/a.png", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"changed")
+
+    def test_range_requests(self):
+        response = self.client.get("/media/avatars/a.png", HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), self.content[10:20])
+        self.assertEqual(response["Content-Range"], f"bytes 10-19/{len(self.content)}")
+
+        response = self.client.get("/media/avatars/a.png", HTTP_RANGE="bytes=-5")
+        self.assertEqual(b"".join(response.streaming_content), self.content[-5:])
+
+        response = self.client.get("/media/avatars/a.png", HTTP_RANGE=f"bytes={len(self.content)}-")
+        self.assertEqual(response.status_code, 416)
+
+        response = self.client.get("/media/avatars/a.png", HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_head_and_missing_files(self):
+        response = self.client.head("/media/avatars/a.png")
+        self.assertEqual(response["Content-Length"], str(len(self.content)))
+        self.assertEqual(response.content, b"")
+        self.assertEqual(self.client.get("/media/avatars/missing.png").status_code, 404)
+        self.assertEqual(self.client.get("/media/../gamehub/settings.py").status_code, 404)
+
+    def test_offload_to_front_server(self):
+        with self.settings(GAMES_MEDIA_SENDFILE="x-accel-redirect"):
+            response = self.client.get("/media/avatars/a.png")
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/avatars/a.png")
+        self.assertEqual(response.content, b"")
+
+        with self.settings(GAMES_MEDIA_SENDFILE="x-sendfile"):
+            response = self.client.get("/media/avatars/a.png")
+        self.assertEqual(response["X-Sendfile"], default_storage.path(self.name))
+
+
+CALLS = []
+
+
+@tasks.task(max_attempts=3, retry_delay=1)
+def record_call(value, fail_times=0):
+    CALLS.append(value)
+    if CALLS.count(value) <= fail_times:
+        raise RuntimeError(f"failure {value}")
+
+
+@tasks.task(max_attempts=1)
+def record_thread():
+    CALLS.append(threading.current_thread().name)
+
+
+@override_settings(GAMES_TASKS_EAGER=False)
+class TaskQueueTest(TestCase):
+
+    def setUp(self):
+        CALLS.clear()
+        self.admin = User.objects.create_superuser(username="admin", password="123456")
+        Task.objects.all().delete()
+
+    def test_idempotency_key(self):
+        first = tasks.enqueue(record_call, key="once", value=1)
+        second = tasks.enqueue(record_call, key="once", value=2)
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(tasks.run_pending(), 1)
+        self.assertEqual(CALLS, [1])
+        # Ключ тримається і після виконання - аж до purge
+        tasks.enqueue(record_call, key="once", value=3)
+        self.assertEqual(tasks.run_pending(), 0)
+
+    def test_retries_with_backoff(self):
+        item = tasks.enqueue(record_call, value="flaky", fail_times=1)
+        with self.assertLogs("games.tasks", "WARNING"):
+            tasks.run_pending()
+        item.refresh_from_db()
+        self.assertEqual((item.status, item.attempts), ("queued", 1))
+        self.assertIn("failure flaky", item.last_error)
+        self.assertGreater(item.run_at, timezone.now())
+        # До кінця паузи задача не береться
+        self.assertEqual(tasks.run_pending(), 0)
+
+        Task.objects.filter(pk=item.pk).update(run_at=timezone.now())
+        tasks.run_pending()
+        item.refresh_from_db()
+        self.assertEqual((item.status, item.attempts, item.last_error), ("done", 2, ""))
+
+    def test_gives_up_after_max_attempts(self):
+        item = tasks.enqueue(record_call, value="broken", fail_times=10)
+        with self.assertLogs("games.tasks", "WARNING") as logs:
+            for _ in range(3):
+                Task.objects.filter(pk=item.pk).update(run_at=timezone.now())
+                tasks.run_pending()
+        self.assertIn("failed after 3 attempts", logs.output[-1])
+        item.refresh_from_db()
+        self.assertEqual((item.status, item.attempts), ("failed", 3))
+        self.assertEqual(len(CALLS), 3)
+
+    def test_backoff_grows(self):
+        self.assertLessEqual(tasks.backoff(1, 10), 10)
+        self.assertGreaterEqual(tasks.backoff(4, 10), 40)
+        self.assertLessEqual(tasks.backoff(30, 10), tasks.MAX_RETRY_DELAY)
+
+    def test_claim_is_exclusive_and_lease_expires(self):
+        item = tasks.enqueue(record_call, value=1)
+        delayed = tasks.enqueue(record_call, value=2, delay=60)
+        self.assertEqual(tasks.claim_next().pk, item.pk)
+        self.assertIsNone(tasks.claim_next())
+
+        # Воркер впав - після оренди задачу бере інший
+        Task.objects.filter(pk=item.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(tasks.claim_next().attempts, 2)
+        self.assertEqual(Task.objects.get(pk=delayed.pk).status, "queued")
+
+    def test_unknown_task(self):
+        with self.assertRaises(LookupError):
+            tasks.enqueue("games.tests.missing")
+        item = Task.objects.create(name="games.tests.missing")
+        tasks.run_pending()
+        item.refresh_from_db()
+        self.assertEqual(item.status, "failed")
+
+    def test_stats(self):
+        tasks.enqueue(record_call, value=1)
+        tasks.enqueue(record_call, value=2, fail_times=5)
+        tasks.enqueue(record_call, value=3, delay=60)
+        with self.assertLogs("games.tasks", "WARNING"):
+            tasks.run_pending()
+        stats = tasks.queue_stats()
+        self.assertEqual((stats["queued"], stats["due"], stats["done"]), (2, 0, 1))
+        self.assertEqual(stats["completed_last_hour"], 1)
+        self.assertIsNotNone(stats["avg_wait"])
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("api_task_stats"), {"format": "json"})
+        self.assertEqual(response.json()["queued"], 2)
+
+    def test_worker_needs_shared_cache(self):
+        # LocMemCache воркера: інвалідації не дійшли б до веб-процесів
+        with self.assertRaisesMessage(CommandError, "GAMES_REDIS_URL"):
+            call_command("run_tasks", "--once", stdout=StringIO())
+
+    def test_eager_mode_retries_on_enqueue(self):
+        with override_settings(GAMES_TASKS_EAGER=True, GAMES_TASKS_EAGER_INLINE=True), \
+                self.assertLogs("games.tasks", "WARNING"):
+            with self.captureOnCommitCallbacks(execute=True):
+                item = tasks.enqueue(record_call, key="eager", value="e", fail_times=1)
+            # Пауза перед повтором ще не минула - нічого не виконується
+            with self.captureOnCommitCallbacks(execute=True):
+                tasks.enqueue(record_call, key="eager", value="e", fail_times=1)
+            self.assertEqual(CALLS, ["e"])
+            Task.objects.filter(pk=item.pk).update(run_at=timezone.now())
+            with self.captureOnCommitCallbacks(execute=True):
+                tasks.enqueue(record_call, key="eager", value="e", fail_times=1)
+        self.assertEqual(CALLS, ["e", "e"])
+        self.assertEqual(Task.objects.get(pk=item.pk).status, "done")
+
+    def test_purge_releases_keys(self):
+        tasks.enqueue(record_call, key="daily", value=1)
+        tasks.run_pending()
+        Task.objects.update(finished_at=timezone.now() - tasks.RETENTION - timedelta(minutes=1))
+        self.assertEqual(tasks.purge(), 1)
+        tasks.enqueue(record_call, key="daily", value=2)
+        tasks.run_pending()
+        self.assertEqual(CALLS, [1, 2])
+
+
+@override_settings(GAMES_TASKS_EAGER=True)
+class EagerBackgroundTaskTest(TransactionTestCase):
+    # Пул потоків бачить лише закомічені рядки - тому TransactionTestCase
+
+    def setUp(self):
+        CALLS.clear()
+
+    def wait_for(self, item):
+        deadline = time_module.monotonic() + 5
+        while Task.objects.get(pk=item.pk).status != "done" and time_module.monotonic() < deadline:
+            time_module.sleep(0.05)
+        return Task.objects.get(pk=item.pk)
+
+    def test_runs_outside_request_thread(self):
+        item = tasks.enqueue(record_thread)
+        self.assertEqual(self.wait_for(item).status, "done")
+        self.assertTrue(CALLS[0].startswith("tasks-eager"))
+
+    def test_retry_is_scheduled(self):
+        with self.assertLogs("games.tasks", "WARNING"):
+            item = tasks.enqueue(record_call, value="b", fail_times=1)
+            self.assertEqual(self.wait_for(item).status, "done")
+        self.assertEqual(CALLS, ["b", "b"])
+
+from django.contrib.sessions.models import Session
+from .sessions import SessionIds, encode_ids, flush_dirty
+
+
+class SessionStorageTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.games = [
+            Game.objects.create(title=f"Game {i}", description="d", genre="RPG", release_year=2020, price=100)
+            for i in range(3)
+        ]
+
+    def session_writes(self, queries):
+        return [q for q in queries if "django_session" in q["sql"] and not q["sql"].startswith("SELECT")]
+
+    def test_compact_ids(self):
+        self.assertEqual(encode_ids([100, 5, 13, 12, 5]), "5.7.1.2f")
+        self.assertEqual(decode_ids("5.7.1.2f"), [5, 12, 13, 100])
+        # Старі сесії: список бажаного і словник кошика
+        self.assertEqual(decode_ids([3, 1]), [1, 3])
+        self.assertEqual(decode_ids({"7": 1, "2": 1}), [2, 7])
+        self.assertEqual(decode_ids(""), [])
+
+    def test_unchanged_session_is_not_written(self):
+        url = reverse("add_to_favorites", args=[self.games[0].id])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertEqual(len(self.session_writes(queries)), 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+            self.client.get(reverse("remove_from_cart", args=[self.games[1].id]))
+            self.client.get(reverse("favorites"))
+        # Ні записів, ні читання сесії з БД - вона в кеші
+        self.assertFalse([q for q in queries if "django_session" in q["sql"]])
+
+    def test_sessions_are_written_through(self):
+        self.client.get(reverse("add_to_favorites", args=[self.games[0].id]))
+        self.client.get(reverse("add_to_cart", args=[self.games[1].id]))
+        session = Session.objects.get(session_key=self.client.cookies["sessionid"].value)
+        self.assertEqual(decode_ids(session.get_decoded()["cart"]), [self.games[1].id])
+
+        # Інший процес зі своїм порожнім кешем бачить щойно збережену сесію
+        cache.clear()
+        response = self.client.get(reverse("favorites"))
+        self.assertEqual([game.id for game in response.context["games"]], [self.games[0].id])
+
+    @override_settings(GAMES_SESSION_WRITE_BEHIND=30)
+    def test_write_behind(self):
+        self.client.get(reverse("add_to_favorites", args=[self.games[0].id]))
+        session_key = self.client.cookies["sessionid"].value
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("add_to_cart", args=[self.games[1].id]))
+            self.client.get(reverse("add_to_cart", args=[self.games[2].id]))
+        self.assertEqual(self.session_writes(queries), [])
+        self.assertEqual(len(self.client.get(reverse("cart")).context["games"]), 2)
+
+        # Перший запуск лише запам'ятовує індекс, другий пише - обидві зміни одним UPDATE
+        self.assertEqual(flush_dirty(), 0)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(flush_dirty(), 1)
+        self.assertEqual(len(self.session_writes(queries)), 1)
+        cart = Session.objects.get(session_key=session_key).get_decoded()["cart"]
+        self.assertEqual(decode_ids(cart), [self.games[1].id, self.games[2].id])
+
+        # Зміна після flush знову потрапляє в індекс
+        self.client.get(reverse("remove_from_cart", args=[self.games[1].id]))
+        flush_dirty()
+        flush_dirty()
+        cart = Session.objects.get(session_key=session_key).get_decoded()["cart"]
+        self.assertEqual(decode_ids(cart), [self.games[2].id])
+
+        # Видалену сесію flush не відновлює
+        self.client.get(reverse("add_to_cart", args=[self.games[0].id]))
+        self.client.session.delete()
+        flush_dirty()
+        flush_dirty()
+        self.assertFalse(Session.objects.filter(session_key=session_key).exists())
+
+    def test_login_keeps_working(self):
+        user = User.objects.create_user(username="buyer", password="123456")
+        self.client.get(reverse("add_to_cart", args=[self.games[0].id]))
+        self.client.post(reverse("login"), {"username": "buyer", "password": "123456"})
+        self.assertEqual(self.client.get(reverse("cart")).context["user"], user)
+        self.assertEqual(CartItem.objects.filter(cart__user=user).count(), 1)
+
+        self.client.get(reverse("logout"))
+        self.assertFalse(self.client.get(reverse("cart")).context["user"].is_authenticated)
+
+    def test_session_ids(self):
+        session = self.client.session
+        favorites = SessionIds(session, "favorites")
+        self.assertTrue(favorites.add(5))
+        self.assertFalse(favorites.add(5))
+        self.assertIn(5, favorites)
+        self.assertFalse(favorites.remove(6))
+        favorites.clear()
+        self.assertNotIn("favorites", session)
+
+
+from .favorites import favorite_ids, most_wishlisted, toggle_favorites
+
+
+class FavoritesTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="fan", password="123456")
+        self.other = User.objects.create_user(username="other", password="123456")
+        self.games = [
+            Game.objects.create(title=f"Game {i}", description="d", genre="RPG", release_year=2020, price=100)
+            for i in range(4)
+        ]
+
+    def counts(self):
+        return list(Game.objects.order_by("id").values_list("favorite_count", flat=True))
+
+    def test_session_favorites_merged_on_login(self):
+        self.client.get(reverse("add_to_favorites", args=[self.games[0].id]))
+        self.client.get(reverse("add_to_favorites", args=[self.games[1].id]))
+        Favorite.objects.create(user=self.user, game=self.games[1])
+        Game.objects.filter(pk=self.games[1].pk).update(favorite_count=1)
+
+        self.client.post(reverse("login"), {"username": "fan", "password": "123456"})
+        self.assertEqual(favorite_ids(self.user.id), {self.games[0].id, self.games[1].id})
+        self.assertEqual(self.counts(), [1, 1, 0, 0])
+        self.assertNotIn("favorites", self.client.session)
+
+        response = self.client.get(reverse("favorites"))
+        self.assertEqual(len(response.context["games"]), 2)
+
+    def test_add_and_remove_keep_counts(self):
+        self.client.force_login(self.user)
+        url = reverse("add_to_favorites_ajax", args=[self.games[2].id])
+        self.client.get(url)
+        self.assertEqual(self.client.get(url).json()["favorites_count"], 1)
+        self.assertEqual(Favorite.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(self.counts(), [0, 0, 1, 0])
+
+        # Застарілий екземпляр гри не перезаписує лічильник
+        self.games[2].title = "Renamed"
+        self.games[2].save()
+        self.assertEqual(self.counts(), [0, 0, 1, 0])
+
+        self.client.get(reverse("remove_from_favorites", args=[self.games[2].id]))
+        self.client.get(reverse("remove_from_favorites", args=[self.games[2].id]))
+        self.assertEqual(self.counts(), [0, 0, 0, 0])
+
+    def test_batch_toggle_endpoint(self):
+        self.client.force_login(self.user)
+        url = reverse("api_favorites")
+        ids = [game.id for game in self.games]
+        data = self.client.post(url, {"game_ids": ids[:3] + [999999]}, content_type="application/json").json()
+        self.assertEqual(data["added"], ids[:3])
+        self.assertEqual(self.counts(), [1, 1, 1, 0])
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.post(url, {"game_ids": ids[1:]}, content_type="application/json").json()
+        self.assertEqual((data["added"], data["removed"]), ([ids[3]], ids[1:3]))
+        self.assertEqual(data["game_ids"], [ids[0], ids[3]])
+        self.assertEqual(self.counts(), [1, 0, 0, 1])
+        # Одна вставка і одне видалення на всю пачку
+        self.assertEqual(len([q for q in queries if q["sql"].startswith("INSERT") and "games_favorite" in q["sql"]]), 1)
+        self.assertEqual(len([q for q in queries if q["sql"].startswith("DELETE") and "games_favorite" in q["sql"]]), 1)
+
+        data = self.client.post(url, {"game_ids": ids, "action": "remove"}, content_type="application/json").json()
+        self.assertEqual(data["game_ids"], [])
+        self.assertEqual(self.client.get(url).json(), {"game_ids": []})
+        for payload in ({"game_ids": "1,2"}, {"game_ids": [True]}, {"game_ids": ids, "action": "drop"}):
+            self.assertEqual(self.client.post(url, payload, content_type="application/json").status_code, 400)
+
+    def test_most_wishlisted(self):
+        toggle_favorites(self.user.id, [self.games[0].id, self.games[3].id])
+        toggle_favorites(self.other.id, [self.games[3].id])
+        ranking = self.client.get(reverse("api_most_wishlisted"), {"format": "json"}).json()["results"]
+        self.assertEqual([(row["id"], row["favorite_count"]) for row in ranking], [(self.games[3].id, 2), (self.games[0].id, 1)])
+
+        self.other.delete()
+        cache.clear()
+        self.assertEqual([row["favorite_count"] for row in most_wishlisted()], [1, 1])
+
+    def test_recompute_command(self):
+        toggle_favorites(self.user.id, [self.games[0].id])
+        Game.objects.filter(pk=self.games[1].pk).update(favorite_count=5)
+        out = StringIO()
+        call_command("recompute_favorite_counts", stdout=out)
+        self.assertIn("fixed 1", out.getvalue())
+        self.assertEqual(self.counts(), [1, 0, 0, 0])
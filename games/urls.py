@@ -14,6 +14,7 @@ urlpatterns = [
 
     path('stripe/checkout/', stripe_checkout, name="stripe_checkout"),
     path('payment/success/', payment_success, name="payment_success"),
+    path('stripe/webhook/', stripe_webhook, name="stripe_webhook"),
 
     path('register/', register_view, name="register"),
     path('login/', login_view, name="login"),
@@ -32,10 +33,20 @@ urlpatterns = [
 
     path('chat/<int:user_id>', chat_view, name="chat"),
     path('chat/<int:user_id>/fetch/', fetch_messages, name='fetch_messages'),
+    path('chat/<int:user_id>/older/', older_messages, name='older_messages'),
+    path('chat/sync/', sync_messages, name='sync_messages'),
+    path('chat/<int:user_id>/read/', mark_messages_read, name='mark_messages_read'),
 
 
     path('api/games/', api_game_list, name="api_game_list"),
+    path('api/games/facets/', api_game_facets, name="api_game_facets"),
+    path('api/games/owned/', api_owned_games, name="api_owned_games"),
+    path('api/games/most-wishlisted/', api_most_wishlisted, name="api_most_wishlisted"),
+    path('api/favorites/', api_favorites, name="api_favorites"),
     path('api/games/<int:game_id>', api_game_detail, name="api_game_detail"),
     path('api/profile/', api_profile, name="api_profile"),
     path('api/messages/<int:user_id>', api_messages, name="api_messages"),
+    path('api/messages/unread/', api_unread, name="api_unread"),
+    path('api/cache/stats/', api_cache_stats, name="api_cache_stats"),
+    path('api/tasks/stats/', api_task_stats, name="api_task_stats"),
 ]
@@ -4,129 +4,244 @@ from django.core.paginator import Paginator
 from .models import *
 from .forms import ReviewForm, ProfileEditForm
 from django.http import JsonResponse
+from .search import search_games
+from .caching import REVIEWS_PAGE_SIZE, catalog_last_modified, catalog_version, game_detail_cache
+from django.http import Http404, HttpResponse
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+from urllib.parse import urlencode
+import hashlib
+import math
+from .pagination import CursorPaginator, InvalidCursor, approximate_count
+from .facets import apply_filters, catalog_facets
+from .cart import get_cart
+from .ownership import owned_game_ids, request_owned_game_ids
+from .friends import add_friendships, are_friends, friend_ids, mutual_counts, remove_friendships, suggestions
 
+# ?sort= -> порядок для order_by / keyset-пагінації (id - тай-брейк)
+CATALOG_ORDERINGS = {
+    'price': ('final_price', 'id'),
+    '-price': ('-final_price', 'id'),
+    # Середня оцінка - збережена колонка Game.review_average, без AVG() по Review
+    'rating': ('-review_average', '-review_count', 'id'),
+}
+CATALOG_FILTER_PARAMS = ('q', 'genre', 'year', 'min_price', 'max_price', 'on_sale', 'sort')
+
+
+def filter_catalog(games, params):
+    # Жанр (по індексованому genre_ref_id), рік і ціна - у SQL, див. games.facets
+    return apply_filters(games, params), CATALOG_ORDERINGS.get(params.get('sort'))
+
+
+def catalog_filter_query(params):
+    # Параметри фільтра каталогу без page/cursor - для посилань і ключів кешу
+    filter_params = params.copy()
+    for key in list(filter_params):
+        if key not in CATALOG_FILTER_PARAMS:
+            del filter_params[key]
+    return filter_params.urlencode()
+
+
+# Скільки секунд живе відрендерений фрагмент game_list_content.html
+CATALOG_FRAGMENT_TTL = 300
+
+
+def is_ajax(request):
+    return request.headers.get('x-requested-with') == "XMLHttpRequest"
+
+
+def catalog_etag(request, *args, **kwargs):
+    # Відповідь залежить лише від версії каталогу, URL (разом з параметрами) і формату
+    version = catalog_version()
+    variant = '|'.join((request.get_full_path(), request.META.get('HTTP_ACCEPT', ''), str(is_ajax(request))))
+    return f'"{version}-{hashlib.md5(variant.encode()).hexdigest()}"'
+
+
+def catalog_last_modified_for(request, *args, **kwargs):
+    return catalog_last_modified(catalog_version())
+
+
+def game_list_etag(request):
+    # Повна сторінка містить дані користувача (навбар), тож ETag - лише для AJAX-фрагмента
+    return catalog_etag(request) if is_ajax(request) else None
+
+
+def game_list_last_modified(request):
+    return catalog_last_modified_for(request) if is_ajax(request) else None
+
+
+@condition(etag_func=game_list_etag, last_modified_func=game_list_last_modified)
 def game_list(request):
-    query = request.GET.get('q', '')
-    genre = request.GET.get('genre', '')
+    version = catalog_version()
+    # Ключ - усі параметри запиту (q, genre, ціни, sort, page/cursor) у сталому порядку
+    params = urlencode(sorted(request.GET.lists()), doseq=True)
+    fragment_key = f"games:catalog_fragment:{version}:{hashlib.md5(params.encode()).hexdigest()}"
+    content = cache.get(fragment_key)
+    if content is None:
+        content = render_to_string('games/game_list_content.html', catalog_context(request, version), request)
+        cache.set(fragment_key, content, CATALOG_FRAGMENT_TTL)
+
+    if is_ajax(request):
+        response = HttpResponse(content)
+    else:
+        # Жанри й роки з кількістю ігор для поточного запиту - з кешу фасетів
+        response = render(request, 'games/game_list.html', {
+            'catalog_content': content,
+            'facets': catalog_facets(request.GET),
+            'query': request.GET.get('q', ''),
+            'selected_genre': request.GET.get('genre', ''),
+            'selected_year': request.GET.get('year', ''),
+            'min_price': request.GET.get('min_price', ''),
+            'max_price': request.GET.get('max_price', ''),
+            'on_sale': bool(request.GET.get('on_sale')),
+            'sort': request.GET.get('sort', ''),
+            # Фрагмент спільний для всіх, тож куплені ігри позначає JS за цим списком
+            'owned_ids': sorted(request_owned_game_ids(request)),
+        })
+    # Один URL віддає і сторінку, і фрагмент - кеш браузера не повинен їх плутати
+    patch_vary_headers(response, ['X-Requested-With'])
+    patch_cache_control(response, no_cache=True)
+    return response
 
-    games = Game.objects.all()
-    if query:
-        games = games.filter(title__icontains=query)
-    if genre:
-        games = games.filter(genre=genre)
 
-    genres = Game.objects.values_list('genre', flat=True).distinct()
-    # [(SHOOTER), (RPG), (RPG), (RP)] => [SHOOTER, RPG, RP]
+def catalog_context(request, version):
+    query = request.GET.get('q', '')
 
-    paginator = Paginator(games, 3)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    games, sort_ordering = filter_catalog(Game.objects.all(), request.GET)
+    filter_query = catalog_filter_query(request.GET)
+
+    if query:
+        # Пошук не обмежений: count і сторінки - по самому пошуковому запиту
+        games = search_games(query, games)
+        if sort_ordering:
+            games = games.order_by(*sort_ordering)
+        paginator = Paginator(games, 3)
+        page_number = request.GET.get('page')
+        page_obj = paginator.get_page(page_number)
+        total_count = paginator.count
+    else:
+        paginator = CursorPaginator(games, 3, ordering=sort_ordering or ('title', 'id'))
+        try:
+            page_obj = paginator.page(request.GET.get('cursor'))
+        except InvalidCursor:
+            page_obj = paginator.page()
+        total_count = approximate_count(games, f"game_list:{version}:{filter_query}")
     
-    context = {
+    return {
         'page_obj': page_obj,
-        'genres': genres,
-        'query': query,
-        'selected_genre': genre,
+        'cursor_mode': not query,
+        'total_count': total_count,
+        'filter_query': filter_query,
     }
-    if request.headers.get('x-requested-with') == "XMLHttpRequest":
-        return render(request, 'games/game_list_content.html', context)
-    
-    return render(request, 'games/game_list.html', context)
 
 def game_detail(request, game_id):
-    game = get_object_or_404(Game, id=game_id)
-    reviews = Review.objects.filter(game=game)
+    # Гра, скріншоти і відгуки - з read-through кешу (games.caching), інвалідація сигналами
+    detail = game_detail_cache.get(game_id)
+    if detail is None:
+        raise Http404("Game not found")
 
     form = ReviewForm(request.POST or None)
     if form.is_valid():
         review = form.save(commit=False)
-        review.game = game
+        review.game = detail['game']
+        # Агрегати гри оновлюються атомарно в Review.save()
         review.save()
+        detail = game_detail_cache.get(game_id)
+
+    game = detail['game']
+    num_pages = max(math.ceil(game.review_count / REVIEWS_PAGE_SIZE), 1)
+    try:
+        reviews_page = min(max(int(request.GET.get('reviews_page', 1)), 1), num_pages)
+    except ValueError:
+        reviews_page = 1
+    if reviews_page == 1:
+        reviews = detail['reviews']
+    else:
+        offset = (reviews_page - 1) * REVIEWS_PAGE_SIZE
+        reviews = Review.objects.filter(game_id=game_id).order_by('-id')[offset:offset + REVIEWS_PAGE_SIZE]
 
     return render(request, 'games/game_detail.html', 
-                    {'game': game, 
+                    {**detail,
                      'reviews': reviews,
+                     'reviews_page': reviews_page,
+                     'reviews_num_pages': num_pages,
                      'form': form
                      })
 
 
+from .favorites import get_favorites
+
 def add_to_favorites(request, game_id):
-    favorites = request.session.get('favorites', [])
-    if game_id not in favorites:
-        favorites.append(game_id)
-    
-    request.session['favorites'] = favorites
+    get_favorites(request).add(game_id)
     
     return redirect('game_list')
 
 def add_to_favorites_ajax(request, game_id):
-    favorites = request.session.get('favorites', [])
-    if game_id not in favorites:
-        favorites.append(game_id)
-    
-    request.session['favorites'] = favorites
+    favorites = get_favorites(request)
+    favorites.add(game_id)
     
     return JsonResponse({
         'status': 'ok',
-        'favorites_count': len(favorites)
+        'favorites_count': favorites.count()
     })
 
 def remove_from_favorites(request, game_id):
-    favorites = request.session.get('favorites', [])
-    if game_id in favorites:
-        favorites.remove(game_id)
-    request.session['favorites'] = favorites
+    get_favorites(request).remove(game_id)
     return redirect('favorites')
 
 def favorites(request):
-    favorites = request.session.get('favorites', [])
-    games = Game.objects.filter(id__in=favorites)
+    games = get_favorites(request).games()
     return render(request, 'games/favorites.html', {'games': games})
     
 
 def add_to_cart(request, game_id):
-    cart = request.session.get("cart", {})
-    game_id = str(game_id)
-    if game_id not in cart:
-        cart[game_id] = 1
-
-    request.session['cart'] = cart
+    get_object_or_404(Game, id=game_id)
+    if game_id in request_owned_game_ids(request):
+        return redirect('game_detail', game_id=game_id)
+    get_cart(request).add(game_id)
     return redirect('cart')
 
 def cart_view(request):
-    cart = request.session.get("cart", {})
-    game_ids = cart.keys()
+    cart = get_cart(request)
+    games = cart.games().only('id', 'title', 'genre', 'price', 'discount', 'final_price')
+    # Куплені вже після додавання (напр. з іншого пристрою) позначаються і в суму не входять
+    owned = request_owned_game_ids(request)
 
-    games = Game.objects.filter(id__in=game_ids)
-
-    total = 0
-    for game in games:
-        total += game.sell_price
     return render(request, 'games/cart.html', {
         'games': games,
-        'total': total
+        'total': cart.summary(exclude_ids=owned)['total'],
+        'payment_error': 'payment_error' in request.GET,
     })
 
 
 def remove_from_cart(request, game_id):
-    cart = request.session.get("cart", {})
-    game_id = str(game_id)
-    if game_id in cart:
-        del cart[game_id]
-
-    request.session['cart'] = cart
+    get_cart(request).remove(game_id)
     return redirect('cart')
 
 import stripe
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .cart import DatabaseCart
+from .orders import create_order, enqueue_confirmation, handle_webhook_event
+from .payments import create_checkout_session
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
-def stripe_checkout(request):
-    cart = request.session.get("cart", {})
-    if not cart:
+@login_required
+async def stripe_checkout(request):
+    # Async view: поки Stripe відповідає, воркер ASGI обслуговує інші запити
+    user = await request.auser()
+    # Назва і ціна зі знижкою (final_price рахує БД) - одним запитом
+    games = [game async for game in DatabaseCart(user).games().values('id', 'title', 'final_price')]
+    owned = await sync_to_async(owned_game_ids)(user.pk)
+    games = [game for game in games if game['id'] not in owned]
+    if not games:
         return redirect("cart")
-    
-    games = Game.objects.filter(id__in=cart.keys())
 
     items = []
     for game in games:
@@ -134,40 +249,68 @@ def stripe_checkout(request):
             'price_data': {
                 'currency': 'uah',
                 'product_data': {
-                    'name': game.title
+                    'name': game['title']
                 },
-                'unit_amount': int(game.sell_price * 100)
+                'unit_amount': int(game['final_price'] * 100)
             },
             'quantity': 1,
         })
-    session = stripe.checkout.Session.create(
-        payment_method_types=["card"],
-        line_items=items,
-        mode="payment",
-        success_url=request.build_absolute_uri('/payment/success/'),
-        cancel_url=request.build_absolute_uri('/cart/'),
-    )
+    try:
+        session = await create_checkout_session({
+            'payment_method_types': ["card"],
+            'line_items': items,
+            'mode': "payment",
+            # {CHECKOUT_SESSION_ID} Stripe підставляє сам
+            'success_url': request.build_absolute_uri('/payment/success/') + '?session_id={CHECKOUT_SESSION_ID}',
+            'cancel_url': request.build_absolute_uri('/cart/'),
+            'client_reference_id': str(user.id),
+        })
+    except stripe.error.StripeError:
+        # Таймаут, вичерпані повтори або відкритий circuit breaker
+        return redirect(reverse("cart") + '?payment_error=1')
+    await sync_to_async(create_order)(user, session.id, games)
     return redirect(session.url, code=303)
 
+@login_required
 def payment_success(request):
-    cart = request.session.get("cart", {})
-    if cart:
-        game_ids = cart.keys()
-        games = Game.objects.filter(id__in=game_ids)
-        
-        for game in games:
-            PurchasedGame.objects.get_or_create(
-                user=request.user,
-                game=game
-            )
+    # Покупки видаються лише після підтвердження від Stripe, а не за вмістом сесії
+    order = None
+    check = None
+    session_id = request.GET.get('session_id')
+    if session_id:
+        order = Order.objects.filter(stripe_session_id=session_id, user=request.user).first()
+    if order is not None and order.status != 'paid':
+        # Перевірку в Stripe робить воркер; сторінка оновлюється, поки перевірка в черзі.
+        # Автооновлення (?poll=1) не перезапускає перевірку, що вичерпала спроби, - лише новий візит
+        check = enqueue_confirmation(session_id, restart=not request.GET.get('poll'))
     
-    request.session["cart"] = {}
-    return render(request, "games/payment_success.html")
+    return render(request, "games/payment_success.html", {
+        'order': order,
+        'checking': check is not None and check.status in ('queued', 'running'),
+    })
+
+
+@csrf_exempt
+@require_POST
+def stripe_webhook(request):
+    try:
+        event = stripe.Webhook.construct_event(
+            request.body,
+            request.headers.get('stripe-signature', ''),
+            settings.STRIPE_WEBHOOK_SECRET,
+        )
+    except (ValueError, stripe.error.SignatureVerificationError):
+        return HttpResponse(status=400)
+
+    # Лише ставить видачу в чергу - Stripe отримує відповідь одразу
+    handle_webhook_event(event)
+    return HttpResponse(status=200)
 
 
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth import login, logout
 from django.utils import timezone
+from . import presence
 
 def register_view(request):
     form = UserCreationForm(request.POST or None)
@@ -184,10 +327,8 @@ def login_view(request):
         user = form.get_user()
         login(request, user)
 
-        profile = user.profile
-        profile.status = 'online'
-        profile.last_seen = timezone.now()
-        profile.save()
+        # Далі last_seen оновлює PresenceMiddleware
+        Profile.objects.filter(user=user).update(status='online', last_seen=timezone.now())
 
         return redirect('profile')
     return render(request, "accounts/login.html", {'form': form})
@@ -196,10 +337,8 @@ def login_view(request):
 def logout_view(request):
     if request.user.is_authenticated:
 
-        profile = request.user.profile
-        profile.status = 'offline'
-        profile.last_seen = timezone.now()
-        profile.save()
+        Profile.objects.filter(user=request.user).update(status='offline', last_seen=timezone.now())
+        presence.get_tracker().disconnect(request.user.id)
 
     logout(request)
     return redirect('game_list')
@@ -217,6 +356,13 @@ def profile_view(request):
     friends = Friend.objects.filter(user=request.user).select_related(
        'friend__profile'
     )
+    # Лічильники непрочитаних одним запитом на всю сторінку, без COUNT на кожного друга
+    unread = Conversation.objects.unread_counts(request.user)
+    friends = list(friends)
+    online = presence.online_status(item.friend_id for item in friends)
+    for item in friends:
+        item.unread = unread.get(item.friend_id, 0)
+        item.online = online[item.friend_id]
     
     incoming_requests = FriendRequest.objects.filter(
         receiver=request.user,
@@ -234,6 +380,8 @@ def profile_view(request):
         'friends': friends,
         'incoming_requests': incoming_requests,
         'outcoming_requests': outcoming_requests,
+        # Друзі друзів за кількістю спільних - один GROUP BY, див. games.friends
+        'suggestions': suggestions(request.user.id),
     })
 
 
@@ -245,7 +393,7 @@ def send_friend_request(request, user_id):
     if receiver == request.user:
         return redirect('profile')
 
-    if Friend.objects.filter(user=request.user, friend=receiver).exists():
+    if are_friends(request.user.id, receiver.id):
         return redirect('profile')
 
     if FriendRequest.objects.filter(
@@ -262,14 +410,8 @@ def send_friend_request(request, user_id):
     ).first()
 
     if reverse_request:
-        # reverse_request.status = 'accepted'
-        # reverse_request.save()
-        reverse_request.delete()
-
-
-        Friend.objects.create(user=request.user, friend=receiver)
-        Friend.objects.create(user=receiver, friend=request.user)
-
+        # Зустрічний запит - одразу друзі; запит видаляється в тій же транзакції
+        add_friendships([(request.user.id, receiver.id)])
         return redirect('profile')
 
     FriendRequest.objects.create(
@@ -287,10 +429,7 @@ def accept_friend_request(request, request_id):
         receiver=request.user
     )
 
-    fr.delete()
-
-    Friend.objects.create(user=fr.sender, friend=fr.receiver)
-    Friend.objects.create(user=fr.receiver, friend=fr.sender)
+    add_friendships([(fr.sender_id, fr.receiver_id)])
 
     return redirect('profile')
 
@@ -327,8 +466,7 @@ def remove_friend(request, user_id):
         id=user_id
     )
 
-    Friend.objects.filter(user=request.user, friend=fr).delete()
-    Friend.objects.filter(user=fr, friend=request.user).delete()
+    remove_friendships([(request.user.id, fr.id)])
 
     return redirect('profile')
 
@@ -342,78 +480,174 @@ def user_search_view(request):
         users = User.objects.filter(
             username__icontains=query
         ).exclude(id=request.user.id).select_related("profile")
-    friends_ids = Friend.objects.filter(user=request.user.id).values_list('friend_id', flat=True)
+        users = list(users)
+        online = presence.online_status(u.id for u in users)
+        mutual = mutual_counts(request.user.id, [u.id for u in users])
+        for u in users:
+            u.online = online[u.id]
+            u.mutual = mutual.get(u.id, 0)
     
     return render(request, "accounts/user_search.html", {
         'users': users,
         'query': query,
-        'friends_ids': list(friends_ids),
+        # Множина друзів з кешу games.friends
+        'friends_ids': friend_ids(request.user.id),
     })
 
+# Скільки повідомлень показувати/віддавати за раз
+CHAT_HISTORY_SIZE = 50
+
+
+def conversation_messages(user, other):
+    # Історія розмови: пошук Conversation по унікальному індексу,
+    # далі один range scan по message_history_idx (conversation, timestamp, id)
+    conversation = Conversation.objects.between(user, other)
+    if conversation is None:
+        return Message.objects.none()
+    return conversation.messages.order_by('timestamp', 'id')
+
+
+def history_page(messages, cursor=None, limit=CHAT_HISTORY_SIZE):
+    # Сторінка історії від найновіших до старіших по курсору (timestamp, id);
+    # повертає повідомлення в хронологічному порядку і курсор на старіші
+    paginator = CursorPaginator(messages, limit, ordering=('-timestamp', '-id'))
+    page = paginator.page(cursor)
+    return list(reversed(page.object_list)), page.next_cursor
+
 @login_required
 def chat_view(request, user_id):
    friend = get_object_or_404(User, id=user_id)
 
-   if not Friend.objects.filter(user=request.user, friend=friend).exists():
+   if not are_friends(request.user.id, friend.id):
        return redirect('profile')
 
 
-   messages = Message.objects.filter(
-       sender__in=[request.user, friend],
-       receiver__in=[request.user, friend]
-   ).order_by('timestamp')
+   if request.method == 'GET':
+       conversation = Conversation.objects.between(request.user, friend)
+       if conversation is not None:
+           conversation.mark_read(request.user)
+
+   messages, older_cursor = history_page(conversation_messages(request.user, friend))
 
 
    if request.method == 'POST':
        text = request.POST.get('text')
        if text:
-           Message.objects.create(
+           message = Message.objects.create(
                sender=request.user,
                receiver=friend,
                text=text
            )
+           # Відкриті WebSocket-з'єднання обох співрозмовників отримають повідомлення одразу
+           transaction.on_commit(lambda: publish_message(message))
        return redirect('chat', user_id=friend.id)
 
 
    return render(request, 'accounts/chat.html', {
        'friend': friend,
-       'messages': messages
+       'messages': messages,
+       'older_cursor': older_cursor,
    })
 
+
+@login_required
+def older_messages(request, user_id):
+    friend = get_object_or_404(User, id=user_id)
+
+    if not are_friends(request.user.id, friend.id):
+        return JsonResponse({'messages': [], 'older': None})
+
+    serializer = FastMessageSerializer(['id', 'sender', 'text', 'timestamp'])
+    try:
+        rows, older_cursor = history_page(
+            serializer.values(conversation_messages(request.user, friend)),
+            request.GET.get('before'),
+        )
+    except InvalidCursor:
+        return JsonResponse({'detail': 'Invalid cursor'}, status=400)
+
+    return JsonResponse({
+        'messages': [serializer.to_representation(row) for row in rows],
+        'older': older_cursor,
+    })
+
     
 
-from django.http import JsonResponse
-from django.utils.dateparse import parse_datetime
+from django.db import transaction
+from django.db.models import Q
+from django.views.decorators.http import require_POST
+from .realtime import publish_message
 
 @login_required
 def fetch_messages(request, user_id):
-    friend = get_object_or_404(User, id=user_id)
+    # Інкрементальна синхронізація однієї розмови: ?after=<id останнього побаченого повідомлення>.
+    # id монотонний, на відміну від timestamp, тож повідомлення не губляться і не дублюються
+    if not are_friends(request.user.id, user_id):
+        return JsonResponse({'messages': [], 'last_id': None, 'has_more': False})
 
-    if not Friend.objects.filter(user=request.user, friend=friend).exists():
-        return JsonResponse({'messages': []})
-    
-    last_time = request.GET.get("last_time")
+    after = parse_message_id(request.GET.get('after'))
+    messages = conversation_messages(request.user, user_id).filter(id__gt=after)
+    return JsonResponse(message_delta(messages, after))
+
+
+@login_required
+@require_POST
+def mark_messages_read(request, user_id):
+    # Позначає всю розмову прочитаною одним UPDATE і скидає лічильник
+    conversation = Conversation.objects.between(request.user, user_id)
+    marked = conversation.mark_read(request.user) if conversation is not None else 0
+    return JsonResponse({'marked': marked, 'unread': Conversation.objects.unread_total(request.user)})
 
+
+@login_required
+def sync_messages(request):
+    # Дельта по всіх розмовах користувача одним запитом - замість окремого опитування кожного чату
+    after = parse_message_id(request.GET.get('after'))
     messages = Message.objects.filter(
-        sender__in=[request.user, friend],
-        receiver__in=[request.user, friend],
+        Q(sender=request.user) | Q(receiver=request.user),
+        id__gt=after,
     )
+    return JsonResponse(message_delta(messages, after, user_id=request.user.id))
 
-    if last_time:
-        dt = parse_datetime(last_time)
-        if dt is not None:
-            messages = messages.filter(timestamp__gt=dt)
-    
-    messages.order_by("timestamp")
+
+SYNC_BATCH_SIZE = 200
+
+
+def parse_message_id(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def message_delta(messages, after, user_id=None):
+    # Ім'я відправника береться JOIN-ом в тому ж запиті, без запиту на кожне повідомлення
+    rows = list(
+        messages.order_by('id').values(
+            'id', 'sender_id', 'receiver_id', 'sender__username', 'text', 'timestamp'
+        )[:SYNC_BATCH_SIZE + 1]
+    )
+    has_more = len(rows) > SYNC_BATCH_SIZE
+    rows = rows[:SYNC_BATCH_SIZE]
 
     data = []
-    for msg in messages:
-        data.append({
-            'sender': msg.sender.username,
-            'text': msg.text,
-            'timestamp': msg.timestamp.isoformat()
-        })
-    return JsonResponse({'messages': data})
+    for row in rows:
+        item = {
+            'id': row['id'],
+            'sender': row['sender__username'],
+            'text': row['text'],
+            'timestamp': row['timestamp'].isoformat(),
+        }
+        if user_id is not None:
+            # Для загальної синхронізації - з ким розмова
+            item['friend_id'] = row['receiver_id'] if row['sender_id'] == user_id else row['sender_id']
+        data.append(item)
+
+    return {
+        'messages': data,
+        'last_id': rows[-1]['id'] if rows else after,
+        'has_more': has_more,
+    }
 
 
 @login_required
@@ -434,22 +668,124 @@ def edit_profile(request):
 
 
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from .serializers import *
+from .fast_serializers import FastGameSerializer, FastMessageSerializer
+from . import tasks
+from django.core.paginator import EmptyPage, PageNotAnInteger
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+EXPORT_CHUNK_SIZE = 500
+
+
+def requested_game_fields(request):
+    # ?fields=id,title,sell_price -> ['id', 'title', 'sell_price'], невідомі поля ігноруються
+    fields = request.GET.get('fields')
+    if not fields:
+        return None
+    allowed = GameSerializer.Meta.fields
+    return [f for f in fields.split(',') if f in allowed] or None
+
+
+def stream_games(games, serializer, export):
+    encoder = JSONEncoder(ensure_ascii=False)
+    rows = serializer.values(games).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    if export == 'ndjson':
+        for game in rows:
+            yield encoder.encode(serializer.to_representation(game)) + '\n'
+        return
+
+    yield '['
+    for i, game in enumerate(rows):
+        yield (',' if i else '') + encoder.encode(serializer.to_representation(game))
+    yield ']'
 
 @api_view(["GET"])
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified_for)
 def api_game_list(request):
-    games = Game.objects.all()
-    serializer = GameSerializer(games, many=True)
-    return Response(serializer.data)
+    fields = requested_game_fields(request)
+    games, sort_ordering = filter_catalog(Game.objects.all(), request.GET)
+    ordering = sort_ordering or ('title', 'id')
+    games = games.order_by(*ordering)
+    # .values() лише потрібних колонок, без description, якщо клієнт його не просив
+    serializer = FastGameSerializer(fields)
+
+    # ?export=ndjson|json - потокова вивантажка всього каталогу без збору в пам'яті
+    export = request.GET.get('export')
+    if export in ('ndjson', 'json'):
+        content_type = 'application/x-ndjson' if export == 'ndjson' else 'application/json'
+        return StreamingHttpResponse(
+            stream_games(games, serializer, export),
+            content_type=content_type
+        )
+
+    try:
+        page_size = min(int(request.GET.get('page_size', API_PAGE_SIZE)), API_MAX_PAGE_SIZE)
+    except ValueError:
+        page_size = API_PAGE_SIZE
+    page_size = max(page_size, 1)
+
+    # ?cursor= (порожній - перша сторінка) вмикає keyset-пагінацію
+    if 'cursor' in request.GET:
+        columns = [f.lstrip('-') for f in ordering]
+        paginator = CursorPaginator(serializer.values(games, extra=columns), page_size, ordering=ordering)
+        try:
+            page = paginator.page(request.GET['cursor'])
+        except InvalidCursor:
+            return Response({'detail': 'Invalid cursor'}, status=400)
+        return Response({
+            'results': [serializer.to_representation(row) for row in page],
+            'next': page.next_cursor,
+            'previous': page.previous_cursor,
+            'approximate_count': approximate_count(games, f"api_game_list:{catalog_filter_query(request.GET)}"),
+        })
+
+    if 'page' in request.GET:
+        paginator = Paginator(serializer.values(games), page_size)
+        try:
+            page = paginator.page(request.GET['page'])
+        except PageNotAnInteger:
+            return Response({'detail': 'Invalid page'}, status=400)
+        except EmptyPage:
+            return Response({'detail': 'Invalid page'}, status=404)
+        return Response({
+            'count': paginator.count,
+            'num_pages': paginator.num_pages,
+            'page': page.number,
+            'results': [serializer.to_representation(row) for row in page],
+        })
+
+    return Response(serializer.serialize(games))
 
 @api_view(["GET"])
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified_for)
+def api_game_facets(request):
+    # Ті самі параметри, що й у api_game_list / game_list (q, genre, year, ціни)
+    return Response(catalog_facets(request.GET))
+
+@api_view(["GET"])
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified_for)
 def api_game_detail(request, game_id):
     game = get_object_or_404(Game, id=game_id)
     serializer = GameSerializer(game)
     return Response(serializer.data)
 
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def api_cache_stats(request):
+    # Лічильники поточного процесу
+    return Response({'game_detail': game_detail_cache.stats()})
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def api_task_stats(request):
+    return Response(tasks.queue_stats())
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def api_profile(request):
@@ -461,11 +797,80 @@ def api_profile(request):
 @permission_classes([IsAuthenticated])
 def api_messages(request, user_id):
     friend = get_object_or_404(User, id=user_id)
+    serializer = FastMessageSerializer()
+
+    # Без ?before= і ?limit= - вся історія списком, як раніше (старі клієнти)
+    if 'before' not in request.GET and 'limit' not in request.GET:
+        return Response(serializer.serialize(conversation_messages(request.user, friend)))
+
+    try:
+        limit = min(max(int(request.GET.get('limit', CHAT_HISTORY_SIZE)), 1), API_MAX_PAGE_SIZE)
+    except ValueError:
+        limit = CHAT_HISTORY_SIZE
+
+    try:
+        rows, older_cursor = history_page(
+            serializer.values(conversation_messages(request.user, friend)),
+            request.GET.get('before'),
+            limit,
+        )
+    except InvalidCursor:
+        return Response({'detail': 'Invalid cursor'}, status=400)
+
+    return Response({
+        'results': [serializer.to_representation(row) for row in rows],
+        'older': older_cursor,
+    })
 
-    messages = Message.objects.filter(
-       sender__in=[request.user, friend],
-       receiver__in=[request.user, friend]
-   ).order_by('timestamp')
+from .favorites import MAX_BATCH, add_favorites, favorite_ids, most_wishlisted, remove_favorites, toggle_favorites
 
-    serializer = MessageSerializer(messages, many=True)
-    return Response(serializer.data)
+@api_view(["GET", "POST"])
+@permission_classes([IsAuthenticated])
+def api_favorites(request):
+    # POST {"game_ids": [...], "action": "toggle" | "add" | "remove"} - багато ігор за один запит
+    user_id = request.user.pk
+    if request.method == "POST":
+        game_ids = request.data.get('game_ids')
+        action = request.data.get('action', 'toggle')
+        if (not isinstance(game_ids, list) or len(game_ids) > MAX_BATCH
+                or not all(type(game_id) is int for game_id in game_ids)):
+            return Response({'detail': f'game_ids must be a list of at most {MAX_BATCH} integers'}, status=400)
+        if action == 'toggle':
+            added, removed = toggle_favorites(user_id, game_ids)
+        elif action == 'add':
+            added, removed = add_favorites(user_id, game_ids), set()
+        elif action == 'remove':
+            added, removed = set(), remove_favorites(user_id, game_ids)
+        else:
+            return Response({'detail': 'Unknown action'}, status=400)
+        return Response({
+            'added': sorted(added),
+            'removed': sorted(removed),
+            'game_ids': sorted(favorite_ids(user_id)),
+        })
+    return Response({'game_ids': sorted(favorite_ids(user_id))})
+
+@api_view(["GET"])
+def api_most_wishlisted(request):
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        limit = 10
+    return Response({'results': most_wishlisted(limit)})
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def api_owned_games(request):
+    return Response({'game_ids': sorted(request_owned_game_ids(request))})
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def api_unread(request):
+    counts = Conversation.objects.unread_counts(request.user)
+    return Response({
+        'total': sum(counts.values()),
+        'conversations': [
+            {'friend_id': friend_id, 'unread': unread}
+            for friend_id, unread in counts.items() if unread
+        ],
+    })
@@ -0,0 +1,102 @@
+"""
+WebSocket-канал чату (чистий ASGI, без channels): /ws/chat/<user_id>/.
+Клієнт лише отримує нові повідомлення розмови; надсилання - як і раніше, POST на chat_view.
+"""
+import asyncio
+import json
+import re
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.http.cookie import parse_cookie
+
+from .friends import are_friends
+from .realtime import conversation_channel, get_broker
+
+CHAT_PATH = re.compile(r"^/ws/chat/(?P<user_id>\d+)/$")
+
+# Коди закриття з діапазону 4000-4999 (для застосунків)
+CLOSE_NOT_FOUND = 4404
+CLOSE_FORBIDDEN = 4403
+
+
+def _header(scope, name):
+    for key, value in scope.get('headers', []):
+        if key == name:
+            return value.decode('latin1')
+    return None
+
+
+def _same_origin(scope):
+    # Захист від cross-site WebSocket hijacking: браузер завжди шле Origin
+    origin = _header(scope, b'origin')
+    if origin is None:
+        return True
+    return urlsplit(origin).netloc == _header(scope, b'host')
+
+
+class _SessionRequest:
+    def __init__(self, session):
+        self.session = session
+
+
+@sync_to_async
+def _authenticated_user_id(scope):
+    cookies = parse_cookie(_header(scope, b'cookie') or '')
+    session_key = cookies.get(settings.SESSION_COOKIE_NAME)
+    if not session_key:
+        return None
+    engine = import_module(settings.SESSION_ENGINE)
+    user = get_user(_SessionRequest(engine.SessionStore(session_key)))
+    return user.id if user.is_authenticated else None
+
+
+@sync_to_async
+def _are_friends(user_id, friend_id):
+    return are_friends(user_id, friend_id)
+
+
+async def chat_websocket(scope, receive, send):
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+
+    match = CHAT_PATH.match(scope['path'])
+    if match is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+
+    friend_id = int(match['user_id'])
+    user_id = await _authenticated_user_id(scope) if _same_origin(scope) else None
+    if user_id is None or not await _are_friends(user_id, friend_id):
+        await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+        return
+
+    await send({'type': 'websocket.accept'})
+
+    broker = get_broker()
+    channel = conversation_channel(user_id, friend_id)
+    subscription = await broker.subscribe(channel)
+    receive_task = asyncio.ensure_future(receive())
+    message_task = asyncio.ensure_future(subscription.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait(
+                {receive_task, message_task},
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if message_task in done:
+                await send({'type': 'websocket.send', 'text': json.dumps(message_task.result())})
+                message_task = asyncio.ensure_future(subscription.get())
+            if receive_task in done:
+                if receive_task.result()['type'] == 'websocket.disconnect':
+                    break
+                # Вхідні кадри від клієнта ігноруються
+                receive_task = asyncio.ensure_future(receive())
+    finally:
+        receive_task.cancel()
+        message_task.cancel()
+        await broker.unsubscribe(channel, subscription)